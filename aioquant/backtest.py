@@ -0,0 +1,832 @@
+# -*- coding:utf-8 -*-
+
+"""
+Event-driven backtesting.
+
+Replay recorded or CSV klines through the same interfaces a live strategy uses: strategies subscribe klines by
+`Market(...)` and trade by `SimBinance` (same callbacks and order methods as `Binance`), so that a strategy runs
+unchanged in a backtest.
+
+Klines are fed in timestamp order as fast as the CPU allows. The event loop runs on a virtual clock: `loop.time()`
+is the close time of the kline being delivered (seconds since the open time of the first kline, monotonic like a live
+event loop), and whenever nothing is ready to run, the clock jumps to the next timer instead of sleeping, so
+`LoopRunTask` (heartbeat), `SingleTask.call_later` and `asyncio.sleep` run in simulated time. Timers due before a
+kline and all callbacks they scheduled are finished before the kline delivered.
+
+Klines are delivered to every callback subscribed through `Market` in order, one by one: conflation is disabled, and
+a kline callback is awaited directly (no task created), the next kline is delivered after the callback returned and
+all tasks it created are done, so a backtest is deterministic.
+
+Config in `BACKTEST`:
+    source: Kline data, a `TickStore` root directory, or a Binance kline CSV file (a list of files is allowed), or
+        `{symbol: CSV file(s), ...}` for multiple symbols.
+    symbols: Symbols to be replayed, default is `[SYMBOL]` in config file.
+    interval: Kline interval, e.g. `1s` / `1m`, default is `1m`.
+    start: Start time, millisecond or date string `YYYY-MM-DD` (UTC), default is the first kline.
+    end: End time (exclusive), millisecond or date string `YYYY-MM-DD` (UTC), default is the last kline.
+    assets: Initial assets of simulated account, default is `{"USDT": 10000}`.
+    fee_rate: Trading fee rate, default is `0.001`.
+    slippage: Slippage of market orders, ratio of price, default is `0`.
+
+NOTE:
+    1. Kline fields are floats (integers for times and counts) instead of strings received from Binance.
+    2. Only `loop.time()` is virtual, wall clock functions (e.g. `tools.get_cur_timestamp_ms`) are not.
+    3. Orders are matched against klines: a market order (or a marketable limit order) is filled at the close price
+       of the latest kline, a resting limit order is filled at its price (or the open price if better) if a later
+       kline touches it. Orders are filled fully, there is no partial fill.
+"""
+
+import os
+import sys
+import copy
+import json
+import time
+import asyncio
+import datetime
+import selectors
+
+import numpy as np
+
+from aioquant import quant
+from aioquant.error import Error
+from aioquant.utils import logger
+from aioquant.market import Kline
+from aioquant.tasks import SingleTask
+from aioquant.heartbeat import heartbeat
+from aioquant.configure import config
+from aioquant.event import TopicRouter, LocalEnvelope
+from aioquant.pnl import PnlEngine
+from aioquant.risk import RiskGate
+from aioquant.tickstore import TickStore, SCHEMAS
+from aioquant.order import Order, ORDER_ACTION_BUY, ORDER_ACTION_SELL, ORDER_TYPE_LIMIT, ORDER_TYPE_MARKET, \
+    ORDER_STATUS_SUBMITTED, ORDER_STATUS_FILLED, ORDER_STATUS_CANCELED
+
+__all__ = ("Backtest", "BacktestEventLoop", "BacktestEventCenter", "SimBinance", "load_klines", "export_klines",
+           "dataset_info", "start", )
+
+
+KLINE_COLUMNS = tuple(name for name, _ in SCHEMAS["kline"])
+CHUNK_ROWS = 1000000  # Max klines loaded into memory at a time.
+DATASET_META = "klines.json"  # Meta file of a kline dataset exported by `export_klines`.
+QUOTE_ASSETS = ("USDT", "FDUSD", "USDC", "BUSD", "TUSD", "BTC", "ETH", "BNB")  # To split symbol into base and quote.
+
+
+class _VirtualSelector(selectors.DefaultSelector):
+    """Selector never blocks on timers, it polls I/O and moves the virtual clock forward to the next timer instead of
+    sleeping."""
+
+    loop = None
+
+    def select(self, timeout=None):
+        if timeout is None:  # Nothing scheduled, waiting for I/O.
+            return super(_VirtualSelector, self).select(None)
+        events = super(_VirtualSelector, self).select(0)
+        if not events and timeout > 0:
+            self.loop.advance(self.loop.time() + timeout)
+        return events
+
+
+class BacktestEventLoop(asyncio.SelectorEventLoop):
+    """Event loop on a virtual clock.
+
+    NOTE:
+        `next_due()` and `busy()` read the timer heap and ready queue of the base event loop.
+    """
+
+    def __init__(self):
+        """Initialize."""
+        selector = _VirtualSelector()
+        super(BacktestEventLoop, self).__init__(selector)
+        selector.loop = self
+        self._clock = 0
+
+    def time(self):
+        return self._clock
+
+    def advance(self, t):
+        """Move virtual clock forward to `t` (seconds), a clock never goes back."""
+        if t > self._clock:
+            self._clock = t
+
+    def next_due(self):
+        """When the earliest timer is due, or `None` if no timer."""
+        return self._scheduled[0].when() if self._scheduled else None
+
+    def busy(self):
+        """If any callback is ready to run."""
+        return bool(self._ready)
+
+
+class BacktestEventCenter:
+    """Event center of backtest, events are delivered in process.
+
+    Klines fed by backtest are delivered to subscribers' callbacks directly by `handlers()`, events published by
+    strategies are delivered through event callbacks, the same as `EventCenter` without RabbitMQ.
+    """
+
+    def __init__(self):
+        """Initialize."""
+        self._router = TopicRouter()  # Subscribed events, bound by exchange and routing key pattern.
+        self._exchanges = {}  # Simulated exchanges per symbol. e.g. `{symbol: [SimBinance, ...], ... }`
+        self._local_count = 0  # How many events published by strategies delivered.
+
+    @property
+    def stats(self):
+        return {"local_delivered": self._local_count}
+
+    async def subscribe(self, event, callback=None, multi=False):
+        """Subscribe a event, see `EventCenter.subscribe`."""
+        logger.info("NAME:", event.name, "EXCHANGE:", event.exchange, "ROUTING_KEY:", event.routing_key, caller=self)
+        if callback:
+            self._router.bind(event.exchange, event.routing_key, event)
+
+    async def publish(self, event):
+        self.publish_nowait(event)
+
+    def publish_nowait(self, event):
+        """Deliver a event published by strategy to subscribers, not conflated."""
+        envelope = LocalEnvelope(event.exchange, event.routing_key, None)
+        for subscriber in self._router.route(event.exchange, event.routing_key):
+            SingleTask.run(subscriber.callback, None, event, envelope, None)
+        self._local_count += 1
+
+    def handlers(self, exchange, routing_key):
+        """Get subscribers' callbacks of a routing key, called with parsed object, e.g. `Kline`."""
+        return [event.handler for event in self._router.route(exchange, routing_key)]
+
+    def register_exchange(self, exchange, symbol):
+        """Register a simulated exchange, klines of `symbol` are matched by it before delivered to strategies."""
+        self._exchanges.setdefault(symbol, []).append(exchange)
+
+    def exchanges(self, symbol=None):
+        if symbol is None:
+            return [e for exchanges in self._exchanges.values() for e in exchanges]
+        return self._exchanges.get(symbol, [])
+
+
+class SimBinance:
+    """Simulated Binance trade module, orders are matched against klines replayed, see `Binance` for attributes.
+
+    Attributes:
+        account: Account name.
+        strategy: Strategy name.
+        symbol: Symbol name, e.g. `BTCUSDT` / `BTC/USDT`.
+        order_update_callback: `async def on_order_update_callback(order: Order): pass`
+        position_update_callback: `async def on_position_update_callback(position: Position): pass`
+        init_callback: `async def on_init_callback(success: bool, **kwargs): pass`
+        error_callback: `async def on_error_callback(error: Error, **kwargs): pass`
+        assets: Initial assets, default is `assets` of backtest.
+        fee_rate: Trading fee rate, default is `fee_rate` of backtest.
+        slippage: Slippage of market orders, default is `slippage` of backtest.
+        risk: Limits of pre-trade risk gate, default is `risk` of backtest, see `aioquant.risk.RiskGate`, orders per
+            second are counted on the virtual clock.
+
+    NOTE:
+        Other arguments of `Binance` (e.g. access_key, interval) are accepted and ignored.
+    """
+
+    def __init__(self, **kwargs):
+        """Initialize."""
+        center = quant.event_center
+        if not isinstance(center, BacktestEventCenter):
+            raise RuntimeError("SimBinance should be created in a backtest")
+        settings = Backtest.current.settings if Backtest.current else {}
+        self._account = kwargs.get("account")
+        self._strategy = kwargs.get("strategy")
+        self._platform = kwargs.get("platform", "binance")
+        self._symbol = kwargs["symbol"]
+        self._raw_symbol = self._symbol.replace("/", "")
+        self._base, self._quote = split_symbol(self._symbol)
+        self._order_update_callback = kwargs.get("order_update_callback")
+        self._init_callback = kwargs.get("init_callback")
+        self._error_callback = kwargs.get("error_callback")
+        self._fee_rate = kwargs.get("fee_rate", settings.get("fee_rate", 0.001))
+        self._slippage = kwargs.get("slippage", settings.get("slippage", 0))
+        assets = kwargs.get("assets", settings.get("assets", {"USDT": 10000}))
+        self._assets = {asset: {"free": float(v), "locked": 0.0} for asset, v in assets.items()}
+        for asset in (self._base, self._quote):
+            self._assets.setdefault(asset, {"free": 0.0, "locked": 0.0})
+        self._initial_assets = {asset: v["free"] for asset, v in self._assets.items()}
+        self._orders = {}  # Open orders. e.g. `{order_id: order, ... }`
+        self._locked = {}  # Balance locked by open orders. e.g. `{order_id: amount, ... }`
+        self._bids = []  # Open buy limit orders.
+        self._asks = []  # Open sell limit orders.
+        self._last_price = None  # Close price of the latest kline.
+        self._last_time = None  # Close time of the latest kline, millisecond.
+        self._order_no = 0
+        self._pnl = PnlEngine(self._platform, self._account, self._strategy, kwargs.get("position_update_callback"))
+        self._risk = RiskGate(clock=asyncio.get_event_loop().time, **kwargs.get("risk", settings.get("risk", {})))
+        self._stats = {"orders": 0, "fills": 0, "canceled": 0, "volume": 0.0, "fee": 0.0}
+        center.register_exchange(self, self._raw_symbol)
+        if self._init_callback:
+            SingleTask.run(self._init_callback, True)
+
+    @property
+    def assets(self):
+        return {asset: {"free": v["free"], "locked": v["locked"], "total": v["free"] + v["locked"]}
+                for asset, v in self._assets.items()}
+
+    @property
+    def orders(self):
+        return self._orders
+
+    @property
+    def stats(self):
+        return dict(self._stats, rejected=sum(self._risk.rejected.values()))
+
+    @property
+    def pnl(self):
+        return self._pnl
+
+    @property
+    def risk(self):
+        return self._risk
+
+    def equity(self, price=None):
+        """Account value in quote asset, base asset is valued at `price` (default is the latest close price)."""
+        price = self._last_price if price is None else price
+        quote = self._assets[self._quote]
+        base = self._assets[self._base]
+        return quote["free"] + quote["locked"] + (base["free"] + base["locked"]) * (price or 0)
+
+    def initial_equity(self, price):
+        return self._initial_assets.get(self._quote, 0) + self._initial_assets.get(self._base, 0) * price
+
+    async def create_order(self, side, type, price, quantity, *args, **kwargs):
+        """Create an order.
+
+        Args:
+            side: Trade direction, `BUY` or `SELL`.
+            type: Order type, `LIMIT` or `MARKET`.
+            price: Order price, ignored for `MARKET` order.
+            quantity: Order quantity.
+
+        Returns:
+            order_id: Order id if created successfully, otherwise it's None.
+            error: Error information, otherwise it's None.
+        """
+        quantity = float(quantity)
+        if type == ORDER_TYPE_MARKET or price is None:
+            price = None
+        else:
+            price = float(price)
+        if self._last_price is None:
+            return self._reject(Error("no market price yet"))
+        if quantity <= 0 or (price is not None and price <= 0):
+            return self._reject(Error("invalid price or quantity, price: {} quantity: {}".format(price, quantity)))
+        if side == ORDER_ACTION_BUY:
+            lock_asset, lock_amount = self._quote, quantity * (price or self._last_price * (1 + self._slippage))
+        elif side == ORDER_ACTION_SELL:
+            lock_asset, lock_amount = self._base, quantity
+        else:
+            return self._reject(Error("invalid side: {}".format(side)))
+        balance = self._assets[lock_asset]
+        if balance["free"] < lock_amount * (1 - 1e-12):
+            return self._reject(Error("insufficient balance, {} free: {} required: {}".format(
+                lock_asset, balance["free"], lock_amount)))
+        order_id = str(self._order_no + 1)
+        client_order_id = kwargs.get("client_order_id", order_id)
+        error = self._risk.check(self._symbol, side, price, quantity, client_order_id)
+        if error:
+            return self._reject(error)
+        balance["free"] -= lock_amount
+        balance["locked"] += lock_amount
+
+        self._order_no += 1
+        self._stats["orders"] += 1
+        order = Order(self._platform, self._account, self._strategy, order_id, client_order_id,
+                      self._symbol, side, price or 0, quantity, status=ORDER_STATUS_SUBMITTED,
+                      order_type=ORDER_TYPE_LIMIT if price else ORDER_TYPE_MARKET, ctime=self._last_time,
+                      utime=self._last_time)
+        self._locked[order_id] = lock_amount
+        self._orders[order_id] = order
+        self._notify(order)
+        if price is None or (side == ORDER_ACTION_BUY and price >= self._last_price) or \
+                (side == ORDER_ACTION_SELL and price <= self._last_price):
+            slip = self._slippage if price is None else 0
+            fill = self._last_price * (1 + slip) if side == ORDER_ACTION_BUY else self._last_price * (1 - slip)
+            self._fill(order, fill)  # Taker.
+        else:
+            (self._bids if side == ORDER_ACTION_BUY else self._asks).append(order)
+        return order_id, None
+
+    async def revoke_order(self, *order_ids):
+        """Revoke (an) order(s), all open orders if no order id given, see `Binance.revoke_order`."""
+        if len(order_ids) == 0:
+            for order_id in list(self._orders):
+                self._cancel(order_id)
+            return True, None
+        if len(order_ids) == 1:
+            error = self._cancel(order_ids[0])
+            return order_ids[0], error
+        success, error = [], []
+        for order_id in order_ids:
+            e = self._cancel(order_id)
+            if e:
+                error.append((order_id, e))
+            else:
+                success.append(order_id)
+        return success, error
+
+    async def get_open_order_ids(self):
+        """Get open order id list."""
+        return list(self._orders), None
+
+    async def close(self):
+        pass
+
+    def match(self, kline):
+        """Match resting limit orders against a kline, then update the latest price. Called by backtest before the
+        kline delivered to strategies."""
+        if self._bids:
+            low = kline.low
+            for order in [o for o in self._bids if low <= o.price]:
+                self._bids.remove(order)
+                self._fill(order, min(order.price, kline.open), kline.close_time)
+        if self._asks:
+            high = kline.high
+            for order in [o for o in self._asks if high >= o.price]:
+                self._asks.remove(order)
+                self._fill(order, max(order.price, kline.open), kline.close_time)
+        self._last_price = kline.close
+        self._last_time = kline.close_time
+        self._risk.on_price(self._symbol, kline.close)
+        if self._pnl.get_position(self._symbol):
+            self._pnl.mark(self._symbol, kline.close, kline.close_time)
+
+    def _fill(self, order, price, timestamp=None):
+        quantity = order.quantity
+        value = price * quantity
+        fee = value * self._fee_rate
+        base, quote = self._assets[self._base], self._assets[self._quote]
+        locked = self._locked.pop(order.order_id)
+        if order.action == ORDER_ACTION_BUY:
+            quote["locked"] -= locked
+            quote["free"] += locked - value - fee
+            base["free"] += quantity
+        else:
+            base["locked"] -= locked
+            quote["free"] += value - fee
+        order.remain = 0
+        order.avg_price = price
+        order.fee = fee
+        order.status = ORDER_STATUS_FILLED
+        order.utime = timestamp or self._last_time
+        self._orders.pop(order.order_id, None)
+        self._stats["fills"] += 1
+        self._stats["volume"] += value
+        self._stats["fee"] += fee
+        self._notify(order)
+        position = self._pnl.on_fill(self._symbol, order.action, quantity, price, fee, self._quote, None, order.utime)
+        self._risk.on_position(self._symbol, position.quantity)
+
+    def _cancel(self, order_id):
+        order = self._orders.pop(order_id, None)
+        if not order:
+            return Error("order not found: {}".format(order_id))
+        book = self._bids if order.action == ORDER_ACTION_BUY else self._asks
+        if order in book:
+            book.remove(order)
+        balance = self._assets[self._quote if order.action == ORDER_ACTION_BUY else self._base]
+        locked = self._locked.pop(order_id)
+        balance["locked"] -= locked
+        balance["free"] += locked
+        order.status = ORDER_STATUS_CANCELED
+        order.utime = self._last_time
+        self._stats["canceled"] += 1
+        self._notify(order)
+        return None
+
+    def _reject(self, error):
+        if self._error_callback:
+            SingleTask.run(self._error_callback, error)
+        return None, error
+
+    def _notify(self, order):
+        self._risk.on_order(order)
+        if self._order_update_callback:
+            SingleTask.run(self._order_update_callback, copy.copy(order))
+
+
+def split_symbol(symbol):
+    """Split symbol into base and quote asset, e.g. `BTCUSDT` / `BTC/USDT` -> `("BTC", "USDT")`."""
+    if "/" in symbol:
+        base, quote = symbol.split("/", 1)
+        return base, quote
+    for quote in QUOTE_ASSETS:
+        if symbol.endswith(quote) and len(symbol) > len(quote):
+            return symbol[:-len(quote)], quote
+    return symbol, ""
+
+
+def _to_ms(t):
+    """Millisecond timestamp of `t`, a timestamp or a date string `YYYY-MM-DD` (UTC)."""
+    if t is None or isinstance(t, (int, float)):
+        return t
+    dt = datetime.datetime.strptime(t, "%Y-%m-%d").replace(tzinfo=datetime.timezone.utc)
+    return int(dt.timestamp() * 1000)
+
+
+def _load_csv(files):
+    """Load Binance kline CSV files, e.g. `BTCUSDT-1s-2023-01.csv` from `https://data.binance.vision`:
+    open time, open, high, low, close, volume, close time, quote volume, trades, taker buy volume, taker buy quote
+    volume, ignore."""
+    if isinstance(files, str):
+        files = [files]
+    pieces = []
+    for file in files:
+        with open(file) as f:
+            header = not f.readline()[:1].isdigit()
+        data = np.loadtxt(file, delimiter=",", skiprows=1 if header else 0, usecols=range(11), dtype=np.float64,
+                          ndmin=2)
+        pieces.append(data)
+    data = np.concatenate(pieces) if pieces else np.empty((0, 11))
+    times = data[:, 0].astype(np.int64)
+    close_times = data[:, 6].astype(np.int64)
+    if len(times) and times[0] > 10 ** 14:  # Microsecond timestamps.
+        times //= 1000
+        close_times //= 1000
+    zeros = np.zeros(len(data), dtype=np.int64)
+    return {
+        "start_time": times, "close_time": close_times, "open": data[:, 1], "high": data[:, 2], "low": data[:, 3],
+        "close": data[:, 4], "volume": data[:, 5], "quote_volume": data[:, 7], "taker_buy_volume": data[:, 9],
+        "taker_buy_quote_volume": data[:, 10], "trade_num": data[:, 8].astype(np.int64), "first_trade_id": zeros,
+        "last_trade_id": zeros
+    }
+
+
+def _merge(parts):
+    """Merge klines of symbols in close time order.
+
+    Args:
+        parts: Klines of every symbol. e.g. `[(symbol, {column: array, ... }), ...]`
+
+    Returns:
+        symbols: Symbol of every kline, an array of indexes into symbol list.
+        columns: Column arrays.
+    """
+    parts = [(i, columns) for i, (_, columns) in enumerate(parts) if len(columns["close_time"])]
+    if not parts:
+        return np.empty(0, dtype=np.int32), {name: np.empty(0) for name in KLINE_COLUMNS}
+    if len(parts) == 1:
+        i, columns = parts[0]
+        return np.full(len(columns["close_time"]), i, dtype=np.int32), columns
+    symbols = np.concatenate([np.full(len(columns["close_time"]), i, dtype=np.int32) for i, columns in parts])
+    columns = {name: np.concatenate([c[name] for _, c in parts]) for name in KLINE_COLUMNS}
+    order = np.argsort(columns["close_time"], kind="stable")
+    return symbols[order], {name: array[order] for name, array in columns.items()}
+
+
+def load_klines(source, symbols, interval="1m", start=None, end=None):
+    """Load klines in close time order, chunk by chunk.
+
+    Args:
+        source: `TickStore` root directory, or a dataset directory exported by `export_klines`, or Binance kline CSV
+            file(s), or `{symbol: CSV file(s), ...}`, or `{symbol: {column: array, ...}, ...}` loaded already.
+        symbols: Symbol list.
+        interval: Kline interval, e.g. `1m`.
+        start: Start time, millisecond or `YYYY-MM-DD`.
+        end: End time (exclusive), millisecond or `YYYY-MM-DD`.
+
+    Yields:
+        symbols: Symbol of every kline, an array of indexes into `symbols`.
+        columns: Column arrays, e.g. `{"close_time": array([...]), "close": array([...]), ...}`
+    """
+    start, end = _to_ms(start), _to_ms(end)
+
+    def in_range(columns):
+        times = columns["start_time"]
+        i = 0 if start is None else int(np.searchsorted(times, start, "left"))
+        j = len(times) if end is None else int(np.searchsorted(times, end, "left"))
+        return {name: array[i:j] for name, array in columns.items()}
+
+    if isinstance(source, str) and os.path.isfile(os.path.join(source, DATASET_META)):  # Memory mapped, no copy.
+        index, columns = _open_dataset(source, symbols)
+        columns["symbol"] = index
+        columns = in_range(columns)
+        index = columns.pop("symbol")
+        for i in range(0, len(index), CHUNK_ROWS):
+            yield index[i:i + CHUNK_ROWS], {name: array[i:i + CHUNK_ROWS] for name, array in columns.items()}
+        return
+
+    if isinstance(source, str) and not source.endswith(".csv"):  # Tick store, load day by day.
+        store = TickStore(source)
+        kind = "kline_" + interval
+        days = sorted(set(day for symbol in symbols for day in store.days(kind, symbol)))
+        for day in days:
+            day_start = _to_ms("{}-{}-{}".format(day[:4], day[4:6], day[6:]))
+            lo = day_start if start is None else max(start, day_start)
+            hi = day_start + 86400000 if end is None else min(end, day_start + 86400000)
+            if lo >= hi:
+                continue
+            parts = [(symbol, store.query(kind, symbol, lo, hi)) for symbol in symbols]
+            yield _merge(parts)
+        return
+
+    if not isinstance(source, dict):
+        source = {symbols[0]: source}
+    parts = []
+    for symbol in symbols:
+        data = source[symbol]
+        columns = data if isinstance(data, dict) else _load_csv(data)
+        parts.append((symbol, in_range(columns)))
+    index, columns = _merge(parts)
+    for i in range(0, len(index), CHUNK_ROWS):
+        yield index[i:i + CHUNK_ROWS], {name: array[i:i + CHUNK_ROWS] for name, array in columns.items()}
+
+
+def _describe_source(source):
+    """JSON description of kline source, file paths are absolute, arrays loaded already can't be described."""
+    if isinstance(source, str):
+        return os.path.abspath(source)
+    if isinstance(source, (list, tuple)):
+        return [_describe_source(item) for item in source]
+    if isinstance(source, dict):
+        return {str(key): _describe_source(value) for key, value in source.items()}
+    return None
+
+
+def dataset_info(source, symbols, interval="1m", start=None, end=None):
+    """What a dataset is exported from, saved into dataset meta file by `export_klines`, a dataset is reusable only if
+    it matches.
+
+    Args:
+        source: Kline data, see `load_klines`.
+        symbols: Symbol list.
+        interval: Kline interval, e.g. `1m`.
+        start: Start time, millisecond or `YYYY-MM-DD`.
+        end: End time (exclusive), millisecond or `YYYY-MM-DD`.
+
+    Returns:
+        info: e.g. `{"source": "/data", "symbols": ["BTCUSDT"], "interval": "1m", "start": 1672531200000, "end": None}`.
+    """
+    return {"source": _describe_source(source), "symbols": list(symbols), "interval": interval, "start": _to_ms(start),
+            "end": _to_ms(end)}
+
+
+def export_klines(source, symbols, path, interval="1m", start=None, end=None):
+    """Export klines into a dataset directory, klines of all symbols are merged in close time order and saved as raw
+    column files, so that backtests in many processes memory map one copy of data instead of loading it every time.
+
+    Args:
+        source: Kline data, see `load_klines`.
+        symbols: Symbol list.
+        path: Dataset directory.
+        interval: Kline interval, e.g. `1m`.
+        start: Start time, millisecond or `YYYY-MM-DD`.
+        end: End time (exclusive), millisecond or `YYYY-MM-DD`.
+
+    Returns:
+        rows: How many klines exported.
+    """
+    os.makedirs(path, exist_ok=True)
+    if os.path.isfile(os.path.join(path, DATASET_META)):  # Not a valid dataset until exported completely.
+        os.remove(os.path.join(path, DATASET_META))
+    dtypes = dict(SCHEMAS["kline"], symbol="<i4")
+    files = {name: open(os.path.join(path, name + ".bin"), "wb") for name in dtypes}
+    rows = 0
+    try:
+        for index, columns in load_klines(source, symbols, interval, start, end):
+            columns = dict(columns, symbol=index)
+            for name, f in files.items():
+                f.write(np.ascontiguousarray(columns[name], dtype=dtypes[name]).tobytes())
+            rows += len(index)
+    finally:
+        for f in files.values():
+            f.close()
+    meta = dict(dataset_info(source, symbols, interval, start, end), rows=rows, dtypes=dtypes)
+    with open(os.path.join(path, DATASET_META + ".tmp"), "w") as f:
+        json.dump(meta, f)
+    os.replace(os.path.join(path, DATASET_META + ".tmp"), os.path.join(path, DATASET_META))
+    return rows
+
+
+def _open_dataset(path, symbols):
+    """Memory map a dataset exported by `export_klines`, read only."""
+    with open(os.path.join(path, DATASET_META)) as f:
+        meta = json.load(f)
+    if meta["symbols"] != symbols:
+        raise ValueError("dataset symbols {} not match {}".format(meta["symbols"], symbols))
+    columns = {}
+    for name, dtype in meta["dtypes"].items():
+        if meta["rows"]:
+            columns[name] = np.memmap(os.path.join(path, name + ".bin"), dtype=dtype, mode="r", shape=meta["rows"])
+        else:
+            columns[name] = np.empty(0, dtype=dtype)
+    return columns.pop("symbol"), columns
+
+
+class Backtest:
+    """Backtest runner.
+
+    Attributes:
+        source: Kline data, see `load_klines`.
+        symbols: Symbols to be replayed, e.g. `["BTCUSDT"]`.
+        interval: Kline interval, e.g. `1s`.
+        start: Start time, millisecond or `YYYY-MM-DD`, default is the first kline.
+        end: End time (exclusive), millisecond or `YYYY-MM-DD`, default is the last kline.
+        assets: Initial assets of `SimBinance`, default is `{"USDT": 10000}`.
+        fee_rate: Trading fee rate of `SimBinance`, default is `0.001`.
+        slippage: Slippage of market orders of `SimBinance`, default is `0`.
+        risk: Limits of pre-trade risk gate of `SimBinance`, see `aioquant.risk.RiskGate`, default is no limit.
+    """
+
+    current = None  # Backtest running.
+
+    def __init__(self, source, symbols, interval="1m", start=None, end=None, assets=None, fee_rate=0.001,
+                 slippage=0, risk=None):
+        """Initialize."""
+        self._source = source
+        self._symbols = [s.replace("/", "") for s in symbols]
+        self._interval = interval
+        self._start = start
+        self._end = end
+        self.settings = {"assets": assets or {"USDT": 10000}, "fee_rate": fee_rate, "slippage": slippage,
+                         "risk": risk or {}}
+        self._loop = None
+        self._center = None
+        self._origin = 0  # Open time of the first kline, millisecond, virtual clock is 0 at this time.
+        self._bars = 0
+        self._errors = 0
+        self._first_time = None
+        self._last_time = None
+        self._last_prices = {}
+
+    def run(self, entrance_func=None):
+        """Run backtest.
+
+        Args:
+            entrance_func: A function to create strategies, e.g. `lambda: PriceWatcher()`, a coroutine function is
+                allowed.
+
+        Returns:
+            report: Backtest report, see `report()`.
+        """
+        chunks = load_klines(self._source, self._symbols, self._interval, self._start, self._end)
+        first = next(chunks, None)
+        self._origin = int(first[1]["start_time"][0]) if first and len(first[0]) else 0
+
+        self._loop = BacktestEventLoop()
+        asyncio.set_event_loop(self._loop)
+        self._center = BacktestEventCenter()
+        quant.loop = self._loop
+        quant.event_center = self._center
+        heartbeat.reset()
+        Backtest.current = self
+
+        elapsed = 0
+        try:
+            if entrance_func:
+                if asyncio.iscoroutinefunction(entrance_func):
+                    self._loop.run_until_complete(entrance_func())
+                else:
+                    entrance_func()
+            heartbeat.ticker()
+            begin = time.perf_counter()
+            if first:
+                self._loop.run_until_complete(self._feed(first, chunks))
+            elapsed = time.perf_counter() - begin
+            return self.report(elapsed)
+        finally:
+            self._shutdown()
+            Backtest.current = None
+
+    async def _feed(self, first, chunks):
+        loop = self._loop
+        center = self._center
+        await self._drain()
+        routes = [(center.handlers("Kline", "Binance." + symbol), center.exchanges(symbol))
+                  for symbol in self._symbols]
+        symbols = self._symbols
+        interval = self._interval
+        origin = self._origin
+        chunk = first
+        while chunk is not None:
+            index, columns = chunk
+            rows = zip(index.tolist(), *(columns[name].tolist() for name in KLINE_COLUMNS))
+            for i, st, ct, o, h, l, c, v, qv, tbv, tbqv, n, f, last_id in rows:
+                t = (ct - origin) / 1000
+                if t > loop._clock:
+                    due = loop.next_due()
+                    if due is not None and due <= t:
+                        await self._advance(t)
+                    else:
+                        loop._clock = t
+                kline = Kline(symbols[i])
+                kline.start_time = st
+                kline.close_time = ct
+                kline.interval = interval
+                kline.first_trade_id = f
+                kline.last_trade_id = last_id
+                kline.open = o
+                kline.high = h
+                kline.low = l
+                kline.close = c
+                kline.base_asset_volume = v
+                kline.trade_num = n
+                kline.is_closed = True
+                kline.quote_asset_volume = qv
+                kline.taker_buy_base_asset_volume = tbv
+                kline.taker_buy_quote_asset_volume = tbqv
+                handlers, exchanges = routes[i]
+                for exchange in exchanges:
+                    exchange.match(kline)
+                for handler in handlers:
+                    try:
+                        await handler(kline)
+                    except Exception as e:
+                        self._errors += 1
+                        logger.exception("kline callback error:", e, caller=self)
+                if loop._ready:
+                    await self._drain()
+            n = len(index)
+            if n:
+                self._bars += n
+                if self._first_time is None:
+                    self._first_time = int(columns["start_time"][0])
+                self._last_time = int(columns["close_time"][-1])
+                for i, symbol in enumerate(symbols):
+                    closes = columns["close"][index == i]
+                    if len(closes):
+                        self._last_prices[symbol] = float(closes[-1])
+            chunk = next(chunks, None)
+        await self._drain()
+
+    async def _advance(self, t):
+        """Move virtual clock to `t`, timers due before `t` are run at their due time."""
+        loop = self._loop
+        while True:
+            due = loop.next_due()
+            if due is None or due > t:
+                break
+            loop.advance(due)
+            await asyncio.sleep(0)
+            await self._drain()
+        loop.advance(t)
+
+    async def _drain(self):
+        """Run until no callback ready."""
+        while self._loop.busy():
+            await asyncio.sleep(0)
+
+    def report(self, elapsed):
+        """Backtest report.
+
+        Returns:
+            report: e.g. `{"bars": 100, "elapsed": 0.1, "bars_per_sec": 1000, "exchanges": [...], ...}`
+        """
+        exchanges = []
+        for exchange in self._center.exchanges():
+            price = self._last_prices.get(exchange._raw_symbol)
+            initial = exchange.initial_equity(price or 0)
+            equity = exchange.equity(price)
+            exchanges.append(dict(exchange.stats, symbol=exchange._raw_symbol, assets=exchange.assets,
+                                  initial_equity=initial, equity=equity, pnl=equity - initial,
+                                  ret=(equity - initial) / initial if initial else 0))
+        d = {
+            "bars": self._bars,
+            "elapsed": elapsed,
+            "bars_per_sec": self._bars / elapsed if elapsed else 0,
+            "start_time": self._first_time,
+            "end_time": self._last_time,
+            "errors": self._errors,
+            "heartbeat_count": heartbeat.count,
+            "exchanges": exchanges
+        }
+        return d
+
+    def _shutdown(self):
+        loop = self._loop
+        tasks = [t for t in asyncio.all_tasks(loop) if not t.done()]
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+        heartbeat.reset()
+        loop.close()
+
+
+def start(config_file=None, key_file=None, entrance_func=None, **kwargs):
+    """Run a backtest configured by `BACKTEST` in config file, and print report.
+
+    Args:
+        config_file: Config file path.
+        key_file: Key file path, optional.
+        entrance_func: A function to create strategies.
+        kwargs: Override settings in `BACKTEST`, e.g. `source="./data"`.
+
+    Returns:
+        report: Backtest report.
+    """
+    if config_file:
+        config.loads(config_file, key_file)
+    settings = dict(config.backtest or {}, **kwargs)
+    if config.log:
+        logger.initLogger(**config.log)
+    symbols = settings.get("symbols") or [config.symbol]
+    backtest = Backtest(settings["source"], symbols, settings.get("interval", "1m"), settings.get("start"),
+                        settings.get("end"), settings.get("assets"), settings.get("fee_rate", 0.001),
+                        settings.get("slippage", 0), settings.get("risk") or config.risk)
+    report = backtest.run(entrance_func)
+    print(json.dumps(report, indent=4), file=sys.stderr)
+    return report
@@ -9,18 +9,27 @@ Date:   2018/08/09
 Email:  huangtao@ifclover.com
 """
 
-import json
-import copy
 import hmac
+import json
+import asyncio
 import hashlib
-from urllib.parse import urljoin
+from collections import deque, OrderedDict
+from urllib.parse import urljoin, urlencode
 
 from aioquant.error import Error
 from aioquant.utils import tools
 from aioquant.utils import logger
+from aioquant.utils import trace
+from aioquant.utils import clock
+from aioquant.utils.metrics import registry
 from aioquant.order import Order
+from aioquant.pnl import PnlEngine
+from aioquant.risk import RiskGate
+from aioquant.configure import config
+from aioquant.orderstore import OrderStore
 from aioquant.tasks import SingleTask, LoopRunTask
-from aioquant.utils.decorator import async_method_locker
+from aioquant.utils.web import AsyncHttpRequests, Websocket
+from aioquant.orderbook import LocalOrderbook, DIFF_APPLIED, DIFF_GAP
 from aioquant.order import ORDER_ACTION_SELL, ORDER_ACTION_BUY, ORDER_TYPE_LIMIT, ORDER_TYPE_MARKET
 from aioquant.order import ORDER_STATUS_SUBMITTED, ORDER_STATUS_PARTIAL_FILLED, ORDER_STATUS_FILLED, \
     ORDER_STATUS_CANCELED, ORDER_STATUS_FAILED
@@ -28,8 +37,499 @@ from aioquant.order import ORDER_STATUS_SUBMITTED, ORDER_STATUS_PARTIAL_FILLED,
 from aioquant.event import *
 from aioquant.market import *
 
-from binance.websocket.spot.websocket_stream import SpotWebsocketStreamClient
-from binance.spot import Spot
+
+class BinanceRestAPI:
+    """Binance REST API client, built on `AsyncHttpRequests`.
+
+    Attributes:
+        access_key: Account's ACCESS KEY.
+        secret_key: Account's SECRET KEY.
+        host: HTTP request host, default is `https://api.binance.com`.
+        weight_limit: Request weight limit per minute, default is `1200`.
+        recv_window: `recvWindow` of signed requests, millisecond, default is `None` (5000 by Binance).
+        exchange_clock: Clock for `timestamp` of signed requests, default is `aioquant.utils.clock.clock`.
+
+    NOTE:
+        Request weight is consumed from a token bucket refilled at `weight_limit` per minute, a request will wait
+        until there is enough weight, so that we throttle ourselves before Binance does. The bucket is corrected by
+        `X-MBX-USED-WEIGHT-1M` header of every response.
+
+        Signed requests copy an HMAC object keyed once, instead of keying a new one per request. Order requests are
+        built from templates: the URL and the fixed part of query string (e.g. `symbol=BTCUSDT&side=BUY&type=LIMIT&`)
+        are cached together with an HMAC state that has hashed the fixed part already, so that only the variable tail
+        (quantity, price, client order id, timestamp) is formatted and hashed per order.
+
+        `timestamp` of signed requests is exchange time estimated by the exchange clock, which is synced with
+        `GET /api/v3/time` by `sync_clock`, so that requests are not rejected by `recvWindow` because of local clock
+        offset.
+    """
+
+    def __init__(self, access_key, secret_key, host="https://api.binance.com", weight_limit=1200, recv_window=None,
+                 exchange_clock=None):
+        """Initialize."""
+        self._host = host
+        self._access_key = access_key
+        self._secret_key = secret_key
+        self._weight_limit = weight_limit
+        self._weight_rate = weight_limit / 60  # Weight refilled per second.
+        self._weight_tokens = weight_limit  # Weight available right now.
+        self._weight_time = None  # Last time weight tokens refilled, loop time.
+        self._used_weight = 0  # Used weight in current minute, reported by Binance.
+        self._signer = hmac.new(secret_key.encode(), digestmod=hashlib.sha256) if secret_key else None
+        self._templates = {}  # Signed request templates. e.g. `{(uri, prefix): (url with prefix, signer), ... }`
+        self._recv_window = recv_window
+        self._clock = exchange_clock or clock.clock
+
+    @property
+    def used_weight(self):
+        return self._used_weight
+
+    async def ping(self):
+        """Test connectivity."""
+        success, error = await self.request("GET", "/api/v3/ping")
+        return success, error
+
+    async def get_server_time(self):
+        """Get server time."""
+        success, error = await self.request("GET", "/api/v3/time")
+        return success, error
+
+    def sync_clock(self, interval=60):
+        """Sync exchange clock with server time now and every `interval` seconds."""
+        self._clock.start(self._fetch_server_time, interval)
+
+    async def _fetch_server_time(self):
+        success, error = await self.get_server_time()
+        if error:
+            return None, error
+        return success["serverTime"], None
+
+    async def get_exchange_info(self, symbol=None, symbols=None):
+        """Get exchange information, trading rules and symbol information.
+
+        Args:
+            symbol: Symbol name, e.g. `BTCUSDT`, default is all symbols.
+            symbols: Symbol names, e.g. `["BTCUSDT", "ETHUSDT"]`.
+        """
+        if symbols and len(symbols) == 1:
+            symbol, symbols = symbols[0], None
+        params = None
+        if symbol:
+            params = {"symbol": symbol}
+        elif symbols:
+            params = {"symbols": json.dumps(symbols, separators=(",", ":"))}
+        success, error = await self.request("GET", "/api/v3/exchangeInfo", params=params, weight=20)
+        return success, error
+
+    async def get_orderbook(self, symbol, limit=100):
+        """Get orderbook snapshot.
+
+        Args:
+            symbol: Symbol name, e.g. `BTCUSDT`.
+            limit: Number of results per request, valid limits: [5, 10, 20, 50, 100, 500, 1000, 5000].
+        """
+        weight = 1 if limit <= 100 else 5 if limit <= 500 else 10 if limit <= 1000 else 50
+        params = {"symbol": symbol, "limit": limit}
+        success, error = await self.request("GET", "/api/v3/depth", params=params, weight=weight)
+        return success, error
+
+    async def get_user_account(self):
+        """Get user account information."""
+        success, error = await self.request("GET", "/api/v3/account", auth=True, weight=20)
+        return success, error
+
+    async def create_listen_key(self):
+        """Create a listen key for user data stream."""
+        success, error = await self.request("POST", "/api/v3/userDataStream", weight=2)
+        return success, error
+
+    async def keep_alive_listen_key(self, listen_key):
+        """Keep alive a listen key, it will be expired after 60 minutes without keep-alive."""
+        params = {"listenKey": listen_key}
+        success, error = await self.request("PUT", "/api/v3/userDataStream", params=params, weight=2)
+        return success, error
+
+    async def get_my_trades(self, symbol, from_id=None, limit=1000):
+        """Get trades of account.
+
+        Args:
+            symbol: Symbol name, e.g. `BTCUSDT`.
+            from_id: Trade id to fetch from, default is the latest trades.
+            limit: Number of results per request, max is `1000`.
+        """
+        params = {"symbol": symbol, "limit": limit}
+        if from_id is not None:
+            params["fromId"] = from_id
+        success, error = await self.request("GET", "/api/v3/myTrades", params=params, auth=True, weight=20)
+        return success, error
+
+    async def get_open_orders(self, symbol=None):
+        """Get all open order information.
+
+        Args:
+            symbol: Symbol name, e.g. `BTCUSDT`, default is all symbols.
+        """
+        params = {"symbol": symbol} if symbol else None
+        weight = 6 if symbol else 80
+        success, error = await self.request("GET", "/api/v3/openOrders", params=params, auth=True, weight=weight)
+        return success, error
+
+    async def create_order(self, symbol, side, order_type, quantity, price=None, client_order_id=None,
+                           time_in_force="GTC", resp_type="ACK"):
+        """Create an order.
+
+        Args:
+            symbol: Symbol name, e.g. `BTCUSDT`.
+            side: Trade side, `BUY` / `SELL`.
+            order_type: Order type, `LIMIT` / `MARKET` / `LIMIT_MAKER`.
+            quantity: Order quantity.
+            price: Order price, `None` for `MARKET` order.
+            client_order_id: Client order id, default is generated by Binance.
+            time_in_force: Time in force of `LIMIT` order, default is `GTC`.
+            resp_type: Response type, `ACK` / `RESULT` / `FULL`, default is `ACK`, the fastest.
+        """
+        prefix = "symbol={}&side={}&type={}&newOrderRespType={}&".format(symbol, side, order_type, resp_type)
+        if order_type == "LIMIT":
+            prefix += "timeInForce={}&".format(time_in_force)
+        tail = "quantity={}&".format(_format_number(quantity))
+        if price is not None:
+            tail += "price={}&".format(_format_number(price))
+        if client_order_id:
+            tail += "newClientOrderId={}&".format(client_order_id)
+        success, error = await self.signed_request("POST", "/api/v3/order", prefix, tail)
+        return success, error
+
+    async def cancel_order(self, symbol, order_id=None, client_order_id=None):
+        """Cancel an order by order id or client order id.
+
+        Args:
+            symbol: Symbol name, e.g. `BTCUSDT`.
+            order_id: Order id.
+            client_order_id: Client order id, used if order id not given.
+        """
+        if order_id is not None:
+            tail = "orderId={}&".format(order_id)
+        else:
+            tail = "origClientOrderId={}&".format(client_order_id)
+        success, error = await self.signed_request("DELETE", "/api/v3/order", "symbol={}&".format(symbol), tail)
+        return success, error
+
+    async def cancel_open_orders(self, symbol):
+        """Cancel all open orders of a symbol by one request.
+
+        Args:
+            symbol: Symbol name, e.g. `BTCUSDT`.
+        """
+        success, error = await self.signed_request("DELETE", "/api/v3/openOrders", "symbol={}&".format(symbol))
+        return success, error
+
+    async def cancel_replace_order(self, symbol, side, order_type, quantity, price=None, cancel_order_id=None,
+                                   client_order_id=None, mode="STOP_ON_FAILURE", time_in_force="GTC"):
+        """Cancel an order and create a new one by one request.
+
+        Args:
+            symbol: Symbol name, e.g. `BTCUSDT`.
+            side: Trade side of the new order, `BUY` / `SELL`.
+            order_type: Order type of the new order, `LIMIT` / `MARKET` / `LIMIT_MAKER`.
+            quantity: Quantity of the new order.
+            price: Price of the new order, `None` for `MARKET` order.
+            cancel_order_id: Order id to be canceled.
+            client_order_id: Client order id of the new order, default is generated by Binance.
+            mode: `STOP_ON_FAILURE` (not create the new order if cancel failed) or `ALLOW_FAILURE`.
+            time_in_force: Time in force of `LIMIT` order, default is `GTC`.
+        """
+        prefix = "symbol={}&side={}&type={}&cancelReplaceMode={}&newOrderRespType=ACK&".format(
+            symbol, side, order_type, mode)
+        if order_type == "LIMIT":
+            prefix += "timeInForce={}&".format(time_in_force)
+        tail = "cancelOrderId={}&quantity={}&".format(cancel_order_id, _format_number(quantity))
+        if price is not None:
+            tail += "price={}&".format(_format_number(price))
+        if client_order_id:
+            tail += "newClientOrderId={}&".format(client_order_id)
+        success, error = await self.signed_request("POST", "/api/v3/order/cancelReplace", prefix, tail)
+        return success, error
+
+    async def signed_request(self, method, uri, prefix, tail="", weight=1):
+        """Do a signed request built from a template.
+
+        Args:
+            method: HTTP request method. `GET` / `POST` / `DELETE` / `PUT`.
+            uri: HTTP request uri.
+            prefix: Fixed part of query string, ends with `&`, e.g. `symbol=BTCUSDT&`, the URL and HMAC state of it
+                are cached.
+            tail: Variable part of query string, ends with `&`, e.g. `orderId=123&`.
+            weight: Request weight.
+
+        Returns:
+            success: Success results, otherwise it's None.
+            error: Error information, otherwise it's None.
+        """
+        await self._acquire_weight(weight)
+        key = (uri, prefix)
+        template = self._templates.get(key)
+        if template is None:
+            if self._recv_window:
+                prefix += "recvWindow={}&".format(self._recv_window)
+            signer = self._signer.copy()
+            signer.update(prefix.encode())
+            template = self._templates[key] = (urljoin(self._host, uri) + "?" + prefix, signer)
+        url, signer = template
+        tail += "timestamp={}".format(self._clock.now_exchange_ms())
+        signer = signer.copy()
+        signer.update(tail.encode())
+        url = "{url}{tail}&signature={signature}".format(url=url, tail=tail, signature=signer.hexdigest())
+        _, success, error = await AsyncHttpRequests.fetch(method, url, headers={"X-MBX-APIKEY": self._access_key},
+                                                          timeout=10, headers_callback=self._on_response_headers)
+        if error:
+            return None, Error(error)
+        return success, None
+
+    async def request(self, method, uri, params=None, body=None, headers=None, auth=False, weight=1):
+        """Do HTTP request.
+
+        Args:
+            method: HTTP request method. `GET` / `POST` / `DELETE` / `PUT`.
+            uri: HTTP request uri.
+            params: HTTP query params.
+            body: HTTP request body.
+            headers: HTTP request headers.
+            auth: If this request requires authentication.
+            weight: Request weight.
+
+        Returns:
+            success: Success results, otherwise it's None.
+            error: Error information, otherwise it's None.
+        """
+        await self._acquire_weight(weight)
+        url = urljoin(self._host, uri)
+        if auth:
+            params = dict(params) if params else {}
+            if self._recv_window:
+                params["recvWindow"] = self._recv_window
+            params["timestamp"] = self._clock.now_exchange_ms()
+            query = urlencode(params)
+            signer = self._signer.copy()
+            signer.update(query.encode())
+            url = "{url}?{query}&signature={signature}".format(url=url, query=query, signature=signer.hexdigest())
+            params = None
+        if self._access_key:
+            headers = dict(headers) if headers else {}
+            headers["X-MBX-APIKEY"] = self._access_key
+        _, success, error = await AsyncHttpRequests.fetch(method, url, params=params, body=body, headers=headers,
+                                                          timeout=10, headers_callback=self._on_response_headers)
+        if error:
+            return None, Error(error)
+        return success, None
+
+    async def _acquire_weight(self, weight):
+        """Wait until there is enough request weight in token bucket."""
+        loop = asyncio.get_event_loop()
+        while True:
+            now = loop.time()
+            if self._weight_time is not None:
+                self._weight_tokens = min(self._weight_limit,
+                                          self._weight_tokens + (now - self._weight_time) * self._weight_rate)
+            self._weight_time = now
+            if self._weight_tokens >= weight:
+                self._weight_tokens -= weight
+                return
+            delay = (weight - self._weight_tokens) / self._weight_rate
+            logger.warn("request weight exhausted, waiting", delay, "seconds.", caller=self)
+            await asyncio.sleep(delay)
+
+    def _on_response_headers(self, headers):
+        used = headers.get("X-MBX-USED-WEIGHT-1M") or headers.get("X-MBX-USED-WEIGHT")
+        if used is None:
+            return
+        self._used_weight = int(used)
+        self._weight_tokens = min(self._weight_tokens, self._weight_limit - self._used_weight)
+
+
+def _format_number(value):
+    """Format price or quantity in query string, without scientific notation."""
+    return value if isinstance(value, str) else tools.float_to_str(value)
+
+
+def _error_code(error):
+    """Binance error code of a request error, e.g. `-2011` of `{"code": -2011, "msg": "Unknown order sent."}`, or
+    `None` if it's not a Binance error response."""
+    try:
+        return int(json.loads(str(error))["code"])
+    except (ValueError, TypeError, KeyError):
+        return None
+
+
+class BinanceStream:
+    """Binance combined stream, many streams multiplexed on one Websocket connection, in the event loop.
+    https://github.com/binance/binance-spot-api-docs/blob/master/web-socket-streams.md
+
+    Attributes:
+        wss: Websocket address, e.g. `wss://stream.binance.com:9443`.
+        process_callback: A normal function will be called directly with stream data, e.g.
+            `def process_callback(data): pass`
+        connected_callback: Asynchronous callback function will be called after connected and subscribed.
+        streams: Stream names to subscribe, e.g. `["btcusdt@kline_1s", "btcusdt@depth@100ms"]`.
+
+    NOTE:
+        All streams will be re-subscribed after the connection re-connected, streams subscribed or unsubscribed while
+        disconnected are only changed locally and take effect by re-subscribing. Websocket ping frame is sent every
+        `heartbeat` seconds, and Binance server's ping is responded automatically.
+    """
+
+    heartbeat = 30
+
+    def __init__(self, wss, process_callback, connected_callback=None, streams=None):
+        """Initialize."""
+        self._process_callback = process_callback
+        self._connected_callback = connected_callback
+        self._streams = []  # Subscribed streams, in order of subscribing.
+        self._request_id = 0  # Request id of SUBSCRIBE / UNSUBSCRIBE.
+        self._connected = False
+        for stream in streams or []:
+            if stream not in self._streams:
+                self._streams.append(stream)
+        url = "{wss}/stream".format(wss=wss.rstrip("/"))
+        self._ws = Websocket(url, connected_callback=self._on_connected, process_callback=self._on_message,
+                             heartbeat=self.heartbeat, disconnected_callback=self._on_disconnected)
+
+    @property
+    def streams(self):
+        return list(self._streams)
+
+    async def subscribe(self, *streams):
+        """Subscribe streams."""
+        streams = [stream for stream in streams if stream not in self._streams]
+        if not streams:
+            return
+        self._streams.extend(streams)
+        if self._connected:
+            await self._send("SUBSCRIBE", streams)
+
+    async def unsubscribe(self, *streams):
+        """Unsubscribe streams."""
+        streams = [stream for stream in streams if stream in self._streams]
+        if not streams:
+            return
+        for stream in streams:
+            self._streams.remove(stream)
+        if self._connected:
+            await self._send("UNSUBSCRIBE", streams)
+
+    async def close(self):
+        self._connected = False
+        await self._ws.close()
+
+    async def _send(self, method, streams):
+        self._request_id += 1
+        try:
+            await self._ws.send({"method": method, "params": streams, "id": self._request_id})
+        except Exception as e:
+            # Connection closed meanwhile, streams will be re-subscribed after re-connected.
+            logger.warn("send", method, "error:", e, caller=self)
+
+    async def _on_connected(self):
+        self._connected = True
+        if self._streams:
+            await self._send("SUBSCRIBE", list(self._streams))
+        if self._connected_callback:
+            await self._connected_callback()
+
+    def _on_disconnected(self):
+        self._connected = False
+
+    def _on_message(self, msg):
+        data = msg.get("data") if isinstance(msg, dict) else None
+        if data is not None:
+            self._process_callback(data)
+        elif isinstance(msg, dict) and msg.get("error"):
+            logger.error("stream request error:", msg, caller=self)
+
+
+class BinanceStreamPool:
+    """Streams sharded across a few combined stream connections, so that a connection never exceeds the streams
+    limit of Binance, a new connection is created only if all connections are full.
+
+    Attributes:
+        wss: Websocket address, e.g. `wss://stream.binance.com:9443`.
+        process_callback: A normal function will be called directly with stream data of all connections.
+        connected_callback: Asynchronous callback function will be called after the first connection connected and
+            subscribed, the first stream subscribed (e.g. user data stream) is always on the first connection.
+        max_streams: Max streams per connection, default is `1024` (limit of Binance).
+    """
+
+    def __init__(self, wss, process_callback, connected_callback=None, max_streams=1024):
+        """Initialize."""
+        self._wss = wss
+        self._process_callback = process_callback
+        self._connected_callback = connected_callback
+        self._max_streams = max_streams
+        self._shards = []  # Connections, in order of creating.
+        self._owners = {}  # Connection of every stream. e.g. `{stream: BinanceStream, ... }`
+        self._counts = {}  # Streams of every connection. e.g. `{BinanceStream: 100, ... }`
+
+    @property
+    def streams(self):
+        return list(self._owners)
+
+    @property
+    def connections(self):
+        return len(self._shards)
+
+    async def subscribe(self, *streams):
+        """Subscribe streams, streams of a connection are subscribed by one request."""
+        groups = {}
+        for stream in streams:
+            if stream in self._owners:
+                continue
+            shard = self._free_shard()
+            self._owners[stream] = shard
+            self._counts[shard] += 1
+            groups.setdefault(shard, []).append(stream)
+        for shard, group in groups.items():
+            await shard.subscribe(*group)
+
+    async def unsubscribe(self, *streams):
+        """Unsubscribe streams, a connection without any stream is kept and reused by streams subscribed later."""
+        groups = {}
+        for stream in streams:
+            shard = self._owners.pop(stream, None)
+            if shard:
+                self._counts[shard] -= 1
+                groups.setdefault(shard, []).append(stream)
+        for shard, group in groups.items():
+            await shard.unsubscribe(*group)
+
+    async def close(self):
+        for shard in self._shards:
+            await shard.close()
+
+    def _free_shard(self):
+        for shard in self._shards:
+            if self._counts[shard] < self._max_streams:
+                return shard
+        connected_callback = None if self._shards else self._connected_callback
+        shard = BinanceStream(self._wss, self._process_callback, connected_callback)
+        self._shards.append(shard)
+        self._counts[shard] = 0
+        return shard
+
+
+class _SymbolBook:
+    """State of a symbol traded by `Binance`: local orderbook and trading rules."""
+
+    DEPTH_BUFFER_SIZE = 1000  # Max depth updates buffered while orderbook not synchronized, the oldest are dropped.
+
+    def __init__(self, platform, symbol, depth):
+        """Initialize."""
+        self.symbol = symbol  # Symbol name given by strategy, e.g. `BTC/USDT`.
+        self.raw_symbol = symbol.replace("/", "")  # Symbol name of Binance, e.g. `BTCUSDT`.
+        self.symbol_info = None  # Symbol information, trading rules and filters.
+        self.orderbook = LocalOrderbook(platform, self.raw_symbol, depth)
+        self.orderbook_syncing = False  # If fetching orderbook snapshot right now, or a retry is scheduled.
+        self.orderbook_updates = 0  # How many orderbook updates published.
+        self.depth_buffer = deque(maxlen=self.DEPTH_BUFFER_SIZE)  # Depth updates received while not synchronized.
+
 
 class Binance:
     """Binance Trade module. You can initialize trade object with some attributes in kwargs.
@@ -38,6 +538,11 @@ class Binance:
         account: Account name for this trade exchange.
         strategy: What's name would you want to created for your strategy.
         symbol: Symbol name for your trade.
+        symbols: Symbol names for your trade, e.g. `["BTCUSDT", "ETHUSDT"]`, use this instead of `symbol` to trade
+            many symbols by one object, symbols can be added or removed later by `add_symbols` / `remove_symbols`.
+        interval: Kline interval subscribed, e.g. `1s`.
+        intervals: Kline intervals subscribed, e.g. `["1s", "1m"]`, use this instead of `interval` to subscribe
+            many intervals.
         host: HTTP request host. (default "https://api.binance.com")
         wss: Websocket address. (default "wss://stream.binance.com:9443")
         access_key: Account's ACCESS KEY.
@@ -51,8 +556,42 @@ class Binance:
         error_callback: You can use this param to specify a async callback function when you initializing Trade
             module. `error_callback` is like `async def on_error_callback(error: Error, **kwargs): pass`
             and this callback function will be executed asynchronous when some error occur while trade module is running.
+        position_update_callback: `async def on_position_update_callback(position: Position): pass`, called when a
+            position updated by a fill, or marked to a kline close price, see `aioquant.pnl.PnlEngine`.
+        orderbook: If maintain a local orderbook from depth diff stream and publish it by `EventOrderbook`,
+            default is `False`.
+        orderbook_depth: How many levels published, default is `20`.
+        orderbook_publish: Publish `snapshot` (top levels) or `diff` (changes of top levels) on every depth update,
+            default is `snapshot`.
+        orderbook_snapshot_interval: Publish a full snapshot every N updates in `diff` mode, so that subscribers can
+            recover from lost messages, default is `100`.
+        streams_per_connection: Max streams on one Websocket connection, streams are sharded across connections,
+            default is `1024` (limit of Binance).
+        order_archive_size: Max finished orders kept in memory, default is `10000`.
+        order_spill_file: File to append finished orders dropped from memory, default is `None`.
+        pnl_checkpoint_file: File to save positions periodically, positions are restored from it after restart, and
+            trades missed meanwhile are pulled back from the last trade id, default is `None`.
+        pnl_checkpoint_interval: Save positions every N seconds, default is `60`.
+        risk: Limits of pre-trade risk gate, see `aioquant.risk.RiskGate`, default is `RISK` in config file, orders
+            rejected are reported by `error_callback` with a `RiskError`.
+        recv_window: `recvWindow` of signed requests, millisecond, default is `None` (5000 by Binance).
+        clock_sync_interval: Sync exchange clock with server time every N seconds, `0` to disable, default is
+            `60`, see `aioquant.utils.clock`.
+        max_inflight_requests: Max order requests in flight at a time when many orders are canceled or replaced
+            concurrently, default is `AsyncHttpRequests.LIMIT_PER_HOST` (connections kept alive per host).
+
+    NOTE:
+        Local orderbook and trading rules are kept per symbol, messages are routed to them by symbol name `s` in a
+        dict, and orders of all symbols are kept in an `OrderStore`, so that one object (one listen key, one REST
+        client, a few connections) serves hundreds of symbols.
+
+        Client side latency of every order request is recorded into histogram `aioquant_order_latency_seconds`,
+        labeled by `op`: `create` / `cancel` / `cancel_all` / `replace` are request round trip time, and
+        `create_to_report` is the time from an order sent to its `NEW` execution report received.
     """
 
+    SENT_TIMEOUT = 60  # Seconds to wait for `NEW` execution report of an order sent, for `create_to_report` latency.
+
     def __init__(self, **kwargs):
         """Initialize Trade module."""
         e = None
@@ -60,9 +599,9 @@ class Binance:
             e = Error("param account miss")
         # if not kwargs.get("strategy"):
         #     e = Error("param strategy miss")
-        if not kwargs.get("symbol"):
+        if not kwargs.get("symbol") and not kwargs.get("symbols"):
             e = Error("param symbol miss")
-        if not kwargs.get("interval"):
+        if not kwargs.get("interval") and not kwargs.get("intervals"):
             e = Error("param interval miss")
         if not kwargs.get("testnet"):
             kwargs["testnet"] = False
@@ -82,8 +621,9 @@ class Binance:
         self._account = kwargs["account"]
         self._strategy = kwargs["strategy"]
         self._platform = kwargs["platform"]
-        self._symbol = kwargs["symbol"]
-        self._interval = kwargs["interval"]
+        self._symbols = list(kwargs.get("symbols") or [kwargs["symbol"]])
+        self._symbol = self._symbols[0]  # Default symbol.
+        self._intervals = list(kwargs.get("intervals") or [kwargs["interval"]])
         self._host = kwargs["host"]
         self._wss = kwargs["wss"]
         self._access_key = kwargs["access_key"]
@@ -92,7 +632,12 @@ class Binance:
         self._init_callback = kwargs.get("init_callback")
         self._error_callback = kwargs.get("error_callback")
         self._use_testnet = True if kwargs["testnet"] == True else False
-        
+        self._orderbook_enabled = kwargs.get("orderbook", False)
+        self._orderbook_publish = kwargs.get("orderbook_publish", "snapshot")
+        self._orderbook_snapshot_interval = kwargs.get("orderbook_snapshot_interval", 100)
+        self._orderbook_depth = kwargs.get("orderbook_depth", 20)
+        self._streams_per_connection = kwargs.get("streams_per_connection", 1024)
+
         if self._use_testnet:
             logger.info("Using testnet", caller=self)
             self._host = "https://testnet.binance.vision"
@@ -100,41 +645,244 @@ class Binance:
 
         self._raw_symbol = self._symbol.replace("/", "")  # Row symbol name, same as Binance Exchange.
         self._assets = {}  # Asset data. e.g. {"BTC": {"free": "1.1", "locked": "2.2", "total": "3.3"}, ... }
-        self._orders = {}  # Order data. e.g. {order_no: order, ... }
+        self._books = {}  # State of every symbol, indexed by raw symbol name. e.g. `{"BTCUSDT": _SymbolBook, ... }`
+        for symbol in self._symbols:
+            book = _SymbolBook(self._platform, symbol, self._orderbook_depth)
+            self._books[book.raw_symbol] = book
+        self._orders = OrderStore(kwargs.get("order_archive_size", 10000), kwargs.get("order_spill_file"))
+        self._pnl = PnlEngine(self._platform, self._account, self._strategy, kwargs.get("position_update_callback"),
+                              kwargs.get("pnl_checkpoint_file"), kwargs.get("pnl_checkpoint_interval", 60))
+        self._risk = RiskGate(**(kwargs.get("risk") or config.risk or {}))
+        self._loop = asyncio.get_event_loop()
+        self._inflight = asyncio.Semaphore(kwargs.get("max_inflight_requests", AsyncHttpRequests.LIMIT_PER_HOST))
+        self._client_order_prefix = "aq{}-".format(tools.get_uuid4().replace("-", "")[:16])
+        self._client_order_no = 0
+        # Send time of orders waiting for `NEW` execution report, the oldest first. e.g. `{client_order_id: time}`
+        self._sent = OrderedDict()
+        self._latencies = {
+            op: registry.histogram("aioquant_order_latency_seconds", "Client side latency of order requests.",
+                                   platform=self._platform, op=op)
+            for op in ("create", "cancel", "cancel_all", "replace", "create_to_report")
+        }
+        self._initialized = False  # If open orders and trading rules pulled back.
+        self._order_updates = {}  # Order updates waiting for the previous callback of the same order finished.
 
+        # Stream message handlers, route by event type.
+        self._handlers = {
+            "executionReport": self.process_order,
+            "kline": self.process_kline,
+            "depthUpdate": self.process_depth
+        }
 
-        SingleTask.run(self._init_client)
+        self._rest_api = BinanceRestAPI(self._access_key, self._secret_key, self._host,
+                                        recv_window=kwargs.get("recv_window"))
+        if kwargs.get("clock_sync_interval", 60):
+            self._rest_api.sync_clock(kwargs.get("clock_sync_interval", 60))
+        self._ws = None  # Combined stream connections.
+        self._listen_key = None  # Listen key of user data stream.
         SingleTask.run(self._init_websocket)
-        # self._client = Spot(api_key=self._access_key, api_secret=self._secret_key, base_url=self._host)
-        # self._ws = SpotWebsocketStreamClient(on_message=self.process, on_open=self.connected_callback, stream_url=self._wss)
-        # self._ws.book_ticker(symbol=self._raw_symbol)
-        
-    async def _init_client(self):
-        self._client = Spot(api_key=self._access_key, api_secret=self._secret_key, base_url=self._host)
-        
+
+    @property
+    def rest_api(self):
+        return self._rest_api
+
+    @property
+    def symbols(self):
+        return [book.symbol for book in self._books.values()]
+
+    @property
+    def assets(self):
+        return self._assets
+
+    @property
+    def orders(self):
+        """Order store of all symbols, see `aioquant.orderstore.OrderStore`."""
+        return self._orders
+
+    @property
+    def pnl(self):
+        """Position and PnL engine of all symbols, see `aioquant.pnl.PnlEngine`."""
+        return self._pnl
+
+    @property
+    def risk(self):
+        """Pre-trade risk gate of all symbols, see `aioquant.risk.RiskGate`."""
+        return self._risk
+
+    def get_orders(self, symbol=None):
+        """Get open orders of a symbol.
+
+        Args:
+            symbol: Symbol name, default is the first symbol.
+
+        Returns:
+            orders: Open orders, e.g. `{order_id: order, ... }`, empty if symbol not traded.
+        """
+        book = self._get_book(symbol)
+        if not book:
+            return {}
+        return {order.order_id: order for order in self._orders.by_symbol(book.symbol)}
+
+    def get_symbol_info(self, symbol=None):
+        """Get trading rules and filters of a symbol, default is the first symbol."""
+        book = self._get_book(symbol)
+        return book.symbol_info if book else None
+
+    def _get_book(self, symbol=None):
+        return self._books.get((symbol or self._symbol).replace("/", ""))
+
+    def _streams_of(self, book):
+        """Market streams of a symbol."""
+        symbol = book.raw_symbol.lower()
+        streams = ["{s}@kline_{i}".format(s=symbol, i=interval) for interval in self._intervals]
+        if self._orderbook_enabled:
+            streams.append("{s}@depth@100ms".format(s=symbol))
+        return streams
+
     async def _init_websocket(self):
-        def open_handler(*args, **kwargs):
-            logger.error(args, kwargs)
-            SingleTask.run(self.connected_callback)
-        def process_handler(socketMangar, msg):
-            SingleTask.run(self.process, msg)
-        
-        self._ws = SpotWebsocketStreamClient(on_message=process_handler, on_open=open_handler, stream_url=self._wss)
-        # self._ws.book_ticker(symbol=self._raw_symbol)
-        self._ws.kline(symbol=self._raw_symbol, interval=self._interval)
-        
-    def connected_callback(self):
-        """After websocket connection created successfully, pull back all open order information."""
-        logger.info("Websocket connection authorized successfully.", caller=self)
-        order_infos, error = self._client.get_open_orders(self._raw_symbol)
+        """Create listen key for user data stream, and subscribe market streams and user data stream on one
+        combined stream connection."""
+        success, error = await self._rest_api.create_listen_key()
         if error:
-            e = Error("get open orders error: {}".format(error))
+            e = Error("create listen key error: {}".format(error))
+            logger.error(e, caller=self)
             SingleTask.run(self._error_callback, e)
             SingleTask.run(self._init_callback, False)
             return
+        self._listen_key = success["listenKey"]
+        LoopRunTask.register(self._keep_alive_listen_key, 30 * 60)
+
+        self._ws = BinanceStreamPool(self._wss, self.process, self.connected_callback, self._streams_per_connection)
+        await self._ws.subscribe(self._listen_key)  # User data stream is on the first connection.
+        await self._ws.subscribe(*[stream for book in self._books.values() for stream in self._streams_of(book)])
+
+    async def _keep_alive_listen_key(self, *args, **kwargs):
+        """Keep alive listen key of user data stream every 30 minutes."""
+        _, error = await self._rest_api.keep_alive_listen_key(self._listen_key)
+        if error:
+            logger.error("keep alive listen key error:", error, caller=self)
+
+    def flush(self):
+        """Save positions into checkpoint file and flush finished orders into spill file, synchronously, so that it's
+        done even if the event loop is stopping, e.g. in `stop_func` of `quant.start`."""
+        self._pnl.checkpoint()
+        self._orders.close()
+
+    async def close(self):
+        """Save positions, flush finished orders, and close Websocket connection."""
+        self.flush()  # Before the first await, the event loop may stop before this coroutine resumes.
+        if self._ws:
+            await self._ws.close()
+
+    async def add_symbols(self, *symbols):
+        """Start trading symbols: subscribe market streams, pull back open orders and trading rules.
+
+        Args:
+            symbols: Symbol names, e.g. `BTCUSDT` / `BTC/USDT`.
+
+        Returns:
+            success: `True` if successfully, otherwise it's None.
+            error: Error information, otherwise it's None.
+        """
+        books = []
+        for symbol in symbols:
+            raw_symbol = symbol.replace("/", "")
+            if raw_symbol not in self._books:
+                book = _SymbolBook(self._platform, symbol, self._orderbook_depth)
+                self._books[raw_symbol] = book
+                books.append(book)
+        if not books:
+            return True, None
+        if self._ws:
+            await self._ws.subscribe(*[stream for book in books for stream in self._streams_of(book)])
+        if self._initialized:
+            error = await self._load_symbols(books)
+            if error:
+                SingleTask.run(self._error_callback, error)
+                return None, error
+        return True, None
+
+    async def remove_symbols(self, *symbols):
+        """Stop trading symbols: unsubscribe market streams, and forget open orders of them.
+
+        Args:
+            symbols: Symbol names, e.g. `BTCUSDT` / `BTC/USDT`.
+
+        NOTE:
+            Order updates of removed symbols are ignored, so their open orders are dropped from order store and risk
+            gate (not counted in open orders and notional limits any more), but they are still open on exchange.
+            Cancel them first, e.g. `await revoke_order(symbol=symbol)`.
+        """
+        books = [self._books.pop(symbol.replace("/", ""), None) for symbol in symbols]
+        books = [book for book in books if book]
+        for book in books:
+            orders = self._orders.by_symbol(book.symbol)
+            if orders:
+                logger.warn("symbol removed with open orders:", book.symbol, [o.order_id for o in orders],
+                            caller=self)
+            for order in orders:
+                self._orders.discard(order)
+                self._risk.release(order.client_order_id)
+        if books and self._ws:
+            await self._ws.unsubscribe(*[stream for book in books for stream in self._streams_of(book)])
+
+    async def connected_callback(self):
+        """After websocket connection created successfully, pull back open orders, account assets and symbol
+        information concurrently."""
+        logger.info("Websocket connection authorized successfully.", caller=self)
+        (account, account_error), error = await asyncio.gather(
+            self._rest_api.get_user_account(),
+            self._load_symbols(list(self._books.values()))
+        )
+        if error:
+            SingleTask.run(self._error_callback, error)
+            SingleTask.run(self._init_callback, False)
+            return
+        if account_error:
+            logger.warn("get user account error:", account_error, caller=self)
+        else:
+            for balance in account["balances"]:
+                free, locked = float(balance["free"]), float(balance["locked"])
+                self._assets[balance["asset"]] = {
+                    "free": balance["free"],
+                    "locked": balance["locked"],
+                    "total": tools.float_to_str(free + locked)
+                }
+        self._initialized = True
+        SingleTask.run(self._init_callback, True)
+
+    async def _load_symbols(self, books):
+        """Pull back open orders and trading rules of symbols.
+
+        Open orders of all symbols are pulled back by one request if there are many symbols, which costs less request
+        weight than a request per symbol.
+
+        Returns:
+            error: Error information if pull back open orders failed, otherwise it's None.
+        """
+        if not books:
+            return None
+        loading = {book.raw_symbol: book for book in books}
+        symbol = books[0].raw_symbol if len(books) == 1 else None
+        (order_infos, error), (exchange_info, info_error) = await asyncio.gather(
+            self._rest_api.get_open_orders(symbol),
+            self._rest_api.get_exchange_info(symbols=[book.raw_symbol for book in books])
+        )
+        if error:
+            return Error("get open orders error: {}".format(error))
+        if info_error:
+            logger.warn("get exchange info error:", info_error, caller=self)
+        else:
+            for symbol_info in exchange_info["symbols"]:
+                book = loading.get(symbol_info["symbol"])
+                if book:
+                    book.symbol_info = symbol_info
 
         # logger.info("SHX_DEBUG order",order_infos, caller=self)
         for order_info in order_infos:
+            book = loading.get(order_info["symbol"])
+            if not book:
+                continue
             if order_info["status"] == "NEW":
                 status = ORDER_STATUS_SUBMITTED
             elif order_info["status"] == "PARTIALLY_FILLED":
@@ -161,128 +909,317 @@ class Binance:
                 "client_order_id": order_info["clientOrderId"],
                 "action": ORDER_ACTION_BUY if order_info["side"] == "BUY" else ORDER_ACTION_SELL,
                 "order_type": ORDER_TYPE_LIMIT if order_info["type"] == "LIMIT" else ORDER_TYPE_MARKET,
-                "symbol": self._symbol,
+                "symbol": book.symbol,
                 "price": order_info["price"],
                 "quantity": order_info["origQty"],
                 "remain": float(order_info["origQty"]) - float(order_info["executedQty"]),
                 "status": status,
+                "avg_price": float(order_info["cummulativeQuoteQty"]) / float(order_info["executedQty"])
+                if float(order_info["executedQty"]) else 0,
                 "ctime": order_info["time"],
                 "utime": order_info["updateTime"]
             }
-            order = Order(**info)
-            self._orders[order_id] = order
-            SingleTask.run(self._order_update_callback, copy.copy(order))
+            order = self._orders.add(Order(**info))
+            self._risk.on_order(order)
+            self._notify_order_update(order)
 
-        SingleTask.run(self._init_callback, True)
+        await asyncio.gather(*[self._sync_trades(book) for book in books
+                               if self._pnl.last_trade_id(book.symbol) is not None])
+        for book in books:
+            self._update_risk_position(book)
+        return None
+
+    async def _sync_trades(self, book):
+        """Apply trades missed since the last trade id in PnL checkpoint, fills received meanwhile are held and
+        applied after."""
+        self._pnl.hold(book.symbol)
+        try:
+            while True:
+                from_id = self._pnl.last_trade_id(book.symbol) + 1
+                trades, error = await self._rest_api.get_my_trades(book.raw_symbol, from_id)
+                if error:
+                    logger.error("get trades error:", error, caller=self)
+                    return
+                for trade in trades:
+                    self._pnl.on_fill(book.symbol, ORDER_ACTION_BUY if trade["isBuyer"] else ORDER_ACTION_SELL,
+                                      float(trade["qty"]), float(trade["price"]), float(trade["commission"]),
+                                      trade["commissionAsset"], trade["id"], trade["time"], replay=True)
+                if len(trades) < 1000:
+                    break
+        finally:
+            self._pnl.release(book.symbol)
+
+    def _update_risk_position(self, book):
+        position = self._pnl.get_position(book.symbol)
+        self._risk.on_position(book.symbol, position.quantity if position else 0)
+
+    def _check_risk(self, book, action, price, quantity, client_order_id, replaces=None):
+        """Check an order by risk gate before it's sent, report the error by `error_callback` if rejected.
+
+        Returns:
+            error: `RiskError` if the order is rejected, otherwise it's None.
+        """
+        error = self._risk.check(book.symbol, action, price, quantity, client_order_id, replaces)
+        if error:
+            logger.warn("order rejected by risk gate:", error, caller=self)
+            SingleTask.run(self._error_callback, error)
+        return error
+
+    async def create_order(self, side, type, price, quantity, *args, **kwargs):
+        """Create an order.
+
+        Args:
+            side: Trade direction, `BUY` or `SELL`.
+            type: Order type, `LIMIT` / `MARKET` / `LIMIT_MAKER`.
+            price: Price of each order, ignored for `MARKET` order.
+            quantity: The buying or selling quantity.
+            kwargs:
+                symbol: Symbol name, default is the first symbol.
+                client_order_id: Client order id, default is generated.
+                time_in_force: Time in force of `LIMIT` order, default is `GTC`.
+
+        Returns:
+            order_id: Order id if created successfully, otherwise it's None.
+            error: Error information, otherwise it's None.
+        """
+        book = self._get_book(kwargs.get("symbol"))
+        if not book:
+            return self._order_error(Error("symbol not traded: {}".format(kwargs.get("symbol"))))
+        if type == ORDER_TYPE_MARKET:
+            price = None
+        client_order_id = kwargs.get("client_order_id") or self._next_client_order_id()
+        error = self._check_risk(book, side, price, quantity, client_order_id)
+        if error:
+            return None, error
+        start = self._mark_sent(client_order_id)
+        result, error = await self._rest_api.create_order(book.raw_symbol, side, type, quantity, price,
+                                                          client_order_id, kwargs.get("time_in_force", "GTC"))
+        self._latencies["create"].observe(self._loop.time() - start)
+        if error:
+            self._sent.pop(client_order_id, None)
+            self._risk.release(client_order_id)
+            return self._order_error(error)
+        return str(result["orderId"]), None
 
-    # async def create_order(self, side, type, price, quantity, *args, **kwargs):
-    #     """Create an order.
-
-    #     Args:
-    #         action: Trade direction, `BUY` or `SELL`.
-    #         price: Price of each order.
-    #         quantity: The buying or selling quantity.
-
-    #     Returns:
-    #         order_id: Order id if created successfully, otherwise it's None.
-    #         error: Error information, otherwise it's None.
-    #     """
-    #     client_order_id = kwargs["client_order_id"]
-    #     if type == "MARKET" and price != None:
-    #         logger.error("Market type with Price not working", caller=self)
-    #     params = {
-    #         "symbol": self._raw_symbol,
-    #         "side": side,
-    #         "type": type,
-    #         "price": price,
-    #         "quantity": quantity,
-    #     }
-    #     result, error = await self._client.create_order(**params)
-    #     if error:
-    #         SingleTask.run(self._error_callback, error)
-    #         return None, error
-    #     order_id = str(result["orderId"])
-    #     return order_id, None
-
-    # async def revoke_order(self, *order_ids):
-    #     """Revoke (an) order(s).
-
-    #     Args:
-    #         order_ids: Order id list, you can set this param to 0 or multiple items. If you set 0 param, you can cancel
-    #             all orders for this symbol(initialized in Trade object). If you set 1 param, you can cancel an order.
-    #             If you set multiple param, you can cancel multiple orders. Do not set param length more than 100.
-
-    #     Returns:
-    #         Success or error, see bellow.
-    #     """
-    #     # If len(order_nos) == 0, you will cancel all orders for this symbol(initialized in Trade object).
-    #     if len(order_ids) == 0:
-    #         order_infos, error = await self._client.get_open_orders(self._raw_symbol)
-    #         if error:
-    #             SingleTask.run(self._error_callback, error)
-    #             return False, error
-    #         for order_info in order_infos:
-    #             _, error = await self._client.cancel_order(self._raw_symbol, orderId=order_info["orderId"])
-    #             if error:
-    #                 SingleTask.run(self._error_callback, error)
-    #                 return False, error
-    #         return True, None
-
-    #     # If len(order_nos) == 1, you will cancel an order.
-    #     if len(order_ids) == 1:
-    #         success, error = await self._client.cancel_order(self._raw_symbol, orderId=order_ids[0])
-    #         if error:
-    #             SingleTask.run(self._error_callback, error)
-    #             return order_ids[0], error
-    #         else:
-    #             return order_ids[0], None
-
-    #     # If len(order_nos) > 1, you will cancel multiple orders.
-    #     if len(order_ids) > 1:
-    #         success, error = [], []
-    #         for order_id in order_ids:
-    #             _, e = await self._client.cancel_order(self._raw_symbol, orderId=order_id)
-    #             if e:
-    #                 SingleTask.run(self._error_callback, e)
-    #                 error.append((order_id, e))
-    #             else:
-    #                 success.append(order_id)
-    #         return success, error
-
-    # async def get_open_order_ids(self):
-    #     """Get open order id list.
-    #     """
-    #     success, error = await self._client.get_open_orders(self._raw_symbol)
-    #     if error:
-    #         SingleTask.run(self._error_callback, error)
-    #         return None, error
-    #     else:
-    #         order_ids = []
-    #         for order_info in success:
-    #             order_id = str(order_info["orderId"])
-    #             order_ids.append(order_id)
-    #         return order_ids, None
-    
-    @async_method_locker("BinanceTrade.process.locker")
-    async def process(self, manager, msg):
-        """Process message that received from Websocket connection.
+    async def revoke_order(self, *order_ids, **kwargs):
+        """Revoke (an) order(s).
+
+        Args:
+            order_ids: Order id list, you can set this param to 0 or multiple items. If you set 0 param, you can cancel
+                all orders for this symbol by one request. If you set 1 param, you can cancel an order. If you set
+                multiple param, orders are canceled concurrently, at most `max_inflight_requests` at a time.
+            kwargs:
+                symbol: Symbol name, default is the first symbol.
+
+        Returns:
+            Success or error, see bellow.
+        """
+        book = self._get_book(kwargs.get("symbol"))
+        if not book:
+            return self._order_error(Error("symbol not traded: {}".format(kwargs.get("symbol"))))
+
+        # If len(order_ids) == 0, you will cancel all orders for this symbol.
+        if len(order_ids) == 0:
+            start = self._loop.time()
+            _, error = await self._rest_api.cancel_open_orders(book.raw_symbol)
+            self._latencies["cancel_all"].observe(self._loop.time() - start)
+            if error and _error_code(error) != -2011:  # -2011: no open orders.
+                SingleTask.run(self._error_callback, error)
+                return False, error
+            return True, None
+
+        # If len(order_ids) == 1, you will cancel an order.
+        if len(order_ids) == 1:
+            error = await self._cancel_order(book, order_ids[0])
+            return order_ids[0], error
+
+        # If len(order_ids) > 1, you will cancel multiple orders.
+        errors = await self._gather_bounded([self._cancel_order(book, order_id) for order_id in order_ids])
+        success, error = [], []
+        for order_id, e in zip(order_ids, errors):
+            if e:
+                error.append((order_id, e))
+            else:
+                success.append(order_id)
+        return success, error
+
+    async def replace_order(self, order_id, price, quantity, **kwargs):
+        """Cancel an order and create a new one by one request (`cancelReplace`), the new order is not created if
+        cancel failed.
+
+        Args:
+            order_id: Order id to be canceled.
+            price: Price of the new order.
+            quantity: Quantity of the new order.
+            kwargs:
+                symbol: Symbol name, default is the first symbol.
+                side: Trade direction of the new order, default is the same as the order canceled.
+                type: Order type of the new order, default is the same as the order canceled.
+                client_order_id: Client order id of the new order, default is generated.
+
+        Returns:
+            order_id: Order id of the new order if created successfully, otherwise it's None.
+            error: Error information, otherwise it's None.
+        """
+        book = self._get_book(kwargs.get("symbol"))
+        if not book:
+            return self._order_error(Error("symbol not traded: {}".format(kwargs.get("symbol"))))
+        old = self._orders.get(book.symbol, str(order_id))
+        side = kwargs.get("side") or (old.action if old else None)
+        order_type = kwargs.get("type") or (old.order_type if old else ORDER_TYPE_LIMIT)
+        if not side:
+            return self._order_error(Error("side of new order unknown, order not found: {}".format(order_id)))
+        if order_type == ORDER_TYPE_MARKET:
+            price = None
+        client_order_id = kwargs.get("client_order_id") or self._next_client_order_id()
+        error = self._check_risk(book, side, price, quantity, client_order_id, old.client_order_id if old else None)
+        if error:
+            return None, error
+        start = self._mark_sent(client_order_id)
+        result, error = await self._rest_api.cancel_replace_order(book.raw_symbol, side, order_type, quantity, price,
+                                                                  order_id, client_order_id)
+        self._latencies["replace"].observe(self._loop.time() - start)
+        if error:
+            self._sent.pop(client_order_id, None)
+            self._risk.release(client_order_id)
+            return self._order_error(error)
+        return str(result["newOrderResponse"]["orderId"]), None
+
+    async def replace_orders(self, *replaces, **kwargs):
+        """Replace many orders concurrently, at most `max_inflight_requests` at a time.
+
+        Args:
+            replaces: `(order_id, price, quantity)` of every order, see `replace_order`.
+            kwargs: Other arguments of `replace_order`, e.g. `symbol`.
+
+        Returns:
+            success: `[(order_id, new order id), ... ]` replaced successfully.
+            error: `[(order_id, error), ... ]` failed.
+        """
+        results = await self._gather_bounded([self.replace_order(order_id, price, quantity, **kwargs)
+                                              for order_id, price, quantity in replaces])
+        success, error = [], []
+        for (order_id, _, _), (new_order_id, e) in zip(replaces, results):
+            if e:
+                error.append((order_id, e))
+            else:
+                success.append((order_id, new_order_id))
+        return success, error
+
+    async def get_open_order_ids(self, symbol=None):
+        """Get open order id list.
+
+        Args:
+            symbol: Symbol name, default is the first symbol.
+        """
+        book = self._get_book(symbol)
+        if not book:
+            return self._order_error(Error("symbol not traded: {}".format(symbol)))
+        success, error = await self._rest_api.get_open_orders(book.raw_symbol)
+        if error:
+            SingleTask.run(self._error_callback, error)
+            return None, error
+        else:
+            order_ids = []
+            for order_info in success:
+                order_id = str(order_info["orderId"])
+                order_ids.append(order_id)
+            return order_ids, None
+
+    async def _cancel_order(self, book, order_id):
+        start = self._loop.time()
+        _, error = await self._rest_api.cancel_order(book.raw_symbol, order_id)
+        self._latencies["cancel"].observe(self._loop.time() - start)
+        if error:
+            SingleTask.run(self._error_callback, error)
+        return error
+
+    async def _gather_bounded(self, coros):
+        """Run coroutines concurrently, at most `max_inflight_requests` at a time, results in order."""
+        async def run(coro):
+            async with self._inflight:
+                return await coro
+        return await asyncio.gather(*[run(coro) for coro in coros])
+
+    def _next_client_order_id(self):
+        self._client_order_no += 1
+        return "{}{}".format(self._client_order_prefix, self._client_order_no)
+
+    def _mark_sent(self, client_order_id):
+        """Save send time of an order for `create_to_report` latency, and drop send times older than `SENT_TIMEOUT`
+        seconds, whose execution reports are lost, e.g. while user data stream reconnecting.
+
+        Returns:
+            now: Send time.
+        """
+        now = self._loop.time()
+        sent = self._sent
+        while sent:
+            oldest = next(iter(sent))
+            if now - sent[oldest] < self.SENT_TIMEOUT:
+                break
+            del sent[oldest]
+        sent[client_order_id] = now
+        sent.move_to_end(client_order_id)
+        return now
+
+    def _order_error(self, error):
+        SingleTask.run(self._error_callback, error)
+        return None, error
+
+    def process(self, msg):
+        """Process message that received from Websocket connection, called directly in the event loop, so that
+        messages are handled one by one in order of arrival without any locker.
 
         Args:
             msg: message received from Websocket connection.
         """
-        msg = json.loads(msg)
-        logger.debug("msg:", json.dumps(msg), caller=self)
-        e = msg.get("e")
-        if e == "executionReport":
-            self.process_order(msg)
-        elif e == "kline":
-            self.process_kline(msg)
-    
+        handler = self._handlers.get(msg.get("e"))
+        if handler:
+            if trace.enabled:
+                trace.set_exchange_time(msg.get("E"))
+            handler(msg)
+
+    def _notify_order_update(self, order):
+        """Callback order update. Callbacks of the same order are executed one by one in order of updates, callbacks
+        of different orders are executed concurrently. The live order is updated in place later, so callbacks are
+        called with snapshots, created only if there is a callback."""
+        if not self._order_update_callback:
+            return
+        order = order.replace()
+        key = (order.symbol, order.order_id)  # Order id is unique per symbol.
+        pending = self._order_updates.get(key)
+        if pending is not None:
+            pending.append(order)
+            return
+        self._order_updates[key] = []
+        SingleTask.run(self._run_order_updates, order)
+
+    async def _run_order_updates(self, order):
+        key = (order.symbol, order.order_id)
+        try:
+            while True:
+                try:
+                    await self._order_update_callback(order)
+                except Exception as e:
+                    logger.exception("order update callback error:", e, caller=self)
+                pending = self._order_updates[key]
+                if not pending:
+                    break
+                order = pending.pop(0)
+        finally:
+            self._order_updates.pop(key, None)
+
     # @async_method_locker("BinanceTrade.process_order.locker")
     def process_order(self, msg):
-        if msg["s"] != self._raw_symbol:
-                return
+        book = self._books.get(msg["s"])
+        if not book:
+            return
         order_id = str(msg["i"])
+        if self._sent:
+            sent = self._sent.pop(msg["c"], None)
+            if sent is not None:
+                self._latencies["create_to_report"].observe(self._loop.time() - sent)
         if msg["X"] == "NEW":
             status = ORDER_STATUS_SUBMITTED
         elif msg["X"] == "PARTIALLY_FILLED":
@@ -299,8 +1236,16 @@ class Binance:
             logger.warn("unknown status:", msg, caller=self)
             SingleTask.run(self._error_callback, "order status error.")
             return
-        order = self._orders.get(order_id)
-        if not order:
+        filled = float(msg["z"])
+        avg_price = float(msg["Z"]) / filled if filled else 0
+        fee = float(msg["n"]) if msg["x"] == "TRADE" else 0
+        order = self._orders.get(book.symbol, order_id)
+        if order:
+            order = self._orders.update(order, remain=float(msg["q"]) - filled, status=status, avg_price=avg_price,
+                                        fee=order.fee + fee, utime=msg["T"])
+        elif self._orders.find(book.symbol, order_id):
+            return  # Finished already, e.g. a late update after canceled.
+        else:
             info = {
                 "platform": self._platform,
                 "account": self._account,
@@ -309,22 +1254,104 @@ class Binance:
                 "client_order_id": msg["c"],
                 "action": ORDER_ACTION_BUY if msg["S"] == "BUY" else ORDER_ACTION_SELL,
                 "order_type": ORDER_TYPE_LIMIT if msg["o"] == "LIMIT" else ORDER_TYPE_MARKET,
-                "symbol": self._symbol,
+                "symbol": book.symbol,
                 "price": msg["p"],
                 "quantity": msg["q"],
                 "ctime": msg["O"]
             }
             order = Order(**info)
-            self._orders[order_id] = order
-        order.remain = float(msg["q"]) - float(msg["z"])
-        order.status = status
-        order.utime = msg["T"]
-        SingleTask.run(self._order_update_callback, copy.copy(order))
-
-        if status in [ORDER_STATUS_FAILED, ORDER_STATUS_CANCELED, ORDER_STATUS_FILLED]:
-            self._orders.pop(order_id)
+            order.remain = float(msg["q"]) - filled
+            order.status = status
+            order.avg_price = avg_price
+            order.fee = fee
+            order.utime = msg["T"]
+            order = self._orders.add(order)
+        self._risk.on_order(order)
+        self._notify_order_update(order)
+        if msg["x"] == "TRADE":
+            price = float(msg["L"])
+            self._pnl.on_fill(book.symbol, order.action, float(msg["l"]), price, fee, msg["N"], msg["t"], msg["T"])
+            self._risk.on_price(book.symbol, price)
+            self._update_risk_position(book)
 
     # @async_method_locker("BinanceTrade.process_kline.locker")
     def process_kline(self, msg):
-        kline = Kline(self._raw_symbol).load_smart(msg["k"])
+        kline = Kline(msg["s"]).load_smart(msg["k"])
         EventKline(kline).publish()
+        book = self._books.get(msg["s"])
+        if not book:
+            return
+        price = float(kline.close)
+        self._risk.on_price(book.symbol, price)
+        if self._pnl.get_position(book.symbol):
+            self._pnl.mark(book.symbol, price, msg["E"])
+
+    def process_depth(self, msg):
+        """Apply depth diff to local orderbook, re-synchronize orderbook from REST snapshot if some diffs lost."""
+        book = self._books.get(msg["s"])
+        if not book:
+            return
+        orderbook = book.orderbook
+        if not orderbook.synchronized:
+            book.depth_buffer.append(msg)
+            if not book.orderbook_syncing:
+                SingleTask.run(self._sync_orderbook, book)
+            return
+        result = orderbook.apply_diff(msg["U"], msg["u"], msg["a"], msg["b"], msg["E"])
+        if result == DIFF_GAP:
+            logger.warn("orderbook update id gap, symbol:", book.raw_symbol, "last:", orderbook.last_update_id,
+                        "first:", msg["U"], caller=self)
+            orderbook.reset()
+            book.depth_buffer.clear()
+            book.depth_buffer.append(msg)
+            if not book.orderbook_syncing:
+                SingleTask.run(self._sync_orderbook, book)
+        elif result == DIFF_APPLIED:
+            self._publish_orderbook(book)
+
+    async def _sync_orderbook(self, book, retry=False):
+        """Fetch orderbook snapshot from REST API, and apply depth diffs buffered.
+
+        Args:
+            book: Symbol book to synchronize.
+            retry: If this is a scheduled retry, `orderbook_syncing` is kept set until the retry fires, so that depth
+                updates arrived meanwhile don't start more snapshot requests.
+        """
+        if book.orderbook_syncing and not retry or self._books.get(book.raw_symbol) is not book:
+            return
+        book.orderbook_syncing = True
+        orderbook = book.orderbook
+        retry_later = False
+        try:
+            success, error = await self._rest_api.get_orderbook(book.raw_symbol, 1000)
+            if error:
+                logger.error("get orderbook snapshot error:", error, caller=self)
+                retry_later = True
+                return
+            orderbook.apply_snapshot(success["lastUpdateId"], success["asks"], success["bids"],
+                                     clock.now_exchange_ms())
+            buffered = list(book.depth_buffer)
+            book.depth_buffer.clear()
+            for msg in buffered:
+                result = orderbook.apply_diff(msg["U"], msg["u"], msg["a"], msg["b"], msg["E"])
+                if result == DIFF_GAP:
+                    logger.warn("orderbook snapshot is too old, re-synchronize.", caller=self)
+                    orderbook.reset()
+                    retry_later = True
+                    return
+            book.orderbook_updates = 0
+            self._publish_orderbook(book)
+        finally:
+            if retry_later:
+                SingleTask.call_later(self._sync_orderbook, 1, book, True)
+            else:
+                book.orderbook_syncing = False
+
+    def _publish_orderbook(self, book):
+        """Publish local orderbook, full snapshot or changed levels."""
+        if self._orderbook_publish == "diff" and book.orderbook_updates % self._orderbook_snapshot_interval != 0:
+            orderbook = book.orderbook.diff()
+        else:
+            orderbook = book.orderbook.orderbook()
+        book.orderbook_updates += 1
+        EventOrderbook(orderbook).publish()
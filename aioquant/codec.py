@@ -0,0 +1,217 @@
+# -*- coding:utf-8 -*-
+
+"""
+Event wire codec.
+
+Every event published to RabbitMQ is converted to bytes by a codec, and converted back by the consumer.
+    1. `json`: JSON text compressed by zlib, works for any event, this is the default codec;
+    2. `binary`: Fixed layout binary encoding for `EVENT_KLINE` / `EVENT_TRADE` / `EVENT_ORDERBOOK`, numeric fields
+        are packed by `struct` / `array`, symbol names are interned in a symbol table;
+
+The codec used for publishing is chosen per exchange by `CODEC` in config file, e.g.
+    "CODEC": {"Kline": "binary", "Trade": "binary", "Orderbook": "json"}
+Consumer doesn't need any config, the codec is detected from the first byte of message body.
+"""
+
+import json
+import zlib
+import struct
+from array import array
+from itertools import chain
+
+from aioquant.configure import config
+
+__all__ = ("JsonCodec", "BinaryCodec", "register_codec", "get_codec", "decode", )
+
+
+# Binary codec header: magic, version, message type, symbol length.
+BINARY_MAGIC = 0xA7  # Never be the first byte of zlib stream (0x78).
+BINARY_VERSION = 2
+
+TYPE_KLINE = 1
+TYPE_TRADE = 2
+TYPE_ORDERBOOK = 3
+TYPE_ORDERBOOK_DIFF = 4
+
+_HEADER = struct.Struct("<BBBB")
+_KLINE = struct.Struct("<qqqqqB?8d")  # t, T, f, L, n, interval, x, o, c, h, l, v, q, V, Q
+_TRADE = struct.Struct("<B2dq")  # action, price, quantity, timestamp
+_ORDERBOOK = struct.Struct("<qqHH")  # timestamp, publish sequence (-1 if none), asks length, bids length
+
+_INTERVALS = ("", "1s", "1m", "3m", "5m", "15m", "30m", "1h", "2h", "4h", "6h", "8h", "12h", "1d", "3d", "1w", "1M")
+_INTERVAL_CODES = {interval: code for code, interval in enumerate(_INTERVALS)}
+
+_ACTIONS = ("BUY", "SELL")
+_ACTION_CODES = {action: code for code, action in enumerate(_ACTIONS)}
+
+
+class JsonCodec:
+    """JSON + zlib codec, available for all events."""
+
+    name = "json"
+
+    def encode(self, name, data):
+        s = json.dumps({"n": name, "d": data})
+        return zlib.compress(s.encode("utf8"))
+
+    def decode(self, b):
+        d = json.loads(zlib.decompress(b).decode("utf8"))
+        return d.get("n"), d.get("d")
+
+
+class BinaryCodec:
+    """Fixed layout binary codec for kline / trade / orderbook events.
+
+    Layout:
+        header: magic(1B) + version(1B) + type(1B) + symbol length(1B) + symbol(utf8)
+        kline: t, T, f, L, n (int64) + interval code(1B) + x(bool) + o, c, h, l, v, q, V, Q (float64)
+        trade: action code(1B) + price, quantity (float64) + timestamp (int64)
+        orderbook: timestamp, publish sequence (int64, -1 if none) + asks length, bids length (uint16) + flattened
+            `[price, quantity]` (float64 array), orderbook diff uses the same layout with a different type.
+
+    NOTE:
+        Orderbook levels must be `[price, quantity]` pairs.
+        Numeric fields will be loaded as `float` / `int`, not the raw string sent by exchange.
+        A `ValueError` will be raised if the event can't be packed (unknown event name, missing fields ...), and then
+        the caller should fall back to `JsonCodec`.
+    """
+
+    name = "binary"
+
+    def __init__(self):
+        self._symbol_bytes = {}  # Symbol table for encoding. e.g. `{"BTCUSDT": b"BTCUSDT", ... }`
+        self._symbol_strs = {}  # Symbol table for decoding. e.g. `{b"BTCUSDT": "BTCUSDT", ... }`
+        self._encoders = {
+            "EVENT_KLINE": self._encode_kline,
+            "EVENT_TRADE": self._encode_trade,
+            "EVENT_ORDERBOOK": self._encode_orderbook
+        }
+        self._decoders = {
+            TYPE_KLINE: self._decode_kline,
+            TYPE_TRADE: self._decode_trade,
+            TYPE_ORDERBOOK: self._decode_orderbook,
+            TYPE_ORDERBOOK_DIFF: self._decode_orderbook
+        }
+
+    def encode(self, name, data):
+        encoder = self._encoders.get(name)
+        if not encoder:
+            raise ValueError("event name not supported: {}".format(name))
+        try:
+            return encoder(data)
+        except (KeyError, TypeError, struct.error) as e:
+            raise ValueError("pack event error: {}".format(e))
+
+    def decode(self, b):
+        magic, version, t, n = _HEADER.unpack_from(b)
+        if magic != BINARY_MAGIC or version != BINARY_VERSION:
+            raise ValueError("binary message version error: magic={} version={}".format(magic, version))
+        offset = _HEADER.size + n
+        symbol = self._symbol_str(bytes(b[_HEADER.size:offset]))
+        return self._decoders[t](b, offset, symbol)
+
+    def _header(self, t, symbol):
+        sb = self._symbol_bytes.get(symbol)
+        if sb is None:
+            sb = symbol.encode("utf8")
+            self._symbol_bytes[symbol] = sb
+        return _HEADER.pack(BINARY_MAGIC, BINARY_VERSION, t, len(sb)) + sb
+
+    def _symbol_str(self, sb):
+        s = self._symbol_strs.get(sb)
+        if s is None:
+            s = sb.decode("utf8")
+            self._symbol_strs[sb] = s
+        return s
+
+    def _encode_kline(self, d):
+        body = _KLINE.pack(
+            d["t"], d["T"], d["f"], d["L"], d["n"], _INTERVAL_CODES.get(d["i"], 0), d["x"],
+            float(d["o"]), float(d["c"]), float(d["h"]), float(d["l"]),
+            float(d["v"]), float(d["q"]), float(d["V"]), float(d["Q"])
+        )
+        return self._header(TYPE_KLINE, d["s"]) + body
+
+    def _decode_kline(self, b, offset, symbol):
+        t, T, f, L, n, i, x, o, c, h, l, v, q, V, Q = _KLINE.unpack_from(b, offset)
+        d = {
+            "t": t, "T": T, "s": symbol, "i": _INTERVALS[i] or None, "f": f, "L": L,
+            "o": o, "c": c, "h": h, "l": l, "v": v, "n": n, "x": x, "q": q, "V": V, "Q": Q
+        }
+        return "EVENT_KLINE", d
+
+    def _encode_trade(self, d):
+        body = _TRADE.pack(_ACTION_CODES[d["a"]], float(d["P"]), float(d["q"]), d["t"])
+        return self._header(TYPE_TRADE, d["s"]) + body
+
+    def _decode_trade(self, b, offset, symbol):
+        a, p, q, t = _TRADE.unpack_from(b, offset)
+        d = {"s": symbol, "a": _ACTIONS[a], "P": p, "q": q, "t": t}
+        return "EVENT_TRADE", d
+
+    def _encode_orderbook(self, d):
+        asks, bids = d["a"], d["b"]
+        levels = array("d", map(float, chain.from_iterable(asks)))
+        levels.extend(map(float, chain.from_iterable(bids)))
+        seq = d.get("q")
+        body = _ORDERBOOK.pack(d["t"], -1 if seq is None else seq, len(asks), len(bids)) + levels.tobytes()
+        t = TYPE_ORDERBOOK_DIFF if d.get("D") else TYPE_ORDERBOOK
+        return self._header(t, d["s"]) + body
+
+    def _decode_orderbook(self, b, offset, symbol):
+        diff = b[2] == TYPE_ORDERBOOK_DIFF
+        t, seq, na, nb = _ORDERBOOK.unpack_from(b, offset)
+        offset += _ORDERBOOK.size
+        levels = array("d")
+        levels.frombytes(b[offset:offset + (na + nb) * 16])
+        levels = levels.tolist()
+        n = na * 2
+        asks = list(map(list, zip(levels[0:n:2], levels[1:n:2])))
+        bids = list(map(list, zip(levels[n::2], levels[n + 1::2])))
+        d = {"s": symbol, "a": asks, "b": bids, "t": t, "D": diff, "q": None if seq < 0 else seq}
+        return "EVENT_ORDERBOOK", d
+
+
+_CODECS = {}  # Registered codecs. e.g. `{"json": codec, "binary": codec}`
+
+
+def register_codec(codec):
+    """Register a codec, so that it can be chosen by name in config file.
+
+    Args:
+        codec: Codec object, which has a `name` attribute, an `encode(name, data)` method and a
+            `decode(b)` method.
+    """
+    _CODECS[codec.name] = codec
+
+
+def get_codec(exchange):
+    """Get the codec for publishing events to an exchange.
+
+    Args:
+        exchange: Exchange name, e.g. `Kline`.
+
+    Returns:
+        codec: Codec object configured by `CODEC` in config file, default is `JsonCodec`.
+    """
+    name = (config.codec or {}).get(exchange, JsonCodec.name)
+    return _CODECS.get(name) or _CODECS[JsonCodec.name]
+
+
+def decode(b):
+    """Decode message body, codec is detected from the first byte.
+
+    Args:
+        b: Message body.
+
+    Returns:
+        name: Event name.
+        data: Event data.
+    """
+    if b and b[0] == BINARY_MAGIC:
+        return _CODECS[BinaryCodec.name].decode(b)
+    return _CODECS[JsonCodec.name].decode(b)
+
+
+register_codec(JsonCodec())
+register_codec(BinaryCodec())
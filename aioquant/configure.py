@@ -25,6 +25,12 @@ class Configure:
             MARKETS: Market Server config list, default is {}.
             HEARTBEAT: Server heartbeat config, default is {}.
             PROXY: HTTP proxy config, default is None.
+            CODEC: Event wire codec per exchange, e.g. `{"Kline": "binary"}`, default is {} (all `json`).
+            METRICS: Metrics endpoint and loop lag probe config, default is {} (disabled).
+            SHM: Shared memory market data fanout config, default is {} (disabled).
+            RECORDER: Market data recorder config, default is {} (disabled).
+            BACKTEST: Backtest settings, see `aioquant.backtest`, default is {}.
+            RISK: Pre-trade risk limits, see `aioquant.risk.RiskGate`, default is {} (no limit).
     """
 
     def __init__(self):
@@ -36,6 +42,12 @@ class Configure:
         self.heartbeat = {}
         self.proxy = None
         self.dingtalk = {}
+        self.codec = {}
+        self.metrics = {}
+        self.shm = {}
+        self.recorder = {}
+        self.backtest = {}
+        self.risk = {}
 
     def loads(self, config_file, key_file) -> None:
         """Load config file.
@@ -44,6 +56,7 @@ class Configure:
             config_file: config json file.
         """
         def try_open_file(file):
+            json_file = {}
             if file:
                 try:
                     with open(file) as f:
@@ -74,6 +87,12 @@ class Configure:
         self.heartbeat = update_fields.get("HEARTBEAT", {})
         self.proxy = update_fields.get("PROXY", None)
         self.dingtalk = update_fields.get("DINGTALK", {})
+        self.codec = update_fields.get("CODEC", {})
+        self.metrics = update_fields.get("METRICS", {})
+        self.shm = update_fields.get("SHM", {})
+        self.recorder = update_fields.get("RECORDER", {})
+        self.backtest = update_fields.get("BACKTEST", {})
+        self.risk = update_fields.get("RISK", {})
         
         if not self.account:
             print("no account!")
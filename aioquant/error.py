@@ -23,3 +23,17 @@ class Error:
 
     def __repr__(self):
         return str(self)
+
+
+class RiskError(Error):
+    """Order rejected by pre-trade risk gate, see `aioquant.risk.RiskGate`.
+
+    Attributes:
+        rule: Rule violated, e.g. `max_notional`.
+        symbol: Symbol name of the order.
+    """
+
+    def __init__(self, msg, rule=None, symbol=None):
+        super(RiskError, self).__init__(msg)
+        self.rule = rule
+        self.symbol = symbol
@@ -8,20 +8,34 @@ Date:   2018/05/04
 Email:  huangtao@ifclover.com
 """
 
-import json
-import zlib
+import os
+import atexit
 import asyncio
+from collections import namedtuple, deque, OrderedDict
 
 import aioamqp
 
+from aioquant import codec
+from aioquant.utils import trace
 from aioquant.utils import logger
 from aioquant.configure import config
+from aioquant.utils.metrics import registry
 from aioquant.tasks import LoopRunTask, SingleTask
 from aioquant.market import Orderbook, Trade, Kline
 from aioquant.utils.decorator import async_method_locker
 
 
-__all__ = ("EventCenter", "EventKline", "EventOrderbook", "EventTrade", )
+__all__ = ("EventCenter", "EventKline", "EventOrderbook", "EventTrade", "TopicRouter", )
+
+
+# Outbox backpressure policies, used when the outbox queue is full.
+BACKPRESSURE_BLOCK = "block"  # Wait until there is room in outbox, `publish_nowait` parks events in overflow.
+BACKPRESSURE_DROP_OLDEST = "drop_oldest"  # Drop the oldest event in outbox.
+BACKPRESSURE_DROP_NEWEST = "drop_newest"  # Drop the event being published.
+
+# Envelope and properties of an event delivered in process, same fields used as AMQP message.
+LocalEnvelope = namedtuple("LocalEnvelope", ("exchange_name", "routing_key", "delivery_tag"))
+LocalProperties = namedtuple("LocalProperties", ("headers", ))
 
 
 class Event:
@@ -32,11 +46,12 @@ class Event:
         exchange: Exchange name.
         queue: Queue name.
         routing_key: Routing key name.
-        pre_fetch_count: How may message per fetched, default is `1`.
+        pre_fetch_count: How may message per fetched, default is `None` to use `prefetch_count` in `RABBITMQ`
+            config (default is `1`).
         data: Message content.
     """
 
-    def __init__(self, name=None, exchange=None, queue=None, routing_key=None, pre_fetch_count=1, data=None):
+    def __init__(self, name=None, exchange=None, queue=None, routing_key=None, pre_fetch_count=None, data=None):
         """Initialize."""
         self._name = name
         self._exchange = exchange
@@ -45,6 +60,10 @@ class Event:
         self._pre_fetch_count = pre_fetch_count
         self._data = data
         self._callback = None  # Asynchronous callback function.
+        self._conflater = None  # Conflated callback, if subscribe with `conflate=True`.
+        self._timers = {}  # Callback duration histogram per routing key. e.g. `{routing_key: histogram, ... }`
+        self._trace = None  # Trace stamps carried in AMQP headers, if tracing enabled.
+        self._diff_rejected = 0  # Orderbook diffs rejected by conflated subscription.
 
     @property
     def name(self):
@@ -70,47 +89,88 @@ class Event:
     def data(self):
         return self._data
 
+    @property
+    def skipped(self):
+        """How many messages superseded by newer ones and skipped, only for conflated subscription."""
+        return self._conflater.skipped if self._conflater else 0
+
     def dumps(self):
-        d = {
-            "n": self.name,
-            "d": self.data
-        }
-        s = json.dumps(d)
-        b = zlib.compress(s.encode("utf8"))
+        c = codec.get_codec(self.exchange)
+        try:
+            b = c.encode(self.name, self.data)
+        except ValueError as e:
+            logger.warn("encode event by", c.name, "codec error:", e, "fall back to json codec.", caller=self)
+            b = codec.JsonCodec().encode(self.name, self.data)
         return b
 
     def loads(self, b):
-        b = zlib.decompress(b)
-        d = json.loads(b.decode("utf8"))
-        self._name = d.get("n")
-        self._data = d.get("d")
-        return d
+        self._name, self._data = codec.decode(b)
+        return {"n": self._name, "d": self._data}
 
     def parse(self):
         raise NotImplemented
 
-    def subscribe(self, callback, multi=False):
+    @property
+    def handler(self):
+        """Subscriber's callback function, called with parsed object, e.g. `Kline`."""
+        return self._callback
+
+    def subscribe(self, callback, multi=False, conflate=False):
         """Subscribe a event.
 
         Args:
             callback: Asynchronous callback function.
             multi: If subscribe multiple channels?
+            conflate: If only callback the latest message per routing key? Messages arrived while callback running
+                will be superseded by the newest one. Orderbook diffs are rejected (logged and dropped), a superseded
+                diff would be lost.
         """
         from aioquant import quant
         self._callback = callback
-        SingleTask.run(quant.event_center.subscribe, self, self.callback, multi)
+        if conflate:
+            self._conflater = ConflatedCallback(self.callback)
+            SingleTask.run(quant.event_center.subscribe, self, self._conflater, multi)
+        else:
+            SingleTask.run(quant.event_center.subscribe, self, self.callback, multi)
 
     def publish(self):
         """Publish a event."""
         from aioquant import quant
-        SingleTask.run(quant.event_center.publish, self)
+        if trace.enabled:
+            self._trace = trace.current()
+        quant.event_center.publish_nowait(self)
 
     async def callback(self, channel, body, envelope, properties):
+        """Callback a message received from RabbitMQ or shared memory, or a event published in process (`body` is
+        the published event object and `channel` is `None`)."""
         self._exchange = envelope.exchange_name
         self._routing_key = envelope.routing_key
-        self.loads(body)
-        o = self.parse()
-        await self._callback(o)
+        if isinstance(body, Event):
+            o = body.parse()
+        else:
+            self.loads(body)
+            o = self.parse()
+        if self._conflater and isinstance(o, Orderbook) and o.diff:
+            # A diff superseded by a newer one is lost, conflated subscribers only accept snapshots.
+            if not self._diff_rejected:
+                logger.error("orderbook diffs rejected by conflated subscription, subscribe without conflate:",
+                             self._routing_key, caller=self)
+            self._diff_rejected += 1
+            return
+        timer = self._timers.get(self._routing_key)
+        if timer is None:
+            timer = registry.histogram("aioquant_event_callback_seconds", "Duration of event callbacks.",
+                                       event=self._name, routing_key=self._routing_key,
+                                       callback=getattr(self._callback, "__qualname__", str(self._callback)))
+            self._timers[self._routing_key] = timer
+        if properties is not None:
+            trace.observe(properties.headers, self._exchange, self._routing_key)
+        loop = asyncio.get_event_loop()
+        start = loop.time()
+        try:
+            await self._callback(o)
+        finally:
+            timer.observe(loop.time() - start)
 
     def __str__(self):
         info = "EVENT: name={n}, exchange={e}, queue={q}, routing_key={r}, data={d}".format(
@@ -121,6 +181,112 @@ class Event:
         return str(self)
 
 
+class ConflatedCallback:
+    """Conflated callback, keep one slot per (exchange, routing_key) and only callback the latest message.
+
+    Attributes:
+        callback: Asynchronous callback function, e.g. `async def callback(channel, body, envelope, properties)`.
+
+    NOTE:
+        The callback for one slot won't be executed concurrently, messages arrived while callback running will be
+        saved in the slot, and only the newest one will be called back after the running callback returned.
+    """
+
+    def __init__(self, callback):
+        """Initialize."""
+        self._callback = callback
+        self._slots = {}  # Latest message per slot. e.g. `{(exchange, routing_key): (channel, body, ...), ...}`
+        self._running = set()  # Slots that callback is running.
+        self._skipped = 0  # How many messages skipped.
+
+    @property
+    def skipped(self):
+        return self._skipped
+
+    async def __call__(self, channel, body, envelope, properties):
+        self.push(channel, body, envelope, properties)
+
+    def push(self, channel, body, envelope, properties):
+        """Save message into slot, and start callback if it's not running."""
+        key = (envelope.exchange_name, envelope.routing_key)
+        if key in self._slots:
+            self._skipped += 1
+        self._slots[key] = (channel, body, envelope, properties)
+        if key not in self._running:
+            self._running.add(key)
+            SingleTask.run(self._run, key)
+
+    async def _run(self, key):
+        try:
+            while key in self._slots:
+                args = self._slots.pop(key)
+                try:
+                    await self._callback(*args)
+                except Exception as e:
+                    logger.exception("conflated callback error:", e, caller=self)
+        finally:
+            self._running.discard(key)
+
+
+class TopicRouter:
+    """In process topic router, match routing keys against binding patterns the same as AMQP topic exchange, `*`
+    matches exactly one word, `#` matches zero or more words.
+    """
+
+    def __init__(self):
+        """Initialize."""
+        self._bindings = []  # e.g. `[(exchange, pattern words, callback), ...]`
+        self._routes = {}  # Matched callbacks cache. e.g. `{(exchange, routing_key): [callback, ...], ...}`
+
+    def __len__(self):
+        return len(self._bindings)
+
+    def bind(self, exchange, pattern, callback):
+        """Bind a callback to routing key pattern of an exchange.
+
+        Args:
+            exchange: Exchange name, e.g. `Kline`.
+            pattern: Routing key pattern, e.g. `Binance.*`, `#`.
+            callback: Callback for matched events.
+        """
+        self._bindings.append((exchange, pattern.split("."), callback))
+        self._routes = {}
+
+    def route(self, exchange, routing_key):
+        """Get callbacks bound to matched patterns.
+
+        Args:
+            exchange: Exchange name.
+            routing_key: Routing key of a event, e.g. `Binance.BTCUSDT`.
+
+        Returns:
+            callbacks: Callback list, empty if nothing matched.
+        """
+        key = (exchange, routing_key)
+        callbacks = self._routes.get(key)
+        if callbacks is None:
+            words = routing_key.split(".")
+            callbacks = [callback for ex, pattern, callback in self._bindings
+                         if ex == exchange and self.match(pattern, words)]
+            self._routes[key] = callbacks
+        return callbacks
+
+    @classmethod
+    def match(cls, pattern, words):
+        """If routing key words matched pattern words."""
+        if not pattern:
+            return not words
+        head = pattern[0]
+        if head == "#":
+            rest = pattern[1:]
+            return any(cls.match(rest, words[i:]) for i in range(len(words) + 1))
+        if not words:
+            return False
+        if head != "*" and head != words[0]:
+            return False
+        return cls.match(pattern[1:], words[1:])
+
+
 class EventKline(Event):
     """Kline event.
 
@@ -160,7 +326,7 @@ class EventOrderbook(Event):
         """Initialize."""
         name = "EVENT_ORDERBOOK"
         exchange = "Orderbook"
-        routing_key = "{p}.{s}".format(p=orderbook.platform, s=orderbook.symbol)
+        routing_key = "{p}.{s}".format(p="Binance", s=orderbook.symbol)
         queue = "{sid}.{ex}.{rk}".format(sid=config.server_id, ex=exchange, rk=routing_key)
         super(EventOrderbook, self).__init__(name, exchange, queue, routing_key, data=orderbook.smart)
 
@@ -195,18 +361,109 @@ class EventTrade(Event):
 
 class EventCenter:
     """Event center.
+
+    Published events are put into a bounded outbox queue, and a single writer coroutine drains the outbox and
+    publishes events to RabbitMQ batch by batch. A batch is flushed when `flush_count` events are collected, or
+    `flush_interval` seconds passed since the first event of this batch arrived, a single event arrived at an idle
+    outbox is flushed immediately.
+
+    Subscribers in the same process are bound to an in process topic router, a event published locally is delivered
+    to them directly (parsed from the published event, without encoding and RabbitMQ round trip), and the same message
+    consumed back from RabbitMQ is skipped by its origin header. If there is no `RABBITMQ` in config file, events are
+    only delivered in process.
+
+    Market events can also be fanned out to processes on the same host through shared memory, see `aioquant.shm`.
+    The market publisher process writes events into shared memory if `publish` is `true` in `SHM` config, and
+    subscriptions of processes with `subscribe` is `true` are served by polling shared memory instead of RabbitMQ.
+
+    Config in `SHM`:
+        publish: If write published events into shared memory, default is `false`.
+        subscribe: If read subscribed events from shared memory, default is `false`.
+        exchanges: Exchanges fanned out by shared memory, default is `["Kline", "Trade", "Orderbook"]`.
+        prefix: Name prefix of shared memory segments, default is `aioquant`.
+        slots: How many events kept in ring buffer of every routing key, default is `1024`.
+        slot_size: Max bytes of an encoded event, default is `1024`.
+        poll_interval: Seconds to sleep if no event read from shared memory, default is `0.001`.
+
+    Config in `RABBITMQ`:
+        outbox_size: Max events waiting in outbox, default is `10000`.
+        flush_count: Max events published per flush, default is `500`.
+        flush_interval: Max seconds waiting for a batch to be filled, default is `0.005`.
+        backpressure: What to do if outbox is full, `block` / `drop_oldest` / `drop_newest`, default is `block`.
+            NOTE: Only `await publish()` really blocks. `publish_nowait` (used by `Event.publish`) can't block, with
+            `block` policy it parks events in an ordered overflow queue drained by the outbox writer, at most
+            `outbox_size` events, then the oldest parked event is dropped and counted in `dropped`.
+        prefetch_count: How many unacknowledged messages the consumer can hold, default is `1`.
+        ack_batch_size: Acknowledge delivered messages cumulatively every `ack_batch_size` messages, default is `1`
+            to acknowledge every message.
+            NOTE: A message is acknowledged after all its callbacks returned (at least once), except the ones only
+            pushed to conflated callbacks, which are acknowledged on dispatch since they may be superseded. In batch
+            mode, messages are acknowledged up to the oldest one still being handled.
+        ack_interval: Max milliseconds a delivered message waiting to be acknowledged in batch mode, default is `100`.
+        local_delivery: If deliver events published in process to subscribers in process directly, default is `true`.
     """
 
     def __init__(self):
-        self._host = config.rabbitmq.get("host", "localhost")
-        self._port = config.rabbitmq.get("port", 5672)
-        self._username = config.rabbitmq.get("username", "guest")
-        self._password = config.rabbitmq.get("password", "guest")
+        rabbitmq = config.rabbitmq or {}
+        self._broker = bool(config.rabbitmq)  # If publish and consume events through RabbitMQ.
+        self._host = rabbitmq.get("host", "localhost")
+        self._port = rabbitmq.get("port", 5672)
+        self._username = rabbitmq.get("username", "guest")
+        self._password = rabbitmq.get("password", "guest")
+        self._outbox_size = rabbitmq.get("outbox_size", 10000)
+        self._flush_count = rabbitmq.get("flush_count", 500)
+        self._flush_interval = rabbitmq.get("flush_interval", 0.005)
+        self._backpressure = rabbitmq.get("backpressure", BACKPRESSURE_BLOCK)
+        self._prefetch_count = rabbitmq.get("prefetch_count", 1)
+        self._ack_batch_size = rabbitmq.get("ack_batch_size", 1)
+        self._ack_interval = rabbitmq.get("ack_interval", 100)
+        self._local_delivery = rabbitmq.get("local_delivery", True) or not self._broker
+        self._origin = "{sid}.{pid}".format(sid=config.server_id, pid=os.getpid())  # Origin of published messages.
+        self._router = TopicRouter()  # Subscribers in process.
+        self._local_count = 0  # How many events delivered in process.
         self._protocol = None
         self._channel = None  # Connection channel.
         self._connected = False  # If connect success.
         self._subscribers = []  # e.g. `[(event, callback, multi), ...]`
         self._event_handler = {}  # e.g. `{"exchange:routing_key": [callback_function, ...]}`
+        self._outbox = asyncio.Queue(maxsize=self._outbox_size)  # Events waiting to be published, `(put time, event)`.
+        self._overflow = deque()  # Events published by `publish_nowait` while outbox is full, with `block` policy.
+        self._overflow_drained = asyncio.Event()  # Set if overflow queue is empty.
+        self._overflow_drained.set()
+        self._published_count = 0  # How many events published.
+        self._dropped_count = 0  # How many events dropped, because of outbox full or connection lost.
+        self._flush_times = 0  # How many times outbox flushed.
+        self._last_flush_size = 0  # How many events published in last flush.
+        self._max_flush_size = 0  # Max events published in one flush.
+        self._ack_channel = None  # The channel that pending acknowledgement belongs to.
+        self._ack_tag = None  # Latest delivery tag waiting to be acknowledged.
+        self._ack_pending = 0  # How many delivered messages waiting to be acknowledged.
+        self._ack_handling = OrderedDict()  # Delivered messages in batch mode, e.g. `{delivery_tag: handled, ... }`
+        self._outbox_wait = registry.histogram("aioquant_event_outbox_wait_seconds",
+                                               "Time events waiting in outbox before published.")
+        self._publish_latency = registry.histogram("aioquant_amqp_publish_seconds",
+                                                   "Duration of AMQP basic_publish calls.")
+        self._consumed = {}  # Consumed message counter per event handler key.
+
+        shm = config.shm or {}
+        self._shm_exchanges = shm.get("exchanges", ["Kline", "Trade", "Orderbook"])
+        self._shm_poll_interval = shm.get("poll_interval", 0.001)
+        self._shm_publisher = None  # Shared memory writer.
+        self._shm_reader = None  # Shared memory reader.
+        if shm.get("publish"):
+            from aioquant.shm import ShmPublisher
+            self._shm_publisher = ShmPublisher(shm.get("prefix", "aioquant"), shm.get("slots", 1024),
+                                               shm.get("slot_size", 1024))
+            atexit.register(self._shm_publisher.close)
+        if shm.get("subscribe"):
+            from aioquant.shm import ShmReader
+            self._shm_router = TopicRouter()
+            self._shm_reader = ShmReader(self._shm_router, shm.get("prefix", "aioquant"))
+            SingleTask.run(self._shm_poll)
+
+        if not self._broker:
+            logger.info("no RabbitMQ config, deliver events in process only.", caller=self)
+            return
 
         # Register a loop run task to check TCP connection's healthy.
         LoopRunTask.register(self._check_connection, 10)
@@ -214,6 +471,29 @@ class EventCenter:
         # Create MQ connection.
         asyncio.get_event_loop().run_until_complete(self.connect())
 
+        # Start outbox writer.
+        SingleTask.run(self._outbox_writer)
+
+    @property
+    def stats(self):
+        d = {
+            "local_delivered": self._local_count,
+            "queue_depth": self._outbox.qsize() + len(self._overflow),
+            "overflow_depth": len(self._overflow),
+            "outbox_wait_p99": self._outbox_wait.percentile(0.99),
+            "publish_latency_p99": self._publish_latency.percentile(0.99),
+            "published": self._published_count,
+            "dropped": self._dropped_count,
+            "flush_times": self._flush_times,
+            "last_flush_size": self._last_flush_size,
+            "max_flush_size": self._max_flush_size
+        }
+        if self._shm_publisher:
+            d["shm_publisher"] = self._shm_publisher.stats
+        if self._shm_reader:
+            d["shm_reader"] = self._shm_reader.stats
+        return d
+
     @async_method_locker("EventCenter.subscribe")
     async def subscribe(self, event: Event, callback=None, multi=False):
         """Subscribe a event.
@@ -225,19 +505,167 @@ class EventCenter:
         """
         logger.info("NAME:", event.name, "EXCHANGE:", event.exchange, "QUEUE:", event.queue, "ROUTING_KEY:",
                     event.routing_key, caller=self)
+        if self._local_delivery and callback:
+            self._router.bind(event.exchange, event.routing_key, callback)
+        if self._shm_reader and callback and event.exchange in self._shm_exchanges:
+            self._shm_router.bind(event.exchange, event.routing_key, self._shm_callback(callback))
+            self._shm_reader.refresh()
+            return
         self._subscribers.append((event, callback, multi))
 
     async def publish(self, event):
-        """Publish a event.
+        """Publish a event, put it into outbox. If outbox is full and backpressure policy is `block`, waiting until
+        events parked in overflow queue are drained and there is room in outbox.
 
         Args:
             event: A event to publish.
         """
+        if self._local_delivery:
+            self._deliver_local(event)
+        if self._shm_publisher and event.exchange in self._shm_exchanges:
+            self._shm_publisher.publish(event)
+        if not self._broker:
+            return
+        put_time = asyncio.get_event_loop().time()
+        while self._overflow:
+            await self._overflow_drained.wait()
+        if self._outbox.full() and not self._make_room():
+            return
+        await self._outbox.put((put_time, event))
+
+    def publish_nowait(self, event):
+        """Publish a event without waiting. If outbox is full and backpressure policy is `block`, the event is parked
+        in overflow queue (it can't block), and put into outbox by the outbox writer in order. The overflow queue holds
+        at most `outbox_size` events, the oldest parked event is dropped if it's full.
+
+        Args:
+            event: A event to publish.
+        """
+        if self._local_delivery:
+            self._deliver_local(event)
+        if self._shm_publisher and event.exchange in self._shm_exchanges:
+            self._shm_publisher.publish(event)
+        if not self._broker:
+            return
+        item = (asyncio.get_event_loop().time(), event)
+        if not self._overflow:
+            if not self._outbox.full():
+                self._outbox.put_nowait(item)
+                return
+            if not self._make_room():
+                return
+            if not self._outbox.full():
+                self._outbox.put_nowait(item)
+                return
+            self._overflow_drained.clear()
+        elif len(self._overflow) >= self._outbox_size:
+            self._overflow.popleft()  # Overflow queue is full too, drop the oldest parked event.
+            self._dropped_count += 1
+        self._overflow.append(item)  # Keep order behind parked events.
+
+    def _deliver_local(self, event):
+        """Deliver a event to subscribers in process."""
+        callbacks = self._router.route(event.exchange, event.routing_key)
+        if not callbacks:
+            return
+        envelope = LocalEnvelope(event.exchange, event.routing_key, None)
+        properties = None
+        if event._trace:
+            now = trace.now_us()
+            properties = LocalProperties(dict(event._trace, trace_publish=now, trace_consume=now))
+        for callback in callbacks:
+            if isinstance(callback, ConflatedCallback):
+                callback.push(None, event, envelope, properties)
+            else:
+                SingleTask.run(callback, None, event, envelope, properties)
+        self._local_count += 1
+
+    def _shm_callback(self, callback):
+        """Wrap a event callback, to be called with events read from shared memory."""
+        def on_event(payload, exchange, routing_key):
+            envelope = LocalEnvelope(exchange, routing_key, None)
+            if isinstance(callback, ConflatedCallback):
+                callback.push(None, payload, envelope, None)
+            else:
+                SingleTask.run(callback, None, payload, envelope, None)
+        return on_event
+
+    async def _shm_poll(self):
+        """Poll shared memory for new events, sleep `poll_interval` seconds if nothing read."""
+        while True:
+            try:
+                count = self._shm_reader.poll()
+            except Exception as e:
+                logger.exception("poll shared memory error:", e, caller=self)
+                count = 0
+            await asyncio.sleep(0 if count else self._shm_poll_interval)
+
+    def _make_room(self):
+        """Apply backpressure policy when outbox is full.
+
+        Returns:
+            If the event being published should be put into outbox, return True, otherwise return False.
+        """
+        if self._backpressure == BACKPRESSURE_DROP_NEWEST:
+            self._dropped_count += 1
+            return False
+        if self._backpressure == BACKPRESSURE_DROP_OLDEST:
+            self._outbox.get_nowait()
+            self._dropped_count += 1
+        return True
+
+    async def _outbox_writer(self):
+        """Drain outbox and publish events batch by batch."""
+        while True:
+            item = await self._outbox.get()
+            if not self._outbox.empty() and self._outbox.qsize() + 1 < self._flush_count and self._flush_interval > 0:
+                await asyncio.sleep(self._flush_interval)
+            batch = [item]
+            while len(batch) < self._flush_count and not self._outbox.empty():
+                batch.append(self._outbox.get_nowait())
+            self._drain_overflow()
+            await self._flush(batch)
+
+    def _drain_overflow(self):
+        """Move events parked in overflow queue into outbox in order, as many as there is room."""
+        if not self._overflow:
+            return
+        while self._overflow and not self._outbox.full():
+            self._outbox.put_nowait(self._overflow.popleft())
+        if not self._overflow:
+            self._overflow_drained.set()
+
+    async def _flush(self, batch):
+        """Publish a batch of events to RabbitMQ.
+
+        Args:
+            batch: Event list, e.g. `[(put time, event), ...]`.
+        """
         if not self._connected:
-            logger.warn("RabbitMQ not ready right now!", caller=self)
+            logger.warn("RabbitMQ not ready right now! dropped events:", len(batch), caller=self)
+            self._dropped_count += len(batch)
             return
-        data = event.dumps()
-        await self._channel.basic_publish(payload=data, exchange_name=event.exchange, routing_key=event.routing_key)
+        loop = asyncio.get_event_loop()
+        for index, (put_time, event) in enumerate(batch):
+            try:
+                data = event.dumps()
+                headers = {"origin": self._origin} if self._local_delivery else {}
+                if event._trace:
+                    headers.update(event._trace, trace_publish=trace.now_us())
+                properties = {"headers": headers} if headers else None
+                start = loop.time()
+                self._outbox_wait.observe(start - put_time)
+                await self._channel.basic_publish(payload=data, exchange_name=event.exchange,
+                                                  routing_key=event.routing_key, properties=properties)
+                self._publish_latency.observe(loop.time() - start)
+            except Exception as e:
+                logger.error("publish event error:", e, "dropped events:", len(batch) - index, caller=self)
+                self._dropped_count += len(batch) - index
+                break
+            self._published_count += 1
+        self._flush_times += 1
+        self._last_flush_size = len(batch)
+        self._max_flush_size = max(self._max_flush_size, len(batch))
 
     async def connect(self, reconnect=False):
         """Connect to RabbitMQ server and create default exchange.
@@ -292,27 +720,125 @@ class EventCenter:
             queue_name = result["queue"]
         await self._channel.queue_bind(queue_name=queue_name, exchange_name=event.exchange,
                                        routing_key=event.routing_key)
-        await self._channel.basic_qos(prefetch_count=event.prefetch_count)
+        await self._channel.basic_qos(prefetch_count=event.prefetch_count or self._prefetch_count)
         if callback:
             if multi:
-                await self._channel.basic_consume(callback=callback, queue_name=queue_name, no_ack=True)
+                await self._channel.basic_consume(callback=self._skip_local(callback), queue_name=queue_name,
+                                                  no_ack=True)
                 logger.info("multi message queue:", queue_name, caller=self)
             else:
                 await self._channel.basic_consume(self._on_consume_event_msg, queue_name=queue_name)
                 logger.info("queue:", queue_name, caller=self)
                 self._add_event_handler(event, callback)
 
+    def _is_local(self, properties):
+        """If the message is published by this process, and it's delivered in process already."""
+        if not self._local_delivery or properties is None or not properties.headers:
+            return False
+        return properties.headers.get("origin") == self._origin
+
+    def _skip_local(self, callback):
+        """Wrap a callback, skip messages published by this process."""
+        async def on_message(channel, body, envelope, properties):
+            if self._is_local(properties):
+                return
+            await callback(channel, body, envelope, properties)
+        return on_message
+
     async def _on_consume_event_msg(self, channel, body, envelope, properties):
+        if self._ack_batch_size > 1:
+            self._track_ack(channel, envelope.delivery_tag)
+        tasks = []
         try:
+            if self._is_local(properties):
+                return
             key = "{exchange}:{routing_key}".format(exchange=envelope.exchange_name, routing_key=envelope.routing_key)
+            counter = self._consumed.get(key)
+            if counter is None:
+                counter = registry.counter("aioquant_event_consumed_total", "Messages consumed from RabbitMQ.",
+                                           exchange=envelope.exchange_name, routing_key=envelope.routing_key)
+                self._consumed[key] = counter
+            counter.inc()
+            if properties is not None:
+                trace.stamp(properties.headers, "trace_consume")
             funcs = self._event_handler[key]
             for func in funcs:
-                SingleTask.run(func, channel, body, envelope, properties)
+                if isinstance(func, ConflatedCallback):
+                    func.push(channel, body, envelope, properties)  # Acknowledged on dispatch, may be superseded.
+                else:
+                    tasks.append(SingleTask.run(func, channel, body, envelope, properties))
         except:
             logger.error("event handle error! body:", body, caller=self)
-            return
         finally:
-            await self._channel.basic_client_ack(delivery_tag=envelope.delivery_tag)  # response ack
+            if tasks:
+                self._ack_when_done(channel, envelope.delivery_tag, tasks)
+            else:
+                await self._ack(channel, envelope.delivery_tag)
+
+    def _ack_when_done(self, channel, delivery_tag, tasks):
+        """Acknowledge a message after all callback tasks of it are done."""
+        remain = [len(tasks)]
+
+        def on_done(task):
+            remain[0] -= 1
+            if not remain[0]:
+                SingleTask.run(self._ack, channel, delivery_tag)
+        for task in tasks:
+            task.add_done_callback(on_done)
+
+    async def _ack(self, channel, delivery_tag):
+        """Acknowledge a handled message, or mark it handled to be acknowledged in batch."""
+        if self._ack_batch_size > 1:
+            await self._batch_ack(channel, delivery_tag)
+            return
+        if channel is not self._channel or not channel.is_open:
+            return  # Messages not acknowledged will be redelivered by RabbitMQ after reconnected.
+        await channel.basic_client_ack(delivery_tag=delivery_tag)  # response ack
+
+    def _track_ack(self, channel, delivery_tag):
+        """Track a delivered message in batch mode, it's not acknowledged until handled."""
+        if channel is not self._ack_channel:
+            self._ack_channel = channel
+            self._ack_pending = 0
+            self._ack_handling.clear()
+        self._ack_handling[delivery_tag] = False
+
+    async def _batch_ack(self, channel, delivery_tag):
+        """Acknowledge handled messages cumulatively, every `ack_batch_size` messages or `ack_interval`
+        milliseconds. Only messages older than the oldest one still being handled are acknowledged, delivery tags
+        increase in a channel.
+
+        Args:
+            channel: The channel that message delivered from.
+            delivery_tag: Delivery tag of the message handled.
+        """
+        if channel is not self._ack_channel or delivery_tag not in self._ack_handling:
+            return  # Channel replaced, messages not acknowledged will be redelivered.
+        self._ack_handling[delivery_tag] = True
+        pending = self._ack_pending
+        while self._ack_handling:
+            tag = next(iter(self._ack_handling))
+            if not self._ack_handling[tag]:
+                break
+            del self._ack_handling[tag]
+            self._ack_tag = tag
+            self._ack_pending += 1
+        if self._ack_pending == pending:
+            return
+        if self._ack_pending >= self._ack_batch_size:
+            await self._flush_ack()
+        elif not pending:
+            SingleTask.call_later(self._flush_ack, self._ack_interval / 1000)
+
+    async def _flush_ack(self):
+        """Acknowledge all delivered messages up to the latest delivery tag."""
+        if not self._ack_pending:
+            return
+        channel, delivery_tag = self._ack_channel, self._ack_tag
+        self._ack_pending = 0
+        if channel is not self._channel or not channel.is_open:
+            return  # Messages not acknowledged will be redelivered by RabbitMQ after reconnected.
+        await channel.basic_client_ack(delivery_tag=delivery_tag, multiple=True)
 
     def _add_event_handler(self, event: Event, callback):
         key = "{exchange}:{routing_key}".format(exchange=event.exchange, routing_key=event.routing_key)
@@ -330,4 +856,8 @@ class EventCenter:
         self._protocol = None
         self._channel = None
         self._event_handler = {}
+        self._ack_channel = None
+        self._ack_tag = None
+        self._ack_pending = 0
+        self._ack_handling.clear()
         SingleTask.run(self.connect, reconnect=True)
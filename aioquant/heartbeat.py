@@ -3,18 +3,30 @@
 """
 Server heartbeat.
 
+Loop run tasks are kept in a min-heap keyed by next due time, the ticker only wakes up when the earliest task is due
+(or heartbeat should be printed), instead of scanning every task every second. Due times are computed from the start
+time of the heartbeat against the event loop's monotonic clock, so the schedule doesn't drift, and heartbeat count is
+derived from the same clock.
+
 Author: HuangTao
 Date:   2018/04/26
 Email:  huangtao@ifclover.com
 """
 
+import heapq
 import asyncio
 
 from aioquant.utils import tools
 from aioquant.utils import logger
 from aioquant.configure import config
 
-__all__ = ("heartbeat", )
+__all__ = ("heartbeat", "OVERLAP_CONCURRENT", "OVERLAP_SKIP", "OVERLAP_QUEUE", )
+
+
+# What to do if a task is due while its previous run is still in flight.
+OVERLAP_CONCURRENT = "concurrent"  # Run it concurrently.
+OVERLAP_SKIP = "skip"  # Skip this run.
+OVERLAP_QUEUE = "queue"  # Run it after the previous run finished.
 
 
 class HeartBeat(object):
@@ -22,45 +34,68 @@ class HeartBeat(object):
     """
 
     def __init__(self):
-        self._count = 0  # Heartbeat count.
         self._interval = 1  # Heartbeat interval(second).
         self._print_interval = config.heartbeat.get("interval", 0)  # Printf heartbeat information interval(second).
         self._tasks = {}  # Loop run tasks with heartbeat service. `{task_id: {...}}`
+        self._heap = []  # Tasks ordered by due time. `[(due_time, seq, task_id), ...]`
+        self._seq = 0  # Sequence number, keep tasks with the same due time in order of registering.
+        self._start_time = None  # Loop time when heartbeat started.
+        self._next_print = None  # Loop time of next heartbeat printing.
+        self._timer = None  # Timer handle for next ticker.
 
     @property
     def count(self):
-        return self._count
+        """Heartbeat count, seconds since heartbeat started."""
+        if self._start_time is None:
+            return 0
+        return int((asyncio.get_event_loop().time() - self._start_time) // self._interval)
+
+    def reset(self):
+        """Stop ticker and remove all tasks, e.g. before running another backtest in the same process."""
+        if self._timer:
+            self._timer.cancel()
+        self.__init__()
 
     def ticker(self):
-        """Loop run ticker per self._interval.
+        """Loop run ticker, wake up when any task is due or heartbeat should be printed.
         """
-        self._count += 1
-
-        if self._print_interval > 0:
-            if self._count % self._print_interval == 0:
-                logger.info("do server heartbeat, count:", self._count, caller=self)
-
-        # Later call next ticker.
-        asyncio.get_event_loop().call_later(self._interval, self.ticker)
+        loop = asyncio.get_event_loop()
+        now = loop.time()
+        if self._start_time is None:
+            self._start_time = now
+            if self._print_interval > 0:
+                self._next_print = now + self._print_interval * self._interval
+            for task_id, task in self._tasks.items():
+                self._schedule(task_id, task, now)
+
+        if self._next_print is not None and self._next_print <= now:
+            logger.info("do server heartbeat, count:", self.count, caller=self)
+            while self._next_print <= now:
+                self._next_print += self._print_interval * self._interval
 
         # Exec tasks.
-        for task_id, task in self._tasks.items():
-            interval = task["interval"]
-            if self._count % interval != 0:
+        while self._heap and self._heap[0][0] <= now:
+            due_time, _, task_id = heapq.heappop(self._heap)
+            task = self._tasks.get(task_id)
+            if not task or task["due_time"] != due_time:
                 continue
-            func = task["func"]
-            args = task["args"]
-            kwargs = task["kwargs"]
-            kwargs["task_id"] = task_id
-            kwargs["heart_beat_count"] = self._count
-            asyncio.get_event_loop().create_task(func(*args, **kwargs))
-
-    def register(self, func, interval=1, *args, **kwargs):
+            self._run(task_id, task, now)
+            self._schedule(task_id, task, now)
+
+        # Later call next ticker, no wake up if nothing to do.
+        next_time = self._next_print
+        if self._heap and (next_time is None or self._heap[0][0] < next_time):
+            next_time = self._heap[0][0]
+        self._timer = loop.call_at(next_time, self.ticker) if next_time is not None else None
+
+    def register(self, func, interval=1, *args, overlap=OVERLAP_CONCURRENT, **kwargs):
         """Register an asynchronous callback function.
 
         Args:
             func: Asynchronous callback function.
-            interval: Loop callback interval(second), default is `1s`.
+            interval: Loop callback interval(second), default is `1s`, a float less than 1 is allowed.
+            overlap: What to do if the task is due while its previous run is still in flight,
+                `concurrent` / `skip` / `queue`, default is `concurrent`.
 
         Returns:
             task_id: Task id.
@@ -69,10 +104,31 @@ class HeartBeat(object):
             "func": func,
             "interval": interval,
             "args": args,
-            "kwargs": kwargs
+            "kwargs": kwargs,
+            "overlap": overlap,
+            "due_time": None,  # Next due time.
+            "running": 0,  # How many runs in flight.
+            "queued": 0,  # How many runs waiting for the previous run finished.
+            "stats": {
+                "runs": 0,
+                "skipped": 0,
+                "lag_last": 0,
+                "lag_max": 0,
+                "lag_total": 0,
+                "duration_last": 0,
+                "duration_max": 0,
+                "duration_total": 0
+            }
         }
         task_id = tools.get_uuid1()
         self._tasks[task_id] = t
+        if self._start_time is not None:
+            loop = asyncio.get_event_loop()
+            self._schedule(task_id, t, loop.time())
+            if self._timer is None or t["due_time"] < self._timer.when():
+                if self._timer:
+                    self._timer.cancel()
+                self._timer = loop.call_at(t["due_time"], self.ticker)
         return task_id
 
     def unregister(self, task_id):
@@ -84,5 +140,86 @@ class HeartBeat(object):
         if task_id in self._tasks:
             self._tasks.pop(task_id)
 
+    def stats(self, task_id=None):
+        """Get run statistics of tasks, lag is the delay between due time and start time, duration is the run time,
+        all in seconds.
+
+        Args:
+            task_id: Task id, default is `None` to get all tasks.
+
+        Returns:
+            stats: Statistics of a task, e.g. `{"runs": 1, "lag_avg": 0.001, ...}`, or `{task_id: {...}, ...}` for
+                all tasks.
+        """
+        if task_id is not None:
+            task = self._tasks.get(task_id)
+            return self._task_stats(task) if task else None
+        return {task_id: self._task_stats(task) for task_id, task in self._tasks.items()}
+
+    def _task_stats(self, task):
+        s = task["stats"]
+        d = {
+            "interval": task["interval"],
+            "running": task["running"],
+            "queued": task["queued"],
+            "runs": s["runs"],
+            "skipped": s["skipped"],
+            "lag_last": s["lag_last"],
+            "lag_max": s["lag_max"],
+            "lag_avg": s["lag_total"] / s["runs"] if s["runs"] else 0,
+            "duration_last": s["duration_last"],
+            "duration_max": s["duration_max"],
+            "duration_avg": s["duration_total"] / s["runs"] if s["runs"] else 0
+        }
+        return d
+
+    def _schedule(self, task_id, task, now):
+        """Push task into heap with the next due time after `now`, aligned to heartbeat start time."""
+        interval = task["interval"]
+        due_time = task["due_time"]
+        if due_time is None or due_time + interval <= now:
+            periods = int((now - self._start_time) // interval) + 1
+            due_time = self._start_time + periods * interval
+        else:
+            due_time += interval
+        task["due_time"] = due_time
+        self._seq += 1
+        heapq.heappush(self._heap, (due_time, self._seq, task_id))
+
+    def _run(self, task_id, task, now):
+        s = task["stats"]
+        if task["running"] and task["overlap"] != OVERLAP_CONCURRENT:
+            if task["overlap"] == OVERLAP_QUEUE:
+                task["queued"] += 1
+            else:
+                s["skipped"] += 1
+            return
+        lag = now - task["due_time"]
+        s["lag_last"] = lag
+        s["lag_max"] = max(s["lag_max"], lag)
+        s["lag_total"] += lag
+        asyncio.get_event_loop().create_task(self._execute(task_id, task))
+
+    async def _execute(self, task_id, task):
+        loop = asyncio.get_event_loop()
+        task["running"] += 1
+        start = loop.time()
+        try:
+            kwargs = dict(task["kwargs"], task_id=task_id, heart_beat_count=self.count)
+            await task["func"](*task["args"], **kwargs)
+        except Exception as e:
+            logger.exception("heartbeat task error:", e, caller=self)
+        finally:
+            duration = loop.time() - start
+            s = task["stats"]
+            s["runs"] += 1
+            s["duration_last"] = duration
+            s["duration_max"] = max(s["duration_max"], duration)
+            s["duration_total"] += duration
+            task["running"] -= 1
+            if task["queued"] and task_id in self._tasks:
+                task["queued"] -= 1
+                loop.create_task(self._execute(task_id, task))
+
 
 heartbeat = HeartBeat()
@@ -23,22 +23,32 @@ class Orderbook:
         asks: Asks list, e.g. `[[price, quantity], [...], ...]`
         bids: Bids list, e.g. `[[price, quantity], [...], ...]`
         timestamp: Update time, millisecond.
+        diff: If `True`, asks and bids are only the changed levels since last update, quantity 0 means this level
+            removed, default is `False`.
+        seq: Publish sequence number of snapshots and diffs of a symbol, increased by 1 per publish, so that a lost
+            diff can be detected, default is `None`.
     """
 
-    def __init__(self, platform=None, symbol=None, asks=None, bids=None, timestamp=None):
+    def __init__(self, platform=None, symbol=None, asks=None, bids=None, timestamp=None, diff=False, seq=None):
         """Initialize."""
+        self.platform = platform
         self.symbol = symbol
         self.asks = asks
         self.bids = bids
         self.timestamp = timestamp
+        self.diff = diff
+        self.seq = seq
 
     @property
     def data(self):
         d = {
+            "platform": self.platform,
             "symbol": self.symbol,
             "asks": self.asks,
             "bids": self.bids,
-            "timestamp": self.timestamp
+            "timestamp": self.timestamp,
+            "diff": self.diff,
+            "seq": self.seq
         }
         return d
 
@@ -48,7 +58,9 @@ class Orderbook:
             "s": self.symbol,
             "a": self.asks,
             "b": self.bids,
-            "t": self.timestamp
+            "t": self.timestamp,
+            "D": self.diff,
+            "q": self.seq
         }
         return d
 
@@ -57,6 +69,8 @@ class Orderbook:
         self.asks = d["a"]
         self.bids = d["b"]
         self.timestamp = d["t"]
+        self.diff = d.get("D", False)
+        self.seq = d.get("q")
         return self
 
     def __str__(self):
@@ -129,13 +143,12 @@ class Kline:
     """Kline object.
 
     """
-    def __init__(self, symbol, kline_type) -> None:
+    def __init__(self, symbol=None, kline_type=None) -> None:
         self.symbol = symbol
         self.kline_type = kline_type
         
         self.start_time = None
         self.close_time = None
-        self.symbol = None
         self.interval = None
         self.first_trade_id = None
         self.last_trade_id = None
@@ -267,22 +280,26 @@ class Market:
         callback: Asynchronous callback function for market data update.
                 e.g. async def on_event_kline_update(kline: Kline):
                         pass
+        conflate: If only callback the latest market data per symbol? If `True`, market data updated while callback
+            running will be superseded by the newest one, so that a slow callback never builds a backlog. Orderbook
+            diffs are rejected by conflated subscriptions, only snapshots are called back. Default is `False`.
     """
 
-    def __init__(self, market_type, symbol, callback):
+    def __init__(self, market_type, symbol, callback, conflate=False):
         """Initialize."""
+        self._event = None
         if symbol == "#":
             multi = True
         else:
             multi = False
         if market_type == const.MARKET_TYPE_ORDERBOOK:
             from aioquant.event import EventOrderbook
-            EventOrderbook(Orderbook(symbol)).subscribe(callback, multi)
+            self._event = EventOrderbook(Orderbook(symbol=symbol))
         elif market_type == const.MARKET_TYPE_TRADE:
             from aioquant.event import EventTrade
-            EventTrade(Trade(symbol)).subscribe(callback, multi)
+            self._event = EventTrade(Trade(symbol))
         elif market_type == const.MARKET_TYPE_TICKER:
-            EventTrade(Ticker(symbol)).subscribe(callback, multi)
+            self._event = EventTrade(Ticker(symbol))
         elif market_type in [
             const.MARKET_TYPE_KLINE_1S, const.MARKET_TYPE_KLINE_1M, const.MARKET_TYPE_KLINE_3M, 
             const.MARKET_TYPE_KLINE_5M, const.MARKET_TYPE_KLINE_15M, const.MARKET_TYPE_KLINE_30M, 
@@ -291,6 +308,13 @@ class Market:
             const.MARKET_TYPE_KLINE_1W, const.MARKET_TYPE_KLINE_1MON
             ]:
             from aioquant.event import EventKline
-            EventKline(Kline(symbol, kline_type=market_type)).subscribe(callback, multi)
+            self._event = EventKline(Kline(symbol, kline_type=market_type))
         else:
             logger.error("market_type error:", market_type, caller=self)
+            return
+        self._event.subscribe(callback, multi, conflate)
+
+    @property
+    def skipped(self):
+        """How many market data updates skipped, only for `conflate=True`."""
+        return self._event.skipped if self._event else 0
@@ -9,6 +9,7 @@ Email:  huangtao@ifclover.com
 """
 
 import json
+import operator
 
 from aioquant.utils import tools
 
@@ -58,8 +59,15 @@ class Order:
         fee: Trading fee.
         ctime: Order create time, millisecond.
         utime: Order update time, millisecond.
+
+    NOTE:
+        Orders in `OrderStore` are live records updated in place, order update callbacks are called with snapshots
+        created by `replace()`, which are never modified.
     """
 
+    __slots__ = ("platform", "account", "strategy", "order_id", "client_order_id", "action", "order_type", "symbol",
+                 "price", "quantity", "remain", "status", "avg_price", "trade_type", "fee", "ctime", "utime")
+
     def __init__(self, platform=None, account=None, strategy=None, order_id=None, client_order_id=None, symbol=None,
                  action=None, price=0, quantity=0, remain=0, status=ORDER_STATUS_NONE, avg_price=0,
                  order_type=ORDER_TYPE_LIMIT, trade_type=TRADE_TYPE_NONE, fee=0, ctime=None, utime=None):
@@ -81,6 +89,26 @@ class Order:
         self.ctime = ctime if ctime else tools.get_cur_timestamp_ms()
         self.utime = utime if utime else tools.get_cur_timestamp_ms()
 
+    def replace(self, **changes):
+        """Create a new order with some fields changed, this order is not modified.
+
+        Args:
+            changes: Fields changed, e.g. `status=ORDER_STATUS_FILLED, remain=0`.
+
+        Returns:
+            order: New order object.
+        """
+        order = Order.__new__(Order)
+        (order.platform, order.account, order.strategy, order.order_id, order.client_order_id, order.action,
+         order.order_type, order.symbol, order.price, order.quantity, order.remain, order.status, order.avg_price,
+         order.trade_type, order.fee, order.ctime, order.utime) = _get_fields(self)
+        for name, value in changes.items():
+            setattr(order, name, value)
+        return order
+
+    def __copy__(self):
+        return self.replace()
+
     @property
     def data(self):
         d = {
@@ -111,6 +139,9 @@ class Order:
     def __repr__(self):
         return str(self)
 
+
+_get_fields = operator.attrgetter(*Order.__slots__)  # All fields of an order in one call.
+
 # class Order:
 #     """Order object.
 
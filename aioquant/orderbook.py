@@ -0,0 +1,273 @@
+# -*- coding:utf-8 -*-
+
+"""
+Local orderbook engine.
+
+Maintain a local orderbook from a REST snapshot and incremental depth updates, e.g. Binance `depthUpdate` stream.
+https://github.com/binance/binance-spot-api-docs/blob/master/web-socket-streams.md#how-to-manage-a-local-order-book-correctly
+
+Price levels of each side are stored in a sorted price list (searched by `bisect`) and a `{price: quantity}` dict,
+the best price is always at the end of the list, so that best bid / ask, spread and mid price are O(1), and the
+top N levels are cached until an update touches them.
+
+Published snapshots are the top N levels, and published diffs are the changes of the top N window since the last
+publish, levels entering the window are set and levels leaving it are deleted, so that a subscriber rebuilding the
+orderbook from them always has the same top N levels as the publisher. Every snapshot and diff carries a publish
+sequence number, a subscriber drops its orderbook if a diff is lost, and waits for the next snapshot.
+"""
+
+from bisect import bisect_left
+
+from aioquant.market import Orderbook
+
+__all__ = ("LocalOrderbook", "DIFF_APPLIED", "DIFF_STALE", "DIFF_GAP", )
+
+
+# Results of applying a depth diff.
+DIFF_APPLIED = "APPLIED"  # Diff applied to orderbook.
+DIFF_STALE = "STALE"  # Diff is older than orderbook, ignored.
+DIFF_GAP = "GAP"  # Some diffs lost, orderbook should be re-synchronized from a snapshot.
+
+
+class _BookSide:
+    """One side of orderbook.
+
+    Attributes:
+        reverse: If `True`, the best price is the lowest price (asks), otherwise the highest price (bids).
+    """
+
+    def __init__(self, reverse):
+        """Initialize."""
+        self._sign = -1 if reverse else 1
+        self._keys = []  # Sorted price keys ascending, best price at the end. `key = sign * price`
+        self._levels = {}  # Quantity of each price level. e.g. `{price: quantity, ... }`
+        self._top = None  # Cached top levels. e.g. `[[price, quantity], ...]`
+        self._top_n = 0  # How many levels cached.
+
+    def __len__(self):
+        return len(self._keys)
+
+    def clear(self):
+        self._keys = []
+        self._levels = {}
+        self._top = None
+
+    def update(self, price, quantity):
+        """Update a price level, remove this level if quantity is 0."""
+        key = self._sign * price
+        if quantity == 0:
+            if price not in self._levels:
+                return
+            del self._levels[price]
+            index = bisect_left(self._keys, key)
+            del self._keys[index]
+        elif price in self._levels:
+            self._levels[price] = quantity
+            index = bisect_left(self._keys, key)
+        else:
+            index = bisect_left(self._keys, key)
+            self._keys.insert(index, key)
+            self._levels[price] = quantity
+        if self._top is not None and index >= len(self._keys) - self._top_n:
+            self._top = None
+
+    def best(self):
+        if not self._keys:
+            return None
+        price = self._sign * self._keys[-1]
+        return price, self._levels[price]
+
+    def top(self, n):
+        """Get top n levels, best price first."""
+        if self._top is None or self._top_n != n:
+            keys = self._keys[-1:-n - 1:-1]
+            self._top = [[self._sign * key, self._levels[self._sign * key]] for key in keys]
+            self._top_n = n
+        return self._top
+
+
+class LocalOrderbook:
+    """Local orderbook.
+
+    Attributes:
+        platform: Exchange platform name, e.g. `binance`.
+        symbol: Trade pair name, e.g. `BTCUSDT`.
+        depth: How many levels published by `orderbook()`, default is `20`.
+    """
+
+    def __init__(self, platform=None, symbol=None, depth=20):
+        """Initialize."""
+        self._platform = platform
+        self._symbol = symbol
+        self._depth = depth
+        self._asks = _BookSide(reverse=True)
+        self._bids = _BookSide(reverse=False)
+        self._last_update_id = None  # Last update id applied, `None` means not synchronized.
+        self._timestamp = None  # Last update time, millisecond.
+        self._window = None  # Top levels published last time, `None` if not published. e.g. `(n, asks, bids)`
+        self._seq = None  # Sequence number published last time, or received last time by a subscriber.
+
+    @property
+    def synchronized(self):
+        return self._last_update_id is not None
+
+    @property
+    def last_update_id(self):
+        return self._last_update_id
+
+    @property
+    def seq(self):
+        return self._seq
+
+    @property
+    def best_ask(self):
+        """Best ask level, `(price, quantity)` or `None`."""
+        return self._asks.best()
+
+    @property
+    def best_bid(self):
+        """Best bid level, `(price, quantity)` or `None`."""
+        return self._bids.best()
+
+    @property
+    def spread(self):
+        ask, bid = self._asks.best(), self._bids.best()
+        if not ask or not bid:
+            return None
+        return ask[0] - bid[0]
+
+    @property
+    def mid(self):
+        ask, bid = self._asks.best(), self._bids.best()
+        if not ask or not bid:
+            return None
+        return (ask[0] + bid[0]) / 2
+
+    def top(self, n=None):
+        """Get top n levels of both sides.
+
+        Args:
+            n: How many levels, default is `depth`.
+
+        Returns:
+            asks: Ask levels, lowest price first. e.g. `[[price, quantity], ...]`
+            bids: Bid levels, highest price first. e.g. `[[price, quantity], ...]`
+        """
+        n = n or self._depth
+        return self._asks.top(n), self._bids.top(n)
+
+    def reset(self):
+        """Clear orderbook, it should be re-synchronized from a snapshot."""
+        self._asks.clear()
+        self._bids.clear()
+        self._last_update_id = None
+        self._window = None
+
+    def apply_snapshot(self, last_update_id, asks, bids, timestamp=None):
+        """Rebuild orderbook from a snapshot.
+
+        Args:
+            last_update_id: Last update id of this snapshot.
+            asks: Ask levels. e.g. `[[price, quantity], ...]`
+            bids: Bid levels. e.g. `[[price, quantity], ...]`
+            timestamp: Snapshot time, millisecond.
+        """
+        self.reset()
+        for price, quantity in asks:
+            self._asks.update(float(price), float(quantity))
+        for price, quantity in bids:
+            self._bids.update(float(price), float(quantity))
+        self._last_update_id = last_update_id
+        self._timestamp = timestamp
+
+    def apply_diff(self, first_update_id, last_update_id, asks, bids, timestamp=None):
+        """Apply a depth diff.
+
+        Args:
+            first_update_id: First update id in this diff, Binance `U`.
+            last_update_id: Last update id in this diff, Binance `u`.
+            asks: Changed ask levels, level will be removed if quantity is 0. e.g. `[[price, quantity], ...]`
+            bids: Changed bid levels, level will be removed if quantity is 0. e.g. `[[price, quantity], ...]`
+            timestamp: Update time, millisecond.
+
+        Returns:
+            result: `DIFF_APPLIED` / `DIFF_STALE` / `DIFF_GAP`.
+        """
+        if self._last_update_id is None:
+            return DIFF_GAP
+        if last_update_id <= self._last_update_id:
+            return DIFF_STALE
+        if first_update_id > self._last_update_id + 1:
+            return DIFF_GAP
+        for price, quantity in asks:
+            self._asks.update(float(price), float(quantity))
+        for price, quantity in bids:
+            self._bids.update(float(price), float(quantity))
+        self._last_update_id = last_update_id
+        self._timestamp = timestamp
+        return DIFF_APPLIED
+
+    def apply_orderbook(self, orderbook: Orderbook):
+        """Apply an orderbook snapshot or diff received from `EventOrderbook`.
+
+        Args:
+            orderbook: Orderbook object.
+
+        Returns:
+            applied: `False` if it's a diff and the orderbook is not synchronized, or some diffs lost (sequence number
+                gap, the orderbook is dropped), wait for the next snapshot.
+        """
+        if not orderbook.diff:
+            self.reset()
+            self._last_update_id = 0
+        elif self._last_update_id is None:
+            return False
+        elif orderbook.seq is not None and self._seq is not None and orderbook.seq != self._seq + 1:
+            self.reset()
+            return False
+        self._seq = orderbook.seq
+        for price, quantity in orderbook.asks:
+            self._asks.update(float(price), float(quantity))
+        for price, quantity in orderbook.bids:
+            self._bids.update(float(price), float(quantity))
+        self._timestamp = orderbook.timestamp
+        return True
+
+    def orderbook(self, n=None):
+        """Get an orderbook snapshot of top n levels.
+
+        Args:
+            n: How many levels, default is `depth`.
+
+        Returns:
+            orderbook: Orderbook object.
+        """
+        n = n or self._depth
+        asks, bids = self.top(n)
+        self._window = (n, dict(asks), dict(bids))
+        self._seq = 0 if self._seq is None else self._seq + 1
+        return Orderbook(self._platform, self._symbol, list(asks), list(bids), self._timestamp, seq=self._seq)
+
+    def diff(self):
+        """Get changes of the top levels window since last `diff()` or `orderbook()`, levels entering the window are
+        set and levels leaving it are deleted.
+
+        Returns:
+            orderbook: Orderbook object with `diff=True`, quantity 0 means this level removed.
+        """
+        if self._window is None:
+            raise ValueError("orderbook snapshot not published yet")
+        n, old_asks, old_bids = self._window
+        asks, bids = self.top(n)
+        new_asks, new_bids = dict(asks), dict(bids)
+        self._window = (n, new_asks, new_bids)
+        self._seq += 1
+        return Orderbook(self._platform, self._symbol, _window_diff(old_asks, new_asks),
+                         _window_diff(old_bids, new_bids), self._timestamp, diff=True, seq=self._seq)
+
+
+def _window_diff(old, new):
+    """Levels changed from `old` window to `new` window, e.g. `[[price, quantity], ...]`, quantity 0 is removed."""
+    levels = [[price, quantity] for price, quantity in new.items() if old.get(price) != quantity]
+    levels.extend([price, 0] for price in old if price not in new)
+    return levels
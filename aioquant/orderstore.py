@@ -0,0 +1,218 @@
+# -*- coding:utf-8 -*-
+
+"""
+Order store.
+
+Live orders are indexed by `(symbol, order_id)`, and by client order id, status, symbol and strategy, every lookup is a
+dict lookup, no scan. Order ids are only unique per symbol on Binance, so an order is always identified together with
+its symbol.
+
+An update modifies the live order in place, no order is allocated or copied per update, so orders handed out are live
+records changed by later updates, take a snapshot by `Order.replace()` (or `copy.copy`) to keep the state of a moment.
+Filled, canceled and failed orders are moved from live orders into a bounded archive, the oldest archived orders are
+dropped, or appended into a spill file (one JSON per line) if configured.
+"""
+
+import json
+from collections import OrderedDict
+
+from aioquant.utils import logger
+from aioquant.order import ORDER_STATUS_FILLED, ORDER_STATUS_CANCELED, ORDER_STATUS_FAILED
+
+__all__ = ("OrderStore", )
+
+
+FINAL_STATUS = frozenset((ORDER_STATUS_FILLED, ORDER_STATUS_CANCELED, ORDER_STATUS_FAILED))
+
+
+class OrderStore:
+    """Order store.
+
+    Attributes:
+        archive_size: Max finished orders kept in memory, default is `10000`.
+        spill_file: File to append finished orders dropped from archive, default is `None`, dropped orders are lost.
+    """
+
+    def __init__(self, archive_size=10000, spill_file=None):
+        """Initialize."""
+        self._archive_size = archive_size
+        self._spill_file = spill_file
+        self._spill = None  # Spill file object, opened when the first order spilled.
+        self._orders = {}  # Live orders. e.g. `{(symbol, order_id): order, ... }`
+        self._client_ids = {}  # e.g. `{client_order_id: (symbol, order_id), ... }`
+        # Secondary indexes, keys of live orders, in order of adding. e.g. `{status: {key: None, ... }, ... }`
+        self._by_status = {}
+        self._by_symbol = {}
+        self._by_strategy = {}
+        self._archive = OrderedDict()  # Finished orders, the oldest first. e.g. `{(symbol, order_id): order, ... }`
+        self._archive_client_ids = {}  # e.g. `{client_order_id: (symbol, order_id), ... }`
+        self._spilled = 0
+
+    def __len__(self):
+        return len(self._orders)
+
+    @property
+    def stats(self):
+        """Live orders, archived orders and orders spilled into file."""
+        return {"live": len(self._orders), "archived": len(self._archive), "spilled": self._spilled}
+
+    def add(self, order):
+        """Add an order, it replaces the order with the same symbol and order id.
+
+        Returns:
+            order: The order added.
+        """
+        key = (order.symbol, order.order_id)
+        old = self._orders.get(key)
+        if old is not None:
+            return self.update(old, **{name: getattr(order, name) for name in order.__slots__})
+        if order.status in FINAL_STATUS:
+            self._put_archive(key, order)
+            return order
+        self._orders[key] = order
+        if order.client_order_id:
+            self._client_ids[order.client_order_id] = key
+        self._index(self._by_status, order.status, key)
+        self._index(self._by_symbol, order.symbol, key)
+        self._index(self._by_strategy, order.strategy, key)
+        return order
+
+    def update(self, order, **changes):
+        """Update a live order in place, and archive it if it's finished.
+
+        Args:
+            order: Live order in this store.
+            changes: Fields changed, e.g. `status=ORDER_STATUS_FILLED, remain=0`.
+
+        Returns:
+            order: The live order updated.
+        """
+        key = (order.symbol, order.order_id)
+        live = self._orders.get(key)
+        if live is None:
+            return self.add(order.replace(**changes))
+        old_status = live.status
+        for name, value in changes.items():
+            setattr(live, name, value)
+        status = live.status
+        if status != old_status:
+            del self._by_status[old_status][key]  # Status index is never cleaned up, there are a few statuses.
+            if status in FINAL_STATUS:
+                self._remove(key, live)
+                self._put_archive(key, live)
+                return live
+            keys = self._by_status.get(status)
+            if keys is None:
+                keys = self._by_status[status] = {}
+            keys[key] = None
+        return live
+
+    def discard(self, order):
+        """Remove a live order without archiving it, e.g. its symbol is not traded any more.
+
+        Returns:
+            order: The order removed, or `None` if it's not a live order.
+        """
+        key = (order.symbol, order.order_id)
+        order = self._orders.get(key)
+        if order is None:
+            return None
+        del self._by_status[order.status][key]
+        self._remove(key, order)
+        return order
+
+    def get(self, symbol, order_id):
+        """Get a live order, or `None`."""
+        return self._orders.get((symbol, order_id))
+
+    def find(self, symbol, order_id):
+        """Get a live or archived order, or `None`."""
+        key = (symbol, order_id)
+        return self._orders.get(key) or self._archive.get(key)
+
+    def get_by_client_order_id(self, client_order_id):
+        """Get a live or archived order by client order id, or `None`."""
+        key = self._client_ids.get(client_order_id)
+        if key:
+            return self._orders[key]
+        key = self._archive_client_ids.get(client_order_id)
+        return self._archive[key] if key else None
+
+    def orders(self):
+        """All live orders."""
+        return list(self._orders.values())
+
+    def by_status(self, status):
+        """Live orders of a status."""
+        return [self._orders[key] for key in self._by_status.get(status, ())]
+
+    def by_symbol(self, symbol):
+        """Live orders of a symbol."""
+        return [self._orders[key] for key in self._by_symbol.get(symbol, ())]
+
+    def by_strategy(self, strategy):
+        """Live orders of a strategy."""
+        return [self._orders[key] for key in self._by_strategy.get(strategy, ())]
+
+    def archived(self, count=None):
+        """Archived orders, the latest first.
+
+        Args:
+            count: How many orders returned, default is all.
+        """
+        orders = []
+        for order in reversed(self._archive.values()):
+            if count is not None and len(orders) >= count:
+                break
+            orders.append(order)
+        return orders
+
+    def close(self):
+        """Flush spill file."""
+        if self._spill:
+            self._spill.close()
+            self._spill = None
+
+    def _remove(self, key, order):
+        del self._orders[key]
+        if order.client_order_id and self._client_ids.get(order.client_order_id) == key:
+            del self._client_ids[order.client_order_id]
+        self._unindex(self._by_symbol, order.symbol, key)
+        self._unindex(self._by_strategy, order.strategy, key)
+
+    def _put_archive(self, key, order):
+        self._archive.pop(key, None)
+        self._archive[key] = order
+        if order.client_order_id:
+            self._archive_client_ids[order.client_order_id] = key
+        while len(self._archive) > self._archive_size:
+            old_key, old = self._archive.popitem(last=False)
+            if old.client_order_id and self._archive_client_ids.get(old.client_order_id) == old_key:
+                del self._archive_client_ids[old.client_order_id]
+            self._spill_order(old)
+
+    def _spill_order(self, order):
+        if not self._spill_file:
+            return
+        try:
+            if not self._spill:
+                self._spill = open(self._spill_file, "a")
+            self._spill.write(json.dumps(order.data) + "\n")
+            self._spilled += 1
+        except Exception as e:
+            logger.error("spill order error:", e, caller=self)
+
+    @staticmethod
+    def _index(index, value, key):
+        keys = index.get(value)
+        if keys is None:
+            keys = index[value] = {}
+        keys[key] = None
+
+    @staticmethod
+    def _unindex(index, value, key):
+        keys = index.get(value)
+        if keys is not None:
+            keys.pop(key, None)
+            if not keys:
+                del index[value]
@@ -0,0 +1,213 @@
+# -*- coding:utf-8 -*-
+
+"""
+Position and PnL engine.
+
+Positions are updated incrementally by fills (e.g. Binance `executionReport` with execution type `TRADE`), average
+cost and realized PnL are updated in O(1) per fill, and unrealized PnL is updated by marking a position to the latest
+kline or trade price, no trade history is kept or rescanned.
+
+Positions are netted per symbol: a buy reduces short quantity before adding long quantity, and vice versa. PnL and
+fees are in quote asset, fees paid in base asset reduce the quantity received, fees paid in other assets (e.g. BNB)
+are only counted in `fees`.
+
+Positions and the last trade id of every symbol are saved into a checkpoint file periodically, and restored after
+restart, fills with a trade id not greater than the last one are skipped, so that trades missed while stopped can be
+applied from the last trade id, without replaying the whole trade history.
+"""
+
+import os
+import copy
+import json
+
+from aioquant.utils import tools
+from aioquant.utils import logger
+from aioquant.position import Position
+from aioquant.tasks import SingleTask, LoopRunTask
+from aioquant.order import ORDER_ACTION_BUY
+
+__all__ = ("PnlEngine", )
+
+
+class PnlEngine:
+    """Position and PnL engine.
+
+    Attributes:
+        platform: Exchange platform name, e.g. `binance`.
+        account: Trading account name.
+        strategy: Strategy name.
+        position_update_callback: `async def on_position_update_callback(position: Position): pass`, called with a
+            copy of position after a fill, or after a mark if position is not flat.
+        checkpoint_file: Checkpoint file path, default is `None`, no checkpoint.
+        checkpoint_interval: Save checkpoint every `checkpoint_interval` seconds if positions changed, default is `60`.
+    """
+
+    def __init__(self, platform=None, account=None, strategy=None, position_update_callback=None,
+                 checkpoint_file=None, checkpoint_interval=60):
+        """Initialize."""
+        self._platform = platform
+        self._account = account
+        self._strategy = strategy
+        self._position_update_callback = position_update_callback
+        self._checkpoint_file = checkpoint_file
+        self._positions = {}  # e.g. `{symbol: Position, ... }`
+        self._trade_ids = {}  # Last trade id applied. e.g. `{symbol: 12345, ... }`
+        self._fees = {}  # Fees paid in every asset. e.g. `{"BNB": 0.01, ... }`
+        self._held = {}  # Fills held while trades missed being applied. e.g. `{symbol: [fill, ... ], ... }`
+        self._dirty = False  # If changed since last checkpoint.
+        if checkpoint_file:
+            self._load_checkpoint()
+            LoopRunTask.register(self._checkpoint, checkpoint_interval)
+
+    @property
+    def positions(self):
+        return self._positions
+
+    @property
+    def fees(self):
+        return dict(self._fees)
+
+    def get_position(self, symbol):
+        """Get position of a symbol, or `None`."""
+        return self._positions.get(symbol)
+
+    def last_trade_id(self, symbol):
+        """Last trade id applied of a symbol, or `None`."""
+        return self._trade_ids.get(symbol)
+
+    def on_fill(self, symbol, action, quantity, price, fee=0, fee_asset=None, trade_id=None, timestamp=None,
+                replay=False):
+        """Apply a fill.
+
+        Args:
+            symbol: Symbol name, e.g. `BTCUSDT`.
+            action: Trade side, `BUY` / `SELL`.
+            quantity: Filled quantity.
+            price: Filled price.
+            fee: Fee of this fill.
+            fee_asset: Fee asset, e.g. `USDT` / `BTC` / `BNB`.
+            trade_id: Trade id, increasing per symbol, fills with a trade id applied already are skipped.
+            timestamp: Trade time, millisecond.
+            replay: If a trade missed, it's applied even if fills of the symbol are held.
+
+        Returns:
+            position: Position updated, or `None` if skipped or held.
+        """
+        held = self._held.get(symbol)
+        if held is not None and not replay:
+            held.append((symbol, action, quantity, price, fee, fee_asset, trade_id, timestamp))
+            return None
+        if trade_id is not None:
+            last = self._trade_ids.get(symbol)
+            if last is not None and trade_id <= last:
+                return None
+            self._trade_ids[symbol] = trade_id
+
+        position = self._positions.get(symbol)
+        if position is None:
+            position = self._positions[symbol] = Position(self._platform, self._account, self._strategy, symbol)
+        raw_symbol = symbol.replace("/", "")
+        if fee and fee_asset:
+            self._fees[fee_asset] = self._fees.get(fee_asset, 0) + fee
+            if raw_symbol.endswith(fee_asset):  # Quote asset.
+                position.fee += fee
+                position.realized_pnl -= fee
+            elif raw_symbol.startswith(fee_asset):  # Base asset, received quantity reduced.
+                quantity = quantity - fee if action == ORDER_ACTION_BUY else quantity + fee
+
+        net = position.long_quantity - position.short_quantity
+        avg = position.long_avg_price if net > 0 else position.short_avg_price
+        delta = quantity if action == ORDER_ACTION_BUY else -quantity
+        if net == 0 or (net > 0) == (delta > 0):  # Open or add.
+            avg = (abs(net) * avg + abs(delta) * price) / (abs(net) + abs(delta))
+            net += delta
+        else:  # Reduce, close, or reverse.
+            closed = min(abs(delta), abs(net))
+            position.realized_pnl += closed * (price - avg) * (1 if net > 0 else -1)
+            net += delta
+            if abs(net) < 1e-12:
+                net, avg = 0, 0
+            elif (net > 0) == (delta > 0):  # Reversed, the rest is opened at this price.
+                avg = price
+        if net > 0:
+            position.long_quantity, position.long_avg_price = net, avg
+            position.short_quantity, position.short_avg_price = 0, 0
+        else:
+            position.short_quantity, position.short_avg_price = -net, avg
+            position.long_quantity, position.long_avg_price = 0, 0
+        position.last_price = price
+        position.unrealized_pnl = net * (price - avg)
+        position.timestamp = timestamp or tools.get_cur_timestamp_ms()
+        self._dirty = True
+        self._notify(position)
+        return position
+
+    def mark(self, symbol, price, timestamp=None):
+        """Mark position of a symbol to the latest price, e.g. kline close price or trade price.
+
+        Returns:
+            position: Position updated, or `None` if no position of the symbol.
+        """
+        position = self._positions.get(symbol)
+        if position is None:
+            return None
+        position.last_price = price
+        if position.long_quantity:
+            position.unrealized_pnl = position.long_quantity * (price - position.long_avg_price)
+        elif position.short_quantity:
+            position.unrealized_pnl = position.short_quantity * (position.short_avg_price - price)
+        else:
+            return position
+        position.timestamp = timestamp or tools.get_cur_timestamp_ms()
+        self._notify(position)
+        return position
+
+    def hold(self, symbol):
+        """Hold fills of a symbol, until `release`, e.g. while trades missed are being applied."""
+        self._held.setdefault(symbol, [])
+
+    def release(self, symbol):
+        """Apply fills held, in order of trade id."""
+        held = self._held.pop(symbol, [])
+        held.sort(key=lambda fill: -1 if fill[6] is None else fill[6])
+        for fill in held:
+            self.on_fill(*fill)
+
+    def checkpoint(self):
+        """Save positions into checkpoint file."""
+        if not self._checkpoint_file:
+            return
+        data = {
+            "positions": {symbol: position.data for symbol, position in self._positions.items()},
+            "trade_ids": self._trade_ids,
+            "fees": self._fees,
+            "timestamp": tools.get_cur_timestamp_ms()
+        }
+        tmp = self._checkpoint_file + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp, self._checkpoint_file)
+        self._dirty = False
+
+    async def _checkpoint(self, *args, **kwargs):
+        if not self._dirty:
+            return
+        try:
+            self.checkpoint()
+        except Exception as e:
+            logger.error("save checkpoint error:", e, caller=self)
+
+    def _load_checkpoint(self):
+        if not os.path.isfile(self._checkpoint_file):
+            return
+        with open(self._checkpoint_file) as f:
+            data = json.load(f)
+        for symbol, d in data["positions"].items():
+            self._positions[symbol] = Position(self._platform, self._account, self._strategy, symbol).load(d)
+        self._trade_ids = data["trade_ids"]
+        self._fees = data.get("fees", {})
+        logger.info("checkpoint loaded, positions:", len(self._positions), "time:", data["timestamp"], caller=self)
+
+    def _notify(self, position):
+        if self._position_update_callback:
+            SingleTask.run(self._position_update_callback, copy.copy(position))
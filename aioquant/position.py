@@ -21,6 +21,10 @@ class Position:
         account: Trading account name, e.g. `test@gmail.com`.
         strategy: Strategy name, e.g. `my_strategy`.
         symbol: Trading pair name, e.g. `ETH/BTC`.
+
+    NOTE:
+        Positions maintained by `aioquant.pnl.PnlEngine` are netted: only one of long and short quantity is nonzero,
+        PnL and fees are in quote asset.
     """
 
     def __init__(self, platform=None, account=None, strategy=None, symbol=None):
@@ -33,8 +37,17 @@ class Position:
         self.long_quantity = 0  # Long quantity.
         self.long_avg_price = 0  # Long average price.
         self.liquid_price = 0  # Liquidation price.
+        self.realized_pnl = 0  # Realized PnL, fees paid in quote asset deducted.
+        self.unrealized_pnl = 0  # Unrealized PnL, marked to `last_price`.
+        self.fee = 0  # Fees paid in quote asset.
+        self.last_price = 0  # Price of the latest mark.
         self.timestamp = None  # Update timestamp(millisecond).
 
+    @property
+    def quantity(self):
+        """Net quantity, positive for long, negative for short."""
+        return self.long_quantity - self.short_quantity
+
     def update(self, short_quantity=0, short_avg_price=0, long_quantity=0, long_avg_price=0, liquid_price=0,
                timestamp=None):
         self.short_quantity = short_quantity
@@ -56,10 +69,21 @@ class Position:
             "long_quantity": self.long_quantity,
             "long_avg_price": self.long_avg_price,
             "liquid_price": self.liquid_price,
+            "realized_pnl": self.realized_pnl,
+            "unrealized_pnl": self.unrealized_pnl,
+            "fee": self.fee,
+            "last_price": self.last_price,
             "timestamp": self.timestamp
         }
         return d
 
+    def load(self, d):
+        """Restore from `data`."""
+        for name, value in d.items():
+            if name in self.__dict__:
+                setattr(self, name, value)
+        return self
+
     def __str__(self):
         info = json.dumps(self.data)
         return info
@@ -23,13 +23,16 @@ class AIOQuant:
     def __init__(self) -> None:
         self.loop = None
         self.event_center = None
+        self.recorder = None
 
     def _initialize(self, config_file, key_file):
         """Initialize."""
         self._get_event_loop()
         self._load_settings(config_file, key_file)
         self._init_logger()
+        self._init_metrics()
         self._init_event_center()
+        self._init_recorder()
         self._do_heartbeat()
         return self
 
@@ -77,13 +80,25 @@ class AIOQuant:
         """Initialize logger."""
         logger.initLogger(**config.log)
 
-    def _init_event_center(self) -> None:
-        """Initialize event center."""
-        if not config.rabbitmq:
+    def _init_metrics(self) -> None:
+        """Initialize metrics probe and endpoint."""
+        if not config.metrics:
             return
+        from aioquant.utils import metrics
+        metrics.start()
+
+    def _init_event_center(self) -> None:
+        """Initialize event center, events are delivered in process only if there is no RabbitMQ config."""
         from aioquant.event import EventCenter
         self.event_center = EventCenter()
 
+    def _init_recorder(self) -> None:
+        """Initialize market data recorder, if `RECORDER` configured."""
+        if not config.recorder:
+            return
+        from aioquant import recorder
+        self.recorder = recorder.start()
+
     def _do_heartbeat(self) -> None:
         """Start server heartbeat."""
         from aioquant.heartbeat import heartbeat
@@ -0,0 +1,191 @@
+# -*- coding:utf-8 -*-
+
+"""
+Market data recorder.
+
+Subscribe klines, trades and orderbooks through `Market`, and append them into a `TickStore`. Market callbacks only
+append a tuple into a buffer, buffered rows are converted into column arrays and written by a single background
+thread in batches, so that disk I/O and compression never block the event loop.
+
+Config in `RECORDER`:
+    path: Store root directory, e.g. `./data`.
+    symbols: Symbols to be recorded, e.g. `["BTCUSDT"]`.
+    markets: Market types to be recorded, e.g. `["kline_1m", "trade", "orderbook"]`, default is `["kline_1m"]`.
+    depth: How many orderbook levels recorded, default is `5`.
+    flush_count: Write buffered rows of a symbol if rows reach this count, default is `1000`.
+    flush_interval: Write all buffered rows every `flush_interval` seconds, default is `1`.
+    segment_rows: Max rows of a store segment, default is `1000000`.
+    compress_level: zlib compress level of sealed segments, default is `6`.
+
+NOTE:
+    Only closed klines are recorded (Binance `x` is `true`), updates of a kline not closed yet are skipped.
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from aioquant import const
+from aioquant.utils import logger
+from aioquant.market import Market
+from aioquant.configure import config
+from aioquant.tasks import LoopRunTask
+from aioquant.heartbeat import OVERLAP_SKIP
+from aioquant.order import ORDER_ACTION_BUY
+from aioquant.orderbook import LocalOrderbook
+from aioquant.tickstore import TickStore, schema_of
+
+__all__ = ("Recorder", "start", )
+
+
+class Recorder:
+    """Market data recorder.
+
+    Attributes:
+        path: Store root directory.
+        symbols: Symbols to be recorded, e.g. `["BTCUSDT"]`.
+        markets: Market types to be recorded, e.g. `["kline_1m", "trade", "orderbook"]`.
+        depth: How many orderbook levels recorded, default is `5`.
+        flush_count: Write buffered rows of a symbol if rows reach this count, default is `1000`.
+        flush_interval: Write all buffered rows every `flush_interval` seconds, default is `1`.
+        segment_rows: Max rows of a store segment, default is `1000000`.
+        compress_level: zlib compress level of sealed segments, default is `6`.
+    """
+
+    def __init__(self, path, symbols, markets=(const.MARKET_TYPE_KLINE_1M, ), depth=5, flush_count=1000,
+                 flush_interval=1, segment_rows=1000000, compress_level=6):
+        """Initialize."""
+        self._store = TickStore(path, segment_rows, compress_level)
+        self._depth = depth
+        self._flush_count = flush_count
+        self._executor = ThreadPoolExecutor(1, thread_name_prefix="aioquant-recorder")  # Keep writing order.
+        self._buffers = {}  # Rows not written yet. e.g. `{(kind, symbol): [row, ...], ... }`
+        self._orderbooks = {}  # Local orderbook per symbol, orderbook events may be diffs. e.g. `{symbol: book}`
+        self._klines = set(m for m in markets if m.startswith(const.MARKET_TYPE_KLINE))  # e.g. `{"kline_1m"}`
+        self._pending = 0  # Batches submitted but not written yet.
+        self._stats = {"rows": 0, "written": 0, "errors": 0}
+        self._closed = False
+
+        for symbol in symbols:
+            if self._klines:
+                Market(min(self._klines), symbol, self.on_kline)  # Klines of all intervals share one channel.
+            for market_type in markets:
+                if market_type in self._klines:
+                    continue
+                if market_type == const.MARKET_TYPE_TRADE:
+                    callback = self.on_trade
+                elif market_type == const.MARKET_TYPE_ORDERBOOK:
+                    callback = self.on_orderbook
+                else:
+                    logger.error("market type not supported by recorder:", market_type, caller=self)
+                    continue
+                Market(market_type, symbol, callback)
+        self._flush_task_id = LoopRunTask.register(self._flush_all, flush_interval, overlap=OVERLAP_SKIP)
+
+    @property
+    def store(self):
+        return self._store
+
+    @property
+    def stats(self):
+        """Rows received, rows written, and write errors."""
+        return dict(self._stats, pending=self._pending)
+
+    async def on_kline(self, kline):
+        kind = "kline_" + kline.interval
+        if not kline.is_closed or kind not in self._klines:
+            return
+        row = (kline.start_time, kline.close_time, float(kline.open), float(kline.high), float(kline.low),
+               float(kline.close), float(kline.base_asset_volume), float(kline.quote_asset_volume),
+               float(kline.taker_buy_base_asset_volume), float(kline.taker_buy_quote_asset_volume), kline.trade_num,
+               kline.first_trade_id, kline.last_trade_id)
+        self._add(kind, kline.symbol, row)
+
+    async def on_trade(self, trade):
+        side = 1 if trade.action == ORDER_ACTION_BUY else -1
+        row = (trade.timestamp, float(trade.price), float(trade.quantity), side)
+        self._add(const.MARKET_TYPE_TRADE, trade.symbol, row)
+
+    async def on_orderbook(self, orderbook):
+        book = self._orderbooks.get(orderbook.symbol)
+        if book is None:
+            book = self._orderbooks[orderbook.symbol] = LocalOrderbook(symbol=orderbook.symbol, depth=self._depth)
+        if orderbook.diff and not book.synchronized:
+            return  # Wait for a full snapshot.
+        book.apply_orderbook(orderbook)
+        asks, bids = book.top(self._depth)
+        nan = float("nan")
+        padding = [nan] * self._depth
+        row = [orderbook.timestamp]
+        for levels in (asks, bids):
+            row.extend(([level[0] for level in levels] + padding)[:self._depth])
+            row.extend(([level[1] for level in levels] + padding)[:self._depth])
+        self._add(const.MARKET_TYPE_ORDERBOOK, orderbook.symbol, tuple(row))
+
+    def _add(self, kind, symbol, row):
+        if self._closed:
+            return
+        key = (kind, symbol)
+        rows = self._buffers.get(key)
+        if rows is None:
+            rows = self._buffers[key] = []
+        rows.append(row)
+        self._stats["rows"] += 1
+        if len(rows) >= self._flush_count:
+            self._submit(key)
+
+    def _submit(self, key):
+        """Hand over buffered rows of a partition to writer thread."""
+        rows = self._buffers.pop(key, None)
+        if not rows:
+            return
+        kind, symbol = key
+        loop = asyncio.get_event_loop()
+        self._pending += 1
+        future = self._executor.submit(self._store.append, kind, symbol, rows, schema_of(kind, self._depth))
+        future.add_done_callback(lambda f: loop.is_closed() or loop.call_soon_threadsafe(self._on_written, f))
+
+    def _on_written(self, future):
+        self._pending -= 1
+        error = future.exception()
+        if error:
+            self._stats["errors"] += 1
+            logger.error("write market data error:", error, caller=self)
+        else:
+            self._stats["written"] += future.result()
+
+    async def _flush_all(self, *args, **kwargs):
+        for key in list(self._buffers):
+            self._submit(key)
+        if self._pending > 100:
+            logger.warn("market data writer falls behind, pending batches:", self._pending, caller=self)
+
+    def close(self, seal=False):
+        """Write all buffered rows and close store, it blocks until all rows written.
+
+        Args:
+            seal: If seal (compress) active segments, default is `False`, they will be appended after restart.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        LoopRunTask.unregister(self._flush_task_id)
+        for key, rows in self._buffers.items():
+            self._executor.submit(self._store.append, key[0], key[1], rows, schema_of(key[0], self._depth))
+        self._buffers = {}
+        self._executor.submit(self._store.seal if seal else self._store.close)
+        self._executor.shutdown(wait=True)
+
+
+def start():
+    """Start a recorder configured by `RECORDER` in config file.
+
+    Returns:
+        recorder: Recorder object.
+    """
+    import atexit
+    settings = dict(config.recorder)
+    path = settings.pop("path", "./data")
+    symbols = settings.pop("symbols", [])
+    recorder = Recorder(path, symbols, **settings)
+    atexit.register(recorder.close)
+    return recorder
@@ -0,0 +1,255 @@
+# -*- coding:utf-8 -*-
+
+"""
+Pre-trade risk gate.
+
+Every order is checked before it's sent to exchange: orders per second, open orders, notional of open orders and
+position limit per symbol, and price band around the latest trade or kline close price. Checks only compare counters
+kept incrementally (by order updates, fills and prices) against limits computed in advance, e.g. the price band is
+turned into a low / high price once per price update, so that a check costs a few dict lookups and comparisons,
+no order or trade is scanned.
+
+Open orders are tracked by client order id: an order passed is reserved by `check` immediately, so that orders sent
+concurrently before any update from exchange are counted, and settled by `on_order` when its updates come, or by
+`release` if it's not created.
+"""
+
+import time
+
+from aioquant.error import RiskError
+from aioquant.orderstore import FINAL_STATUS
+from aioquant.order import ORDER_ACTION_BUY
+
+__all__ = ("RiskGate", )
+
+
+RISK_MAX_ORDERS_PER_SECOND = "max_orders_per_second"
+RISK_MAX_OPEN_ORDERS = "max_open_orders"
+RISK_MAX_NOTIONAL = "max_notional"
+RISK_MAX_POSITION = "max_position"
+RISK_PRICE_BAND = "price_band"
+RISK_NO_PRICE = "no_price"
+
+SYMBOL_LIMITS = ("max_open_orders", "max_notional", "max_position", "price_band")
+
+
+class _SymbolRisk:
+    """Limits and counters of a symbol."""
+
+    __slots__ = ("symbol", "max_open_orders", "max_notional", "max_position", "price_band", "open_orders",
+                 "open_notional", "open_buy", "open_sell", "position", "last_price", "low", "high")
+
+    def __init__(self, symbol, limits):
+        self.symbol = symbol
+        self.max_open_orders = limits.get("max_open_orders")
+        self.max_notional = limits.get("max_notional")
+        self.max_position = limits.get("max_position")
+        self.price_band = limits.get("price_band")
+        self.open_orders = 0
+        self.open_notional = 0.0  # Notional of open orders, in quote asset.
+        self.open_buy = 0.0  # Remaining quantity of open buy orders.
+        self.open_sell = 0.0  # Remaining quantity of open sell orders.
+        self.position = 0.0  # Net position, long is positive and short is negative.
+        self.last_price = None
+        self.low = None  # Price band, `last_price * (1 - price_band)`.
+        self.high = None  # Price band, `last_price * (1 + price_band)`.
+
+
+class RiskGate:
+    """Pre-trade risk gate.
+
+    Attributes:
+        max_orders_per_second: Max orders sent per second, a token bucket refilled continuously, default is `None`,
+            no limit.
+        max_open_orders: Max open orders of all symbols, default is `None`, no limit.
+        max_notional: Max notional (price * remaining quantity) of open orders per symbol, in quote asset, the order
+            checked included, default is `None`, no limit.
+        max_position: Max absolute net position per symbol, in base asset, open orders of the same side included,
+            default is `None`, no limit.
+        price_band: Max deviation of limit price from the latest price, e.g. `0.05` is 5%, limit orders are rejected
+            before any price arrives, default is `None`, no limit.
+        symbols: Limits of some symbols, override the limits above, e.g.
+            `{"BTCUSDT": {"max_notional": 10000, "max_position": 0.5, "max_open_orders": 20, "price_band": 0.02}}`.
+        clock: Clock in seconds for orders per second, default is `time.monotonic`.
+    """
+
+    def __init__(self, max_orders_per_second=None, max_open_orders=None, max_notional=None, max_position=None,
+                 price_band=None, symbols=None, clock=time.monotonic):
+        """Initialize."""
+        self._rate = max_orders_per_second
+        self._max_open_orders = max_open_orders
+        self._defaults = {"max_notional": max_notional, "max_position": max_position, "price_band": price_band}
+        self._limits = {symbol.replace("/", ""): limits for symbol, limits in (symbols or {}).items()}
+        self._clock = clock
+        self._tokens = float(max_orders_per_second or 0)
+        self._last_time = clock()
+        self._symbols = {}  # e.g. `{symbol: _SymbolRisk, ... }`
+        self._orders = {}  # Open orders. e.g. `{client_order_id: [_SymbolRisk, is buy, remain, price], ... }`
+        self._open_orders = 0
+        self._rejected = {}  # Orders rejected by every rule. e.g. `{"max_notional": 1, ... }`
+
+    @property
+    def open_orders(self):
+        return self._open_orders
+
+    @property
+    def rejected(self):
+        return dict(self._rejected)
+
+    def get_state(self, symbol):
+        """Limits and counters of a symbol, e.g. `{"max_notional": 10000, "open_notional": 1650.0, ... }`."""
+        s = self._symbols.get(symbol)
+        return {name: getattr(s, name) for name in _SymbolRisk.__slots__} if s else None
+
+    def set_limits(self, symbol, **limits):
+        """Change limits of a symbol, e.g. `set_limits("BTCUSDT", max_position=1)`, `None` is no limit."""
+        s = self._symbols.get(symbol) or self._add(symbol)
+        for name, value in limits.items():
+            if name not in SYMBOL_LIMITS:
+                raise ValueError("unknown limit: {}".format(name))
+            setattr(s, name, value)
+        self._limits.setdefault(symbol.replace("/", ""), {}).update(limits)
+        if s.last_price is not None:
+            self.on_price(symbol, s.last_price)
+
+    def check(self, symbol, action, price, quantity, client_order_id=None, replaces=None):
+        """Check an order before it's sent, and count it as an open order if passed.
+
+        Args:
+            symbol: Symbol name.
+            action: Trade side, `BUY` / `SELL`.
+            price: Order price, `None` or `0` for market order, the latest price is used for notional.
+            quantity: Order quantity.
+            client_order_id: Client order id, the order is counted until it's finished (`on_order`) or released
+                (`release`), not counted if `None`.
+            replaces: Client order id of the order canceled by this order (cancel and replace), it's not counted in
+                this check.
+
+        Returns:
+            error: `RiskError` if the order is rejected, otherwise it's None.
+        """
+        s = self._symbols.get(symbol) or self._add(symbol)
+        quantity = float(quantity)
+        price = float(price) if price else None
+        if self._rate:
+            now = self._clock()
+            tokens = self._tokens + (now - self._last_time) * self._rate
+            if tokens > self._rate:
+                tokens = self._rate
+            self._tokens = tokens
+            self._last_time = now
+            if tokens < 1:
+                return self._reject(RISK_MAX_ORDERS_PER_SECOND, s, "orders per second over limit: {}".format(
+                    self._rate))
+        open_orders, open_notional, open_buy, open_sell = s.open_orders, s.open_notional, s.open_buy, s.open_sell
+        old = self._orders.get(replaces) if replaces is not None else None
+        if old:
+            open_orders -= 1
+            open_notional -= old[2] * old[3]
+            if old[1]:
+                open_buy -= old[2]
+            else:
+                open_sell -= old[2]
+        if self._max_open_orders is not None and self._open_orders - (old is not None) >= self._max_open_orders:
+            return self._reject(RISK_MAX_OPEN_ORDERS, s, "open orders over limit: {}".format(self._max_open_orders))
+        if s.max_open_orders is not None and open_orders >= s.max_open_orders:
+            return self._reject(RISK_MAX_OPEN_ORDERS, s, "open orders of {} over limit: {}".format(
+                symbol, s.max_open_orders))
+        if price and s.price_band is not None:
+            if s.low is None:
+                return self._reject(RISK_NO_PRICE, s, "no price to check price band of limit order")
+            if not s.low <= price <= s.high:
+                return self._reject(RISK_PRICE_BAND, s, "price {} out of band [{}, {}]".format(price, s.low, s.high))
+        ref_price = price or s.last_price
+        if s.max_notional is not None:
+            if ref_price is None:
+                return self._reject(RISK_NO_PRICE, s, "no price to check notional of market order")
+            if open_notional + ref_price * quantity > s.max_notional:
+                return self._reject(RISK_MAX_NOTIONAL, s, "notional of {} over limit: {}".format(
+                    symbol, s.max_notional))
+        buy = action == ORDER_ACTION_BUY
+        if s.max_position is not None:
+            if buy and s.position + open_buy + quantity > s.max_position or \
+                    not buy and s.position - open_sell - quantity < -s.max_position:
+                return self._reject(RISK_MAX_POSITION, s, "position of {} over limit: {}".format(
+                    symbol, s.max_position))
+
+        if self._rate:
+            self._tokens -= 1
+        if client_order_id is not None:
+            self._orders[client_order_id] = [s, buy, quantity, ref_price or 0.0]
+            self._open_orders += 1
+            s.open_orders += 1
+            s.open_notional += (ref_price or 0.0) * quantity
+            if buy:
+                s.open_buy += quantity
+            else:
+                s.open_sell += quantity
+        return None
+
+    def release(self, client_order_id):
+        """Stop counting an order passed, e.g. it's not created because of a request error."""
+        entry = self._orders.pop(client_order_id, None)
+        if entry:
+            self._settle(entry, entry[2])
+
+    def on_order(self, order):
+        """Update open orders by an order update, orders not checked by this gate are counted too."""
+        entry = self._orders.get(order.client_order_id)
+        if order.status in FINAL_STATUS:
+            if entry:
+                del self._orders[order.client_order_id]
+                self._settle(entry, entry[2])
+            return
+        remain = float(order.remain)
+        if entry:
+            self._settle(entry, entry[2] - remain)
+            entry[2] = remain
+            return
+        s = self._symbols.get(order.symbol) or self._add(order.symbol)
+        buy = order.action == ORDER_ACTION_BUY
+        price = float(order.price) or s.last_price or 0.0
+        self._orders[order.client_order_id] = [s, buy, remain, price]
+        self._open_orders += 1
+        s.open_orders += 1
+        s.open_notional += price * remain
+        if buy:
+            s.open_buy += remain
+        else:
+            s.open_sell += remain
+
+    def on_position(self, symbol, quantity):
+        """Update net position of a symbol, long is positive and short is negative."""
+        s = self._symbols.get(symbol) or self._add(symbol)
+        s.position = quantity
+
+    def on_price(self, symbol, price):
+        """Update the latest price of a symbol, e.g. trade price or kline close price."""
+        s = self._symbols.get(symbol) or self._add(symbol)
+        s.last_price = price
+        if s.price_band is not None:
+            s.low = price * (1 - s.price_band)
+            s.high = price * (1 + s.price_band)
+        else:
+            s.low = s.high = None
+
+    def _settle(self, entry, quantity):
+        """Remove filled or canceled quantity of an open order, and the order itself if nothing left."""
+        s, buy, remain, price = entry
+        s.open_notional -= price * quantity
+        if buy:
+            s.open_buy -= quantity
+        else:
+            s.open_sell -= quantity
+        if quantity >= remain:
+            self._open_orders -= 1
+            s.open_orders -= 1
+
+    def _add(self, symbol):
+        limits = dict(self._defaults, **self._limits.get(symbol.replace("/", ""), {}))
+        s = self._symbols[symbol] = _SymbolRisk(symbol, limits)
+        return s
+
+    def _reject(self, rule, s, msg):
+        self._rejected[rule] = self._rejected.get(rule, 0) + 1
+        return RiskError(msg, rule, s.symbol)
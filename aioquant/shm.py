@@ -0,0 +1,381 @@
+# -*- coding:utf-8 -*-
+
+"""
+Shared memory market data fanout.
+
+A market publisher process writes every kline / trade / orderbook event into a ring buffer in shared memory per
+(exchange, routing key), and strategy processes on the same host read events from shared memory instead of consuming
+them from RabbitMQ, so that there is no network round trip, and events are only encoded once by the publisher.
+
+Every ring buffer slot is protected by a sequence lock: writer makes the slot sequence odd before writing and even
+after written, reader copies the payload and checks the slot sequence is unchanged and equal to the expected one,
+otherwise the slot is being written or overwritten. Readers never block writer, a slow reader loses the oldest events
+if it falls behind more than one ring. Events are encoded by `BinaryCodec` (`JsonCodec` as fallback).
+
+A catalog segment lists all ring buffers created by publisher, so that readers can find ring buffers matching
+subscribed routing key patterns, e.g. `Binance.*`.
+
+NOTE:
+    Only one publisher per catalog (`prefix`) is supported, and readers should be restarted after the publisher
+    restarted, since segments are re-created by publisher.
+"""
+
+import os
+import mmap
+import struct
+import tempfile
+
+from aioquant import codec
+from aioquant.utils import logger
+
+__all__ = ("ShmRing", "ShmCatalog", "ShmPublisher", "ShmReader", )
+
+
+SHM_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+SHM_MAGIC = 0x41515348  # "AQSH"
+SHM_VERSION = 1
+
+_RING_HEADER = struct.Struct("<IIIIQ")  # magic, version, slots, slot size, write sequence
+_SLOT_HEADER = struct.Struct("<QI")  # slot sequence, payload length
+_CATALOG_HEADER = struct.Struct("<IIQI")  # magic, version, catalog sequence, content length
+
+
+class _Segment:
+    """Shared memory segment, a file in `/dev/shm` (or temporary directory if not exists) mapped into memory.
+
+    Attributes:
+        name: Segment name, file name.
+        size: Segment size in bytes, only used when creating.
+        create: Create a new segment, or attach an existing one.
+    """
+
+    def __init__(self, name, size=0, create=False):
+        """Initialize."""
+        self._path = os.path.join(SHM_DIR, name)
+        if create:
+            if os.path.exists(self._path):
+                os.unlink(self._path)  # Stale segment left by a crashed publisher, readers keep their mapping.
+            fd = os.open(self._path, os.O_CREAT | os.O_EXCL | os.O_RDWR, 0o600)
+            os.ftruncate(fd, size)
+        else:
+            fd = os.open(self._path, os.O_RDWR)
+            size = os.fstat(fd).st_size
+        try:
+            self._mmap = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+        self.size = size
+        self.buf = memoryview(self._mmap)
+
+    def close(self):
+        self.buf.release()
+        self._mmap.close()
+
+    def unlink(self):
+        try:
+            os.unlink(self._path)
+        except FileNotFoundError:
+            pass
+
+
+class ShmRing:
+    """Ring buffer in shared memory, one writer and any number of readers.
+
+    Attributes:
+        name: Shared memory segment name.
+        slots: How many events kept in ring buffer, only used when creating.
+        slot_size: Max bytes of an encoded event, only used when creating.
+        create: Create a new segment (writer), or attach an existing one (reader).
+    """
+
+    def __init__(self, name, slots=1024, slot_size=1024, create=False):
+        """Initialize."""
+        self._name = name
+        if create:
+            self._shm = _Segment(name, _RING_HEADER.size + slots * (_SLOT_HEADER.size + slot_size), create=True)
+            _RING_HEADER.pack_into(self._shm.buf, 0, SHM_MAGIC, SHM_VERSION, slots, slot_size, 0)
+        else:
+            self._shm = _Segment(name)
+            magic, version, slots, slot_size, _ = _RING_HEADER.unpack_from(self._shm.buf, 0)
+            if magic != SHM_MAGIC or version != SHM_VERSION:
+                self._shm.close()
+                raise ValueError("shared memory version error: name={} magic={} version={}".format(
+                    name, magic, version))
+        self._buf = self._shm.buf
+        self._slots = slots
+        self._slot_size = slot_size
+        self._stride = _SLOT_HEADER.size + slot_size
+        self._seq = _RING_HEADER.unpack_from(self._buf, 0)[4]  # Write sequence, how many events written.
+
+    @property
+    def name(self):
+        return self._name
+
+    @property
+    def write_seq(self):
+        """How many events written."""
+        return _RING_HEADER.unpack_from(self._buf, 0)[4]
+
+    def write(self, payload):
+        """Write an event.
+
+        Args:
+            payload: Encoded event.
+
+        Returns:
+            If the event written, return True, otherwise (too large) return False.
+        """
+        n = len(payload)
+        if n > self._slot_size:
+            return False
+        seq = self._seq
+        offset = _RING_HEADER.size + (seq % self._slots) * self._stride
+        _SLOT_HEADER.pack_into(self._buf, offset, seq * 2 + 1, n)  # Odd sequence, being written.
+        start = offset + _SLOT_HEADER.size
+        self._buf[start:start + n] = payload
+        _SLOT_HEADER.pack_into(self._buf, offset, seq * 2 + 2, n)  # Even sequence, written.
+        self._seq = seq + 1
+        _RING_HEADER.pack_into(self._buf, 0, SHM_MAGIC, SHM_VERSION, self._slots, self._slot_size, self._seq)
+        return True
+
+    def read(self, seq):
+        """Read events from sequence `seq`.
+
+        Args:
+            seq: Sequence of the first event to read.
+
+        Returns:
+            payloads: Encoded events.
+            seq: Sequence of the next event to read.
+            lost: How many events overwritten before being read.
+        """
+        write_seq = self.write_seq
+        lost = 0
+        if write_seq - seq > self._slots:
+            lost = write_seq - self._slots - seq
+            seq = write_seq - self._slots
+        payloads = []
+        while seq < write_seq:
+            offset = _RING_HEADER.size + (seq % self._slots) * self._stride
+            expected = seq * 2 + 2
+            slot_seq, n = _SLOT_HEADER.unpack_from(self._buf, offset)
+            if slot_seq == expected:
+                start = offset + _SLOT_HEADER.size
+                payload = bytes(self._buf[start:start + n])
+                if _SLOT_HEADER.unpack_from(self._buf, offset)[0] == expected:
+                    payloads.append(payload)
+                    seq += 1
+                    continue
+            if slot_seq < expected:
+                break  # Not written yet, read it next time.
+            lost += 1  # Overwritten by writer.
+            seq += 1
+        return payloads, seq, lost
+
+    def close(self, unlink=False):
+        self._buf = None
+        self._shm.close()
+        if unlink:
+            self._shm.unlink()
+
+
+class ShmCatalog:
+    """Catalog of ring buffers, a list of `exchange routing_key` lines.
+
+    Attributes:
+        name: Shared memory segment name.
+        size: Max bytes of catalog, only used when creating.
+        create: Create a new segment (writer), or attach an existing one (reader).
+    """
+
+    def __init__(self, name, size=65536, create=False):
+        """Initialize."""
+        self._name = name
+        if create:
+            self._shm = _Segment(name, size, create=True)
+            _CATALOG_HEADER.pack_into(self._shm.buf, 0, SHM_MAGIC, SHM_VERSION, 0, 0)
+        else:
+            self._shm = _Segment(name)
+        self._size = self._shm.size
+        self._entries = []  # e.g. `[(exchange, routing_key), ...]`
+
+    @property
+    def seq(self):
+        """Catalog sequence, changed every time catalog updated."""
+        return _CATALOG_HEADER.unpack_from(self._shm.buf, 0)[2]
+
+    def add(self, exchange, routing_key):
+        """Add a ring buffer into catalog."""
+        self._entries.append((exchange, routing_key))
+        content = "\n".join("{} {}".format(*entry) for entry in self._entries).encode("utf8")
+        if _CATALOG_HEADER.size + len(content) > self._size:
+            raise ValueError("shared memory catalog is full")
+        seq = self.seq
+        buf = self._shm.buf
+        _CATALOG_HEADER.pack_into(buf, 0, SHM_MAGIC, SHM_VERSION, seq + 1, 0)
+        buf[_CATALOG_HEADER.size:_CATALOG_HEADER.size + len(content)] = content
+        _CATALOG_HEADER.pack_into(buf, 0, SHM_MAGIC, SHM_VERSION, seq + 2, len(content))
+
+    def entries(self):
+        """Read ring buffers in catalog.
+
+        Returns:
+            entries: e.g. `[(exchange, routing_key), ...]`, or `None` if catalog is being updated.
+        """
+        buf = self._shm.buf
+        magic, version, seq, n = _CATALOG_HEADER.unpack_from(buf, 0)
+        if magic != SHM_MAGIC or version != SHM_VERSION or seq % 2:
+            return None
+        content = bytes(buf[_CATALOG_HEADER.size:_CATALOG_HEADER.size + n])
+        if _CATALOG_HEADER.unpack_from(buf, 0)[2] != seq:
+            return None
+        return [tuple(line.split(" ", 1)) for line in content.decode("utf8").split("\n") if line]
+
+    def close(self, unlink=False):
+        self._shm.close()
+        if unlink:
+            self._shm.unlink()
+
+
+def _ring_name(prefix, exchange, routing_key):
+    return "{}.{}.{}".format(prefix, exchange, routing_key)
+
+
+class ShmPublisher:
+    """Write events into shared memory ring buffers.
+
+    Attributes:
+        prefix: Name prefix of shared memory segments, default is `aioquant`.
+        slots: How many events kept in each ring buffer, default is `1024`.
+        slot_size: Max bytes of an encoded event, default is `1024`.
+    """
+
+    def __init__(self, prefix="aioquant", slots=1024, slot_size=1024):
+        """Initialize."""
+        self._prefix = prefix
+        self._slots = slots
+        self._slot_size = slot_size
+        self._catalog = ShmCatalog(prefix, create=True)
+        self._codec = codec.BinaryCodec()
+        self._rings = {}  # e.g. `{(exchange, routing_key): ring, ... }`
+        self._written = 0  # How many events written.
+        self._oversize = 0  # How many events too large to be written.
+
+    @property
+    def stats(self):
+        return {"rings": len(self._rings), "written": self._written, "oversize": self._oversize}
+
+    def publish(self, event):
+        """Encode a event and write it into the ring buffer of its exchange and routing key."""
+        key = (event.exchange, event.routing_key)
+        ring = self._rings.get(key)
+        if ring is None:
+            ring = ShmRing(_ring_name(self._prefix, *key), self._slots, self._slot_size, create=True)
+            self._rings[key] = ring
+            self._catalog.add(*key)
+        try:
+            payload = self._codec.encode(event.name, event.data)
+        except ValueError:
+            payload = codec.JsonCodec().encode(event.name, event.data)
+        if ring.write(payload):
+            self._written += 1
+        else:
+            self._oversize += 1
+            if self._oversize == 1:
+                logger.warn("event too large for shared memory slot, skipped:", key, caller=self)
+
+    def close(self):
+        for ring in self._rings.values():
+            ring.close(unlink=True)
+        self._rings = {}
+        self._catalog.close(unlink=True)
+
+
+class ShmReader:
+    """Read events from shared memory ring buffers matching subscribed routing key patterns.
+
+    Attributes:
+        prefix: Name prefix of shared memory segments, default is `aioquant`.
+        router: `TopicRouter` of subscriptions, callbacks are called with `(payload, exchange, routing_key)`.
+    """
+
+    def __init__(self, router, prefix="aioquant"):
+        """Initialize."""
+        self._router = router
+        self._prefix = prefix
+        self._catalog = None
+        self._catalog_seq = None
+        self._known = None  # Rings in catalog at the last read, `None` if not read yet. e.g. `{(exchange, key), ...}`
+        self._rings = []  # e.g. `[[exchange, routing_key, ring, next sequence, callbacks], ...]`
+        self._read = 0  # How many events read.
+        self._lost = 0  # How many events overwritten before being read.
+
+    @property
+    def stats(self):
+        return {"rings": len(self._rings), "read": self._read, "lost": self._lost}
+
+    def poll(self):
+        """Read all new events from ring buffers and callback.
+
+        Returns:
+            count: How many events read.
+        """
+        self._refresh()
+        count = 0
+        for entry in self._rings:
+            exchange, routing_key, ring, seq, callbacks = entry
+            payloads, entry[3], lost = ring.read(seq)
+            self._lost += lost
+            for payload in payloads:
+                for callback in callbacks:
+                    callback(payload, exchange, routing_key)
+            count += len(payloads)
+        self._read += count
+        return count
+
+    def refresh(self):
+        """Re-match ring buffers, should be called after subscriptions changed."""
+        self._catalog_seq = None
+
+    def _refresh(self):
+        """Attach ring buffers added into catalog since last refresh."""
+        if self._catalog is None:
+            try:
+                self._catalog = ShmCatalog(self._prefix)
+            except FileNotFoundError:
+                return  # Publisher not started yet.
+        catalog_seq = self._catalog.seq
+        if catalog_seq == self._catalog_seq:
+            return
+        entries = self._catalog.entries()
+        if entries is None:
+            return
+        rings = {(e[0], e[1]): e for e in self._rings}
+        self._rings = []
+        for exchange, routing_key in entries:
+            callbacks = self._router.route(exchange, routing_key)
+            if not callbacks:
+                continue
+            entry = rings.get((exchange, routing_key))
+            if entry is None:
+                ring = ShmRing(_ring_name(self._prefix, exchange, routing_key))
+                # Start from the latest event for ring buffers existed in catalog at the last read (events in them
+                # are history, e.g. subscribed after the first poll), and from the oldest event for ring buffers
+                # created since then.
+                if self._known is None or (exchange, routing_key) in self._known:
+                    seq = ring.write_seq
+                else:
+                    seq = 0
+                entry = [exchange, routing_key, ring, seq, None]
+            entry[4] = callbacks
+            self._rings.append(entry)
+        self._catalog_seq = catalog_seq
+        self._known = set(entries)
+
+    def close(self):
+        for entry in self._rings:
+            entry[2].close()
+        self._rings = []
+        if self._catalog:
+            self._catalog.close()
+            self._catalog = None
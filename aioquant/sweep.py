@@ -0,0 +1,304 @@
+# -*- coding:utf-8 -*-
+
+"""
+Parameter sweep.
+
+Run a backtest for every parameter set of a grid across a process pool, and collect reports into one table.
+
+Klines are exported once into a dataset directory (see `aioquant.backtest.export_klines`), every worker process memory
+maps the same files read only, so that data is shared through the OS page cache instead of being loaded or copied by
+every job. Jobs are scheduled onto as many worker processes as CPUs available, at most `2 * workers` jobs are queued
+at a time, and every finished job is appended into a state file immediately, a sweep interrupted is resumed by
+running it again with the same state file, finished jobs are skipped. A job is keyed by its parameters together with a
+fingerprint of the sweep (entrance, dataset and backtest settings), so results of a sweep on other data or settings
+are never reused, and a dataset in the cache directory is exported again if it doesn't match.
+
+A strategy entrance is called with the parameters of a job as keyword arguments, e.g.
+`PriceWatcher(klines_len=30, count_down_time=60)`, it must be importable by worker processes: a module level function
+or class, or an import path string `module:name`.
+"""
+
+import os
+import csv
+import json
+import shutil
+import hashlib
+import tempfile
+import itertools
+import importlib
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from aioquant.utils import logger
+from aioquant.configure import config
+from aioquant.backtest import Backtest, export_klines, dataset_info, DATASET_META
+
+__all__ = ("Sweep", "grid", "start", )
+
+
+def grid(**params):
+    """All combinations of parameter values.
+
+    Args:
+        params: Values of every parameter, e.g. `klines_len=[30, 60], count_down_time=[60, 300]`.
+
+    Returns:
+        jobs: Parameter sets, e.g. `[{"klines_len": 30, "count_down_time": 60}, ...]`.
+    """
+    names = list(params)
+    return [dict(zip(names, values)) for values in itertools.product(*(params[name] for name in names))]
+
+
+def cpu_count():
+    """CPUs this process is allowed to run on."""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def job_key(params, fingerprint=None):
+    """Stable key of a parameter set, to match finished jobs in state file.
+
+    Args:
+        params: Parameter set of a job.
+        fingerprint: Fingerprint of the sweep the job belongs to, see `Sweep.fingerprint`.
+    """
+    data = params if fingerprint is None else {"params": params, "fingerprint": fingerprint}
+    return hashlib.md5(json.dumps(data, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def _entrance_name(entrance):
+    if isinstance(entrance, str):
+        return entrance
+    return "{}:{}".format(entrance.__module__, entrance.__qualname__)
+
+
+def _resolve(entrance):
+    if isinstance(entrance, str):
+        module, name = entrance.split(":", 1)
+        return getattr(importlib.import_module(module), name)
+    return entrance
+
+
+def _init_worker(config_file, key_file, paths):
+    """Initialize a worker process: import paths of strategies, config file and key file."""
+    import sys
+    for path in paths:
+        if path not in sys.path:
+            sys.path.insert(0, path)
+    if config_file:
+        config.loads(config_file, key_file)
+    if config.log:
+        logger.initLogger(**config.log)
+
+
+def _run_job(entrance, params, source, symbols, interval, settings):
+    """Run one backtest in a worker process, returns a result row."""
+    func = _resolve(entrance)
+    backtest = Backtest(source, symbols, interval, **settings)
+    report = backtest.run(lambda: func(**params))
+    row = {
+        "bars": report["bars"],
+        "elapsed": report["elapsed"],
+        "errors": report["errors"],
+        "orders": 0,
+        "fills": 0,
+        "volume": 0.0,
+        "fee": 0.0,
+        "initial_equity": 0.0,
+        "equity": 0.0
+    }
+    for exchange in report["exchanges"]:
+        for name in ("orders", "fills", "volume", "fee", "initial_equity", "equity"):
+            row[name] += exchange[name]
+    row["pnl"] = row["equity"] - row["initial_equity"]
+    row["ret"] = row["pnl"] / row["initial_equity"] if row["initial_equity"] else 0
+    return row
+
+
+class Sweep:
+    """Parameter sweep runner.
+
+    Attributes:
+        entrance: Strategy entrance called with parameters of a job, a module level function / class, or an import
+            path string, e.g. `monitor.pricewatcher:PriceWatcher`.
+        jobs: Parameter sets, e.g. `grid(klines_len=[30, 60], count_down_time=[60, 300])`.
+        source: Kline data, see `aioquant.backtest.load_klines`.
+        symbols: Symbols to be replayed, e.g. `["BTCUSDT"]`.
+        interval: Kline interval, e.g. `1s`.
+        start: Start time, millisecond or `YYYY-MM-DD`, default is the first kline.
+        end: End time (exclusive), millisecond or `YYYY-MM-DD`, default is the last kline.
+        workers: How many worker processes, default is CPU count.
+        state_file: File to save finished jobs, a sweep is resumed from it, default is `None`, not resumable.
+        cache_dir: Directory of exported dataset, default is a temporary directory removed after sweep. An existing
+            dataset in it is reused.
+        paths: Directories added into `sys.path` of worker processes, e.g. `["./trade"]`.
+        config_file: Config file loaded by worker processes, default is `None`.
+        key_file: Key file loaded by worker processes together with `config_file`, default is `None`.
+        settings: Other settings of `Backtest`, e.g. `assets`, `fee_rate`, `slippage`.
+    """
+
+    def __init__(self, entrance, jobs, source, symbols, interval="1m", start=None, end=None, workers=None,
+                 state_file=None, cache_dir=None, paths=None, config_file=None, key_file=None, **settings):
+        """Initialize."""
+        self._entrance = entrance
+        self._jobs = list(jobs)
+        self._source = source
+        self._symbols = [s.replace("/", "") for s in symbols]
+        self._interval = interval
+        self._start = start
+        self._end = end
+        self._workers = workers or cpu_count()
+        self._state_file = state_file
+        self._cache_dir = cache_dir
+        self._paths = [os.path.abspath(p) for p in paths or []]
+        self._config_file = config_file
+        self._key_file = key_file
+        self._settings = settings
+        self._dataset = dataset_info(source, self._symbols, interval, start, end)
+        self._fingerprint = hashlib.md5(json.dumps({"entrance": _entrance_name(entrance), "dataset": self._dataset,
+                                                   "settings": settings}, sort_keys=True, default=str).encode()
+                                        ).hexdigest()
+        self._results = {}  # Finished jobs. e.g. `{key: row, ... }`
+
+    @property
+    def fingerprint(self):
+        """Fingerprint of entrance, dataset and backtest settings, part of every job key."""
+        return self._fingerprint
+
+    @property
+    def results(self):
+        """Result rows of finished jobs, parameters and backtest summary in a row."""
+        return list(self._results.values())
+
+    def run(self, sort_by="pnl"):
+        """Run all jobs not finished yet.
+
+        Args:
+            sort_by: Result column to sort by, descending, default is `pnl`.
+
+        Returns:
+            results: Result rows of all jobs, e.g. `[{"klines_len": 30, ..., "pnl": 10.5, "ret": 0.001, ...}, ...]`.
+        """
+        self._load_state()
+        pending = [params for params in self._jobs if self._key(params) not in self._results]
+        logger.info("jobs:", len(self._jobs), "finished:", len(self._jobs) - len(pending), "workers:",
+                    self._workers, caller=self)
+        if pending:
+            cache_dir = self._cache_dir or tempfile.mkdtemp(prefix="aioquant-sweep-")
+            try:
+                self._export(cache_dir)
+                self._execute(pending, cache_dir)
+            finally:
+                if not self._cache_dir:
+                    shutil.rmtree(cache_dir, ignore_errors=True)
+        results = [self._results[self._key(params)] for params in self._jobs if self._key(params) in self._results]
+        results.sort(key=lambda row: row.get(sort_by) if row.get(sort_by) is not None else float("-inf"),
+                     reverse=True)
+        return results
+
+    def _key(self, params):
+        return job_key(params, self._fingerprint)
+
+    def _export(self, cache_dir):
+        meta_file = os.path.join(cache_dir, DATASET_META)
+        if os.path.isfile(meta_file):
+            with open(meta_file) as f:
+                meta = json.load(f)
+            info = {name: meta.get(name) for name in self._dataset}
+            if info == self._dataset:
+                return
+            logger.warn("dataset not match, export again, dataset:", info, "expected:", self._dataset, caller=self)
+        rows = export_klines(self._source, self._symbols, cache_dir, self._interval, self._start, self._end)
+        logger.info("dataset exported, klines:", rows, "path:", cache_dir, caller=self)
+
+    def _execute(self, pending, cache_dir):
+        queue = iter(pending)
+        futures = {}
+        with ProcessPoolExecutor(self._workers, initializer=_init_worker,
+                                 initargs=(self._config_file, self._key_file, self._paths)) as executor:
+            while True:
+                while len(futures) < self._workers * 2:  # Keep workers busy without queuing all jobs.
+                    params = next(queue, None)
+                    if params is None:
+                        break
+                    future = executor.submit(_run_job, self._entrance, params, cache_dir, self._symbols,
+                                             self._interval, self._settings)
+                    futures[future] = params
+                if not futures:
+                    break
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    params = futures.pop(future)
+                    error = future.exception()
+                    if error:
+                        logger.error("job failed, params:", params, "error:", error, caller=self)
+                        row = {"error": str(error)}
+                    else:
+                        row = future.result()
+                    self._save(params, row)
+
+    def _load_state(self):
+        if not self._state_file or not os.path.isfile(self._state_file):
+            return
+        with open(self._state_file) as f:
+            for line in f:
+                try:
+                    item = json.loads(line)
+                except ValueError:
+                    continue  # A line not written completely.
+                if "error" not in item["result"]:  # Failed jobs are run again.
+                    self._results[item["key"]] = dict(item["params"], **item["result"])
+
+    def _save(self, params, row):
+        key = self._key(params)
+        if "error" not in row:
+            self._results[key] = dict(params, **row)
+        if self._state_file:
+            with open(self._state_file, "a") as f:
+                f.write(json.dumps({"key": key, "params": params, "result": row}, default=str) + "\n")
+
+    def save_csv(self, path, results=None):
+        """Save result rows into a CSV file.
+
+        Args:
+            path: CSV file path.
+            results: Result rows, default is all finished jobs.
+        """
+        results = self.results if results is None else results
+        names = []
+        for row in results:
+            names.extend(name for name in row if name not in names)
+        with open(path, "w", newline="") as f:
+            writer = csv.DictWriter(f, names)
+            writer.writeheader()
+            writer.writerows(results)
+
+
+def start(entrance, jobs, config_file=None, key_file=None, output=None, **kwargs):
+    """Run a sweep on klines configured by `BACKTEST` in config file, and print the best results.
+
+    Args:
+        entrance: Strategy entrance, see `Sweep`.
+        jobs: Parameter sets, e.g. `grid(klines_len=[30, 60])`.
+        config_file: Config file path.
+        key_file: Key file path, optional.
+        output: CSV file to save results, optional.
+        kwargs: Other arguments of `Sweep`, or override settings in `BACKTEST`, e.g. `workers=4`.
+
+    Returns:
+        results: Result rows sorted by pnl.
+    """
+    if config_file:
+        config.loads(config_file, key_file)
+    if config.log:
+        logger.initLogger(**config.log)
+    settings = dict(config.backtest or {}, **kwargs)
+    source = settings.pop("source")
+    symbols = settings.pop("symbols", None) or [config.symbol]
+    sweep = Sweep(entrance, jobs, source, symbols, config_file=config_file, key_file=key_file, **settings)
+    results = sweep.run()
+    if output:
+        sweep.save_csv(output, results)
+    for row in results[:10]:
+        print(json.dumps(row, default=str))
+    return results
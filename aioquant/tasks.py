@@ -19,10 +19,14 @@ import asyncio
 import inspect
 
 from aioquant.heartbeat import heartbeat
+from aioquant.utils.metrics import registry
 
 __all__ = ("LoopRunTask", "SingleTask", )
 
 
+_tasks_created = registry.counter("aioquant_tasks_created_total", "Tasks created by SingleTask.")
+
+
 class LoopRunTask(object):
     """Loop run task.
     """
@@ -33,7 +37,10 @@ class LoopRunTask(object):
 
         Args:
             func: Asynchronous callback function.
-            interval: execute interval time(seconds), default is 1s.
+            interval: execute interval time(seconds), default is 1s, a float less than 1 is allowed.
+            kwargs:
+                overlap: What to do if the task is due while its previous run is still in flight,
+                    `concurrent` / `skip` / `queue`, default is `concurrent`.
 
         Returns:
             task_id: Task id.
@@ -61,8 +68,12 @@ class SingleTask:
 
         Args:
             func: Asynchronous callback function.
+
+        Returns:
+            task: The task created.
         """
-        asyncio.get_event_loop().create_task(func(*args, **kwargs))
+        _tasks_created.inc()
+        return asyncio.get_event_loop().create_task(func(*args, **kwargs))
 
     @classmethod
     def call_later(cls, func, delay=0, *args, **kwargs):
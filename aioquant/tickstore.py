@@ -0,0 +1,409 @@
+# -*- coding:utf-8 -*-
+
+"""
+Columnar tick store.
+
+Append-only market data store, partitioned by kind (e.g. `kline_1m` / `trade` / `orderbook`), symbol and UTC day:
+    <root>/<kind>/<symbol>/<YYYYMMDD>/<segment>/
+        meta.json       Segment meta: columns, dtypes, rows, first / last time, sealed or not.
+        <column>.bin    Column values of the active segment, raw little endian array, read by memory mapping.
+        <column>.z      Column values of a sealed segment, compressed by zlib in blocks (after byte shuffled).
+
+Every row has a time column (the first column, millisecond), rows of a segment are in time order, so that a range
+query finds segments by their first / last time and seeks inside a segment by binary search (`np.searchsorted`),
+only the compressed blocks overlapped with the range are decompressed for a sealed segment. A segment with rows
+appended out of time order is marked unsorted in meta and scanned fully by range queries.
+A segment is sealed (compressed) when it's full or its day is over, and a new segment is started.
+
+`meta.json` is replaced atomically after column files written, the rows it records are always complete, extra bytes
+in column files left by a crash are truncated when the segment is opened again for writing.
+
+NOTE:
+    A store directory should be written by only one process (`TickStore` is not thread safe, call `append` from one
+    thread), it can be read by any process at the same time.
+"""
+
+import os
+import json
+import time
+import zlib
+
+import numpy as np
+
+__all__ = ("TickStore", "SCHEMAS", "orderbook_schema", )
+
+
+DAY_MS = 86400000
+
+# Column names and dtypes of every kind, the first column is time column.
+SCHEMAS = {
+    "kline": (
+        ("start_time", "<i8"), ("close_time", "<i8"), ("open", "<f8"), ("high", "<f8"), ("low", "<f8"),
+        ("close", "<f8"), ("volume", "<f8"), ("quote_volume", "<f8"), ("taker_buy_volume", "<f8"),
+        ("taker_buy_quote_volume", "<f8"), ("trade_num", "<i8"), ("first_trade_id", "<i8"), ("last_trade_id", "<i8")
+    ),
+    "trade": (
+        ("timestamp", "<i8"), ("price", "<f8"), ("quantity", "<f8"), ("side", "<i1")  # side: 1 BUY, -1 SELL
+    )
+}
+
+
+def orderbook_schema(depth):
+    """Orderbook schema of top `depth` levels, missing levels are NaN.
+
+    Columns: `timestamp`, `ask_price_0` ... `ask_price_N`, `ask_quantity_0` ..., `bid_price_0` ..., `bid_quantity_0` ...
+    """
+    columns = [("timestamp", "<i8")]
+    for name in ("ask_price", "ask_quantity", "bid_price", "bid_quantity"):
+        columns.extend(("{}_{}".format(name, i), "<f8") for i in range(depth))
+    return tuple(columns)
+
+
+def schema_of(kind, depth=5):
+    """Get schema of a kind, all `kline_*` kinds share `kline` schema."""
+    if kind.startswith("kline"):
+        return SCHEMAS["kline"]
+    if kind == "orderbook":
+        return orderbook_schema(depth)
+    return SCHEMAS[kind]
+
+
+def _day_of(ms):
+    return time.strftime("%Y%m%d", time.gmtime(ms // 1000))
+
+
+def _compress(array, level):
+    """Byte shuffle (the k-th byte of every value together) then compress, values of a column are similar, so that
+    shuffled bytes compress much better."""
+    size = array.dtype.itemsize
+    shuffled = np.ascontiguousarray(array).view(np.uint8).reshape(-1, size).T
+    return zlib.compress(shuffled.tobytes(), level)
+
+
+def _decompress(b, dtype):
+    dtype = np.dtype(dtype)
+    raw = np.frombuffer(zlib.decompress(b), dtype=np.uint8)
+    return np.ascontiguousarray(raw.reshape(dtype.itemsize, -1).T).view(dtype).reshape(-1)
+
+
+class _Segment:
+    """A segment directory.
+
+    Attributes:
+        path: Segment directory.
+        meta: Segment meta.
+    """
+
+    def __init__(self, path, meta):
+        """Initialize."""
+        self.path = path
+        self.meta = meta
+        self._files = None  # Column files opened for appending. e.g. `{column: file object, ... }`
+
+    @classmethod
+    def load(cls, path):
+        with open(os.path.join(path, "meta.json")) as f:
+            return cls(path, json.load(f))
+
+    @classmethod
+    def create(cls, path, schema):
+        os.makedirs(path, exist_ok=True)
+        meta = {"columns": [list(c) for c in schema], "rows": 0, "first": None, "last": None, "sealed": False,
+                "sorted": True}
+        segment = cls(path, meta)
+        segment._save_meta()
+        return segment
+
+    @property
+    def rows(self):
+        return self.meta["rows"]
+
+    @property
+    def sealed(self):
+        return self.meta["sealed"]
+
+    def append(self, arrays):
+        """Append column arrays, all arrays have the same length.
+
+        Args:
+            arrays: Column arrays. e.g. `{column: array, ... }`
+        """
+        if self._files is None:
+            self._open()
+        for name, f in self._files.items():
+            f.write(arrays[name].tobytes())
+            f.flush()
+        meta = self.meta
+        times = arrays[meta["columns"][0][0]]
+        first, last = int(times.min()), int(times.max())
+        if (meta["last"] is not None and times[0] < meta["last"]) or np.any(times[1:] < times[:-1]):
+            meta["sorted"] = False  # Range query falls back to a full scan.
+        meta["first"] = first if meta["first"] is None else min(meta["first"], first)
+        meta["last"] = last if meta["last"] is None else max(meta["last"], last)
+        meta["rows"] += len(times)
+        self._save_meta()
+
+    def seal(self, level=6, block_rows=65536):
+        """Compress column files block by block, and remove uncompressed files.
+
+        Every column file is split into blocks of `block_rows` rows, the first time of every block and the offset of
+        every compressed block are saved in meta, so that a range query only decompresses the blocks it touches.
+        """
+        self.close()
+        meta = self.meta
+        times = self._map(*meta["columns"][0])
+        bounds = list(range(0, self.rows, block_rows)) + [self.rows]
+        offsets = {}
+        for name, dtype in meta["columns"]:
+            array = self._map(name, dtype)
+            offsets[name] = [0]
+            with open(os.path.join(self.path, name + ".z"), "wb") as f:
+                for i, j in zip(bounds[:-1], bounds[1:]):
+                    offsets[name].append(offsets[name][-1] + f.write(_compress(array[i:j], level)))
+        meta["blocks"] = {"rows": block_rows, "first": [int(times[i]) for i in bounds[:-1]], "offsets": offsets}
+        meta["sealed"] = True
+        self._save_meta()
+        for name, _ in meta["columns"]:
+            os.unlink(os.path.join(self.path, name + ".bin"))
+
+    def read(self, start, end, names):
+        """Read rows in time range `[start, end)`.
+
+        Args:
+            start: Start time, `None` means unbounded.
+            end: End time (exclusive), `None` means unbounded.
+            names: Column names.
+
+        Returns:
+            result: Column arrays, memory mapped if segment not sealed. e.g. `{column: array, ... }`
+        """
+        if not self.sealed:
+            try:
+                return self._read(start, end, names, self._map, 0)
+            except FileNotFoundError:  # Sealed by writer after meta loaded.
+                self.meta = self.load(self.path).meta
+        blocks = self.meta["blocks"]
+        i, j = 0, len(blocks["first"])
+        if self.meta["sorted"]:  # Blocks overlapped with time range.
+            if start is not None:
+                i = max(int(np.searchsorted(blocks["first"], start, "right")) - 1, 0)
+            if end is not None:
+                j = int(np.searchsorted(blocks["first"], end, "left"))
+        if i >= j:
+            return {name: np.empty(0, dtype=dict(self.meta["columns"])[name]) for name in names}
+
+        def read_blocks(name, dtype):
+            offsets = blocks["offsets"][name]
+            with open(os.path.join(self.path, name + ".z"), "rb") as f:
+                f.seek(offsets[i])
+                b = f.read(offsets[j] - offsets[i])
+            base = offsets[i]
+            return np.concatenate([_decompress(b[offsets[k] - base:offsets[k + 1] - base], dtype)
+                                   for k in range(i, j)])
+
+        return self._read(start, end, names, read_blocks, i * blocks["rows"])
+
+    def _read(self, start, end, names, read_column, offset):
+        """Slice columns by time column, `read_column(name, dtype)` reads rows from row `offset`."""
+        dtypes = dict(self.meta["columns"])
+        time_name = self.meta["columns"][0][0]
+        times = read_column(time_name, dtypes[time_name])
+        if self.meta["sorted"]:  # Binary search.
+            i = 0 if start is None else int(np.searchsorted(times, start, "left"))
+            j = len(times) if end is None else int(np.searchsorted(times, end, "left"))
+            select = slice(i, j)
+        else:
+            select = np.ones(len(times), dtype=bool)
+            if start is not None:
+                select &= times >= start
+            if end is not None:
+                select &= times < end
+        return {name: (times if name == time_name else read_column(name, dtypes[name]))[select] for name in names}
+
+    def close(self):
+        if self._files:
+            for f in self._files.values():
+                f.close()
+        self._files = None
+
+    def _open(self):
+        """Open column files for appending, truncate bytes not recorded in meta."""
+        self._files = {}
+        for name, dtype in self.meta["columns"]:
+            path = os.path.join(self.path, name + ".bin")
+            f = open(path, "ab")
+            f.truncate(self.rows * np.dtype(dtype).itemsize)
+            self._files[name] = f
+
+    def _map(self, name, dtype):
+        if not self.rows:
+            return np.empty(0, dtype=dtype)
+        return np.memmap(os.path.join(self.path, name + ".bin"), dtype=dtype, mode="r", shape=(self.rows, ))
+
+    def _save_meta(self):
+        tmp = os.path.join(self.path, "meta.json.tmp")
+        with open(tmp, "w") as f:
+            json.dump(self.meta, f)
+        os.replace(tmp, os.path.join(self.path, "meta.json"))
+
+
+class TickStore:
+    """Columnar tick store.
+
+    Attributes:
+        root: Store root directory.
+        segment_rows: Max rows of a segment, a full segment will be sealed, default is `1000000`.
+        compress_level: zlib compress level of sealed segments, default is `6`.
+    """
+
+    def __init__(self, root, segment_rows=1000000, compress_level=6):
+        """Initialize."""
+        self._root = root
+        self._segment_rows = segment_rows
+        self._compress_level = compress_level
+        self._active = {}  # Active segment of every partition. e.g. `{(kind, symbol): (day, segment), ... }`
+
+    @property
+    def root(self):
+        return self._root
+
+    def append(self, kind, symbol, rows, schema=None):
+        """Append rows, rows are split into day partitions by time column.
+
+        Args:
+            kind: Data kind, e.g. `kline_1m` / `trade` / `orderbook`.
+            symbol: Symbol name, e.g. `BTCUSDT`.
+            rows: Row list (values in schema order, e.g. `[(time, price, ...), ...]`) or a NumPy structured array.
+            schema: Column names and dtypes, e.g. `(("timestamp", "<i8"), ...)`, default is `schema_of(kind)`.
+
+        Returns:
+            count: How many rows appended.
+        """
+        schema = schema or schema_of(kind)
+        if not isinstance(rows, np.ndarray):
+            rows = np.array(rows, dtype=np.dtype([tuple(c) for c in schema]))
+        if not len(rows):
+            return 0
+        names = [name for name, _ in schema]
+        times = rows[names[0]]
+        days = times // DAY_MS
+        bounds = np.flatnonzero(days[1:] != days[:-1]) + 1
+        for part in np.split(np.arange(len(rows)), bounds):
+            i, j = part[0], part[-1] + 1
+            self._append_day(kind, symbol, _day_of(int(times[i])), schema, {name: rows[name][i:j] for name in names})
+        return len(rows)
+
+    def _append_day(self, kind, symbol, day, schema, arrays):
+        key = (kind, symbol)
+        active = self._active.get(key)
+        if active and active[0] != day:
+            if active[0] < day:
+                active[1].seal(self._compress_level)  # Day over.
+            else:
+                active[1].close()
+            active = None
+        if not active:
+            active = (day, self._open_segment(kind, symbol, day, schema))
+            self._active[key] = active
+        segment = active[1]
+        n = len(arrays[schema[0][0]])
+        offset = 0
+        while offset < n:
+            count = min(n - offset, self._segment_rows - segment.rows)
+            segment.append({name: array[offset:offset + count] for name, array in arrays.items()})
+            offset += count
+            if segment.rows >= self._segment_rows:
+                segment.seal(self._compress_level)
+                segment = self._new_segment(kind, symbol, day, schema)
+                self._active[key] = (day, segment)
+
+    def _open_segment(self, kind, symbol, day, schema):
+        """Open the last segment of a day partition if it's not sealed, otherwise create a new one."""
+        path = os.path.join(self._root, kind, symbol, day)
+        names = self._segment_names(path)
+        if names:
+            segment = _Segment.load(os.path.join(path, names[-1]))
+            if not segment.sealed and [tuple(c) for c in segment.meta["columns"]] == [tuple(c) for c in schema]:
+                return segment
+        return self._new_segment(kind, symbol, day, schema)
+
+    def _new_segment(self, kind, symbol, day, schema):
+        path = os.path.join(self._root, kind, symbol, day)
+        names = self._segment_names(path)
+        index = int(names[-1]) + 1 if names else 0
+        return _Segment.create(os.path.join(path, "{:06d}".format(index)), schema)
+
+    def seal(self):
+        """Seal all active segments."""
+        for day, segment in self._active.values():
+            if segment.rows:
+                segment.seal(self._compress_level)
+            else:
+                segment.close()
+        self._active = {}
+
+    def close(self):
+        """Close column files, active segments are left unsealed and will be appended after re-opened."""
+        for day, segment in self._active.values():
+            segment.close()
+        self._active = {}
+
+    def symbols(self, kind):
+        """Get all symbols of a kind."""
+        path = os.path.join(self._root, kind)
+        return sorted(os.listdir(path)) if os.path.isdir(path) else []
+
+    def days(self, kind, symbol):
+        """Get all days of a symbol, e.g. `["20230101", ...]`."""
+        path = os.path.join(self._root, kind, symbol)
+        return sorted(d for d in os.listdir(path) if d.isdigit()) if os.path.isdir(path) else []
+
+    def query(self, kind, symbol, start=None, end=None, columns=None):
+        """Query rows in time range `[start, end)`.
+
+        Args:
+            kind: Data kind, e.g. `kline_1m`.
+            symbol: Symbol name, e.g. `BTCUSDT`.
+            start: Start time, millisecond, `None` means from the first row.
+            end: End time (exclusive), millisecond, `None` means to the last row.
+            columns: Column names, default is all columns.
+
+        Returns:
+            result: Column arrays in time order (time order of appending, if rows appended out of order).
+                e.g. `{"timestamp": array([...]), "price": array([...]), ...}`
+        """
+        first_day = _day_of(start) if start is not None else None
+        last_day = _day_of(end - 1) if end is not None else None
+        pieces = []
+        schema = None
+        for day in self.days(kind, symbol):
+            if (first_day and day < first_day) or (last_day and day > last_day):
+                continue
+            path = os.path.join(self._root, kind, symbol, day)
+            for name in self._segment_names(path):
+                segment = _Segment.load(os.path.join(path, name))
+                meta = segment.meta
+                if not meta["rows"]:
+                    continue
+                if (start is not None and meta["last"] < start) or (end is not None and meta["first"] >= end):
+                    continue
+                schema = schema or meta["columns"]
+                pieces.append(segment.read(start, end, columns or [c[0] for c in schema]))
+        schema = schema or schema_of(kind)
+        dtypes = dict((name, dtype) for name, dtype in schema)
+        names = columns or [name for name, _ in schema]
+        result = {}
+        for name in names:
+            if len(pieces) == 1:
+                result[name] = np.array(pieces[0][name])  # Copy, not memory mapped.
+            elif pieces:
+                result[name] = np.concatenate([piece[name] for piece in pieces])
+            else:
+                result[name] = np.empty(0, dtype=dtypes[name])
+        return result
+
+    @staticmethod
+    def _segment_names(path):
+        if not os.path.isdir(path):
+            return []
+        return sorted(name for name in os.listdir(path) if name.isdigit())
@@ -0,0 +1,192 @@
+# -*- coding:utf-8 -*-
+
+"""
+Exchange clock.
+
+Exchange time is estimated from the monotonic clock plus an offset, the offset and drift between the local monotonic
+clock and exchange server time are estimated by sampling the server time endpoint (e.g. Binance `GET /api/v3/time`)
+periodically, so that reading exchange time costs a `time.monotonic_ns()` call and integer math only, and is never
+affected by the local wall clock being stepped or slewed by NTP.
+
+Every sync takes a few samples back to back and keeps the one with the least round trip time, the server time is
+assumed to be taken at the middle of the round trip. A sync whose best round trip time is much larger than the
+recent minimum (e.g. network congestion) is dropped. Drift is the slope of a least squares line fitted to recent
+offsets, so that exchange time keeps following the exchange between syncs.
+
+Before the first sync, exchange time is the local wall clock when this module imported, advanced by the monotonic
+clock.
+
+Usage:
+    from aioquant.utils import clock
+
+    timestamp = clock.now_exchange_ms()  # Exchange time, millisecond.
+"""
+
+import time
+from collections import deque
+
+from aioquant.utils import logger
+from aioquant.utils.metrics import registry
+from aioquant.tasks import LoopRunTask, SingleTask
+
+__all__ = ("ExchangeClock", "clock", "now_exchange_ms", "now_exchange_us", )
+
+
+class ExchangeClock:
+    """Exchange clock, local monotonic clock plus an estimated offset and drift.
+
+    Attributes:
+        samples: Samples taken back to back in a sync, the one with the least round trip time is used, default is
+            `5`.
+        history: Syncs kept to estimate drift, default is `16`.
+        max_drift_ppm: Max drift estimated, in parts per million, default is `500`.
+        monotonic_ns: Monotonic clock in nanoseconds, default is `time.monotonic_ns`.
+    """
+
+    MIN_DRIFT_SPAN = 60 * 1000000000  # Min time span of syncs to estimate drift, nanoseconds.
+
+    def __init__(self, samples=5, history=16, max_drift_ppm=500, monotonic_ns=time.monotonic_ns):
+        """Initialize."""
+        self._samples = samples
+        self._max_drift_ppb = max_drift_ppm * 1000
+        self._monotonic_ns = monotonic_ns
+        self._ref_mono = monotonic_ns()  # Monotonic time of the latest estimate, nanoseconds.
+        self._ref_offset = time.time_ns() - self._ref_mono  # Exchange time minus monotonic time, nanoseconds.
+        self._drift_ppb = 0  # Exchange clock runs faster than monotonic clock, parts per billion.
+        self._syncs = deque(maxlen=history)  # Accepted syncs. e.g. `[(monotonic time, offset), ... ]`
+        self._rtts = deque(maxlen=history)  # Best round trip time of recent syncs, nanoseconds.
+        self._rtt = None  # Round trip time of the latest sync accepted, nanoseconds.
+        self._synced = False
+        self._task_id = None
+
+    @property
+    def synced(self):
+        return self._synced
+
+    @property
+    def offset_ms(self):
+        """Exchange time minus local wall clock time, millisecond."""
+        return (self.now_exchange_ns() - time.time_ns()) / 1000000
+
+    @property
+    def drift_ppm(self):
+        return self._drift_ppb / 1000
+
+    @property
+    def rtt_ms(self):
+        return self._rtt / 1000000 if self._rtt is not None else None
+
+    def now_exchange_ns(self):
+        """Exchange time, nanosecond."""
+        mono = self._monotonic_ns()
+        return mono + self._ref_offset + (mono - self._ref_mono) * self._drift_ppb // 1000000000
+
+    def now_exchange_us(self):
+        """Exchange time, microsecond."""
+        mono = self._monotonic_ns()
+        return (mono + self._ref_offset + (mono - self._ref_mono) * self._drift_ppb // 1000000000) // 1000
+
+    def now_exchange_ms(self):
+        """Exchange time, millisecond."""
+        mono = self._monotonic_ns()
+        return (mono + self._ref_offset + (mono - self._ref_mono) * self._drift_ppb // 1000000000) // 1000000
+
+    def start(self, fetch_server_time, interval=60):
+        """Sync now and every `interval` seconds, only the first call starts syncing.
+
+        Args:
+            fetch_server_time: Asynchronous function returns `(server time in millisecond, error)`.
+            interval: Sync interval, seconds.
+        """
+        if self._task_id:
+            return
+        self._task_id = LoopRunTask.register(self._sync_task, interval, fetch_server_time, overlap="skip")
+        SingleTask.run(self.sync, fetch_server_time)
+
+    def stop(self):
+        if self._task_id:
+            LoopRunTask.unregister(self._task_id)
+            self._task_id = None
+
+    async def sync(self, fetch_server_time):
+        """Take samples of server time, and update the estimate by the one with the least round trip time.
+
+        Returns:
+            accepted: If the estimate updated.
+        """
+        best = None
+        for _ in range(self._samples):
+            t0 = self._monotonic_ns()
+            server_time, error = await fetch_server_time()
+            t1 = self._monotonic_ns()
+            if error:
+                logger.warn("fetch server time error:", error, caller=self)
+                continue
+            if best is None or t1 - t0 < best[2] - best[0]:
+                best = (t0, server_time, t1)
+        if best is None:
+            return False
+        return self.add_sample(*best)
+
+    def add_sample(self, t0, server_time, t1):
+        """Update the estimate by a sample.
+
+        Args:
+            t0: Monotonic time the request sent, nanoseconds.
+            server_time: Server time, millisecond.
+            t1: Monotonic time the response received, nanoseconds.
+
+        Returns:
+            accepted: If the estimate updated, a sample with a round trip time much larger than recent ones is
+                dropped.
+        """
+        rtt = t1 - t0
+        self._rtts.append(rtt)
+        min_rtt = min(self._rtts)
+        if self._synced and rtt > max(min_rtt * 2, min_rtt + 5000000):
+            logger.debug("sample dropped, rtt(ms):", rtt / 1000000, "min rtt(ms):", min_rtt / 1000000, caller=self)
+            return False
+        mid = (t0 + t1) // 2
+        offset = server_time * 1000000 + 500000 - mid  # Server time is truncated to millisecond.
+        self._syncs.append((mid, offset))
+        drift = self._fit_drift()
+        if drift is not None:
+            self._drift_ppb = drift
+            offset = self._fit_offset(mid)
+        self._ref_mono = mid
+        self._ref_offset = offset
+        self._rtt = rtt
+        self._synced = True
+        registry.gauge("aioquant_clock_offset_ms", "Exchange time minus local wall clock time.").set(self.offset_ms)
+        registry.gauge("aioquant_clock_rtt_ms", "Round trip time of the latest clock sync.").set(rtt / 1000000)
+        registry.gauge("aioquant_clock_drift_ppm", "Drift of exchange clock to monotonic clock.").set(self.drift_ppm)
+        return True
+
+    def _fit_drift(self):
+        """Slope of the least squares line of offsets, parts per billion, or `None` if syncs span too short."""
+        if len(self._syncs) < 3 or self._syncs[-1][0] - self._syncs[0][0] < self.MIN_DRIFT_SPAN:
+            return None
+        x0, y0 = self._syncs[0]
+        n = len(self._syncs)
+        mean_x = sum(x - x0 for x, _ in self._syncs) / n
+        mean_y = sum(y - y0 for _, y in self._syncs) / n
+        sxx = sum((x - x0 - mean_x) ** 2 for x, _ in self._syncs)
+        sxy = sum((x - x0 - mean_x) * (y - y0 - mean_y) for x, y in self._syncs)
+        drift = int(sxy / sxx * 1000000000)
+        return max(-self._max_drift_ppb, min(self._max_drift_ppb, drift))
+
+    def _fit_offset(self, mono):
+        """Offset at monotonic time `mono` on the fitted line."""
+        x0, y0 = self._syncs[0]
+        n = len(self._syncs)
+        mean_x = sum(x - x0 for x, _ in self._syncs) / n + x0
+        mean_y = sum(y - y0 for _, y in self._syncs) / n + y0
+        return int(mean_y + (mono - mean_x) * self._drift_ppb / 1000000000)
+
+    async def _sync_task(self, fetch_server_time, *args, **kwargs):
+        await self.sync(fetch_server_time)
+
+
+clock = ExchangeClock()
+now_exchange_ms = clock.now_exchange_ms
+now_exchange_us = clock.now_exchange_us
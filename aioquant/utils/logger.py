@@ -3,6 +3,10 @@
 """
 Log printer.
 
+Log records are written to console or file synchronously by default. If `queue_size` is set, the event loop thread
+only puts records into a bounded queue, and a background thread writes them in batches, records will be dropped and
+counted if the queue is full.
+
 Author: HuangTao
 Date:   2018/04/08
 Email:  huangtao@ifclover.com
@@ -10,15 +14,27 @@ Email:  huangtao@ifclover.com
 
 import os
 import sys
+import json
+import queue
+import atexit
 import shutil
 import logging
+import threading
 import traceback
-from logging.handlers import TimedRotatingFileHandler
+from logging.handlers import TimedRotatingFileHandler, BaseRotatingHandler, QueueHandler
 
 initialized = False
 
+_root = logging.getLogger()
+_sites = {}  # Class and function name of each call site. e.g. `{(code, caller class): "Class.func", ... }`
+_queue_handler = None  # Queue handler in asynchronous mode.
+_writer = None  # Background writer in asynchronous mode.
+
+BANNER = "*" * 60
+
 
-def initLogger(level="DEBUG", path=None, name=None, clear=False, backup_count=0, console=True):
+def initLogger(level="DEBUG", path=None, name=None, clear=False, backup_count=0, console=True, fmt="text",
+               queue_size=0, batch_size=100):
     """Initialize logger.
 
     Args:
@@ -29,8 +45,11 @@ def initLogger(level="DEBUG", path=None, name=None, clear=False, backup_count=0,
         backup_count: How many log file to be saved. We will save log file per day at middle nigh,
             default is `0` to save file permanently.
         console: If print log to console, otherwise print to log file.
+        fmt: Output format, `text` or `json` (one JSON object per line), default is `text`.
+        queue_size: Max records waiting to be written by background thread, default is `0` to write synchronously.
+        batch_size: Max records written by background thread at a time, default is `100`.
     """
-    global initialized
+    global initialized, _queue_handler, _writer
     if initialized:
         return
     path = path or "/var/log/aioquant"
@@ -48,41 +67,107 @@ def initLogger(level="DEBUG", path=None, name=None, clear=False, backup_count=0,
         logfile = os.path.join(path, name)
         handler = TimedRotatingFileHandler(logfile, "midnight", backupCount=backup_count)
         print("init logger ...", logfile)
-    fmt_str = "%(levelname)1.1s [%(asctime)s] %(message)s"
-    fmt = logging.Formatter(fmt=fmt_str, datefmt=None)
-    handler.setFormatter(fmt)
-    logger.addHandler(handler)
+    if fmt == "json":
+        handler.setFormatter(_JsonFormatter())
+    else:
+        fmt_str = "%(levelname)1.1s [%(asctime)s] %(message)s"
+        handler.setFormatter(logging.Formatter(fmt=fmt_str, datefmt=None))
+    if queue_size > 0:
+        q = queue.Queue(queue_size)
+        _queue_handler = _DropQueueHandler(q)
+        _writer = _LogWriter(handler, q, batch_size)
+        _writer.start()
+        atexit.register(_writer.stop)
+        logger.addHandler(_queue_handler)
+    else:
+        logger.addHandler(handler)
     initialized = True
 
 
+def stats():
+    """Get statistics of asynchronous mode.
+
+    Returns:
+        stats: e.g. `{"queued": 0, "dropped": 0, "written": 100}`, or `None` if not in asynchronous mode.
+    """
+    if not _queue_handler:
+        return None
+    return {
+        "queued": _queue_handler.queue.qsize(),
+        "dropped": _queue_handler.dropped,
+        "written": _writer.written
+    }
+
+
 def info(*args, **kwargs):
-    func_name, kwargs = _log_msg_header(*args, **kwargs)
-    logging.info(_log(func_name, *args, **kwargs))
+    _emit(logging.INFO, args, kwargs)
 
 
 def warn(*args, **kwargs):
-    msg_header, kwargs = _log_msg_header(*args, **kwargs)
-    logging.warning(_log(msg_header, *args, **kwargs))
+    _emit(logging.WARNING, args, kwargs)
 
 
 def debug(*args, **kwargs):
-    msg_header, kwargs = _log_msg_header(*args, **kwargs)
-    logging.debug(_log(msg_header, *args, **kwargs))
+    _emit(logging.DEBUG, args, kwargs)
 
 
 def error(*args, **kwargs):
-    logging.error("*" * 60)
-    msg_header, kwargs = _log_msg_header(*args, **kwargs)
-    logging.error(_log(msg_header, *args, **kwargs))
-    logging.error("*" * 60)
+    _emit(logging.ERROR, args, kwargs, banner=True)
 
 
 def exception(*args, **kwargs):
-    logging.error("*" * 60)
-    msg_header, kwargs = _log_msg_header(*args, **kwargs)
-    logging.error(_log(msg_header, *args, **kwargs))
-    logging.error(traceback.format_exc())
-    logging.error("*" * 60)
+    if _root.isEnabledFor(logging.ERROR):
+        _emit(logging.ERROR, args, kwargs, banner=True, exc=traceback.format_exc())
+
+
+class _LazyMessage:
+    """Log message formatted only when a handler emits it.
+
+    Attributes:
+        site: Call site, e.g. `Class.func`.
+        banner: If wrap message with `*` banner lines in text format.
+        exc: Traceback text.
+    """
+
+    __slots__ = ("site", "args", "kwargs", "banner", "exc", "_body", )
+
+    def __init__(self, site, args, kwargs, banner=False, exc=None):
+        self.site = site
+        self.args = args
+        self.kwargs = kwargs
+        self.banner = banner
+        self.exc = exc
+        self._body = None
+
+    @property
+    def body(self):
+        """Message body without header."""
+        if self._body is None:
+            self._body = _log("", *self.args, **self.kwargs)
+            self.args = self.kwargs = None
+        return self._body
+
+    def __str__(self):
+        s = "[-] [{site}] {body}".format(site=self.site, body=self.body)
+        if self.exc:
+            s += "\n" + self.exc
+        if self.banner:
+            s = "\n".join((BANNER, s, BANNER))
+        return s
+
+
+def _emit(level, args, kwargs, banner=False, exc=None):
+    """Log a message if level enabled, message header and arguments are formatted lazily.
+
+    NOTE:
+        logger.xxx(... , caller=self) for instance method.
+        logger.xxx(... , caller=cls) for class method.
+    """
+    if not _root.isEnabledFor(level):
+        return
+    caller = kwargs.pop("caller", None)
+    site = _log_site(sys._getframe(2).f_code, caller)
+    logging.log(level, _LazyMessage(site, args, kwargs, banner, exc))
 
 
 def _log(msg_header, *args, **kwargs):
@@ -104,26 +189,127 @@ def _log(msg_header, *args, **kwargs):
     return _log_msg
 
 
-def _log_msg_header(*args, **kwargs):
-    """Fetch log message header.
+def _log_site(code, caller=None):
+    """Fetch class and function name of log call site, cached per call site.
 
-    NOTE:
-        logger.xxx(... , caller=self) for instance method.
-        logger.xxx(... , caller=cls) for class method.
+    Args:
+        code: Code object of the function which calls logger.
+        caller: Instance or class which calls logger.
+    """
+    if caller is not None and not hasattr(caller, "__name__"):
+        caller = caller.__class__
+    key = (code, caller)
+    site = _sites.get(key)
+    if site is None:
+        cls_name = getattr(caller, "__name__", "") if caller is not None else ""
+        site = "{cls_name}.{func_name}".format(cls_name=cls_name, func_name=code.co_name)
+        _sites[key] = site
+    return site
+
+
+class _JsonFormatter(logging.Formatter):
+    """Format a record as one line JSON object."""
+
+    def format(self, record):
+        msg = record.msg
+        d = {"time": self.formatTime(record), "level": record.levelname}
+        if isinstance(msg, _LazyMessage):
+            d["caller"] = msg.site
+            d["msg"] = msg.body.rstrip()
+            if msg.exc:
+                d["exc"] = msg.exc
+        else:
+            d["msg"] = record.getMessage()
+        return json.dumps(d, ensure_ascii=False)
+
+
+class _DropQueueHandler(QueueHandler):
+    """Put records into a bounded queue without blocking, drop and count records if queue is full."""
+
+    def __init__(self, q):
+        super(_DropQueueHandler, self).__init__(q)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Format arguments in caller thread, since they may be changed after logging.
+        if isinstance(record.msg, _LazyMessage):
+            record.msg.body
+        elif record.args:
+            record.msg = record.getMessage()
+            record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class _LogWriter(threading.Thread):
+    """Background thread writing records in batches.
+
+    Attributes:
+        handler: Handler to write records, `StreamHandler` or `TimedRotatingFileHandler`.
+        queue: Queue of records.
+        batch_size: Max records written at a time.
     """
-    cls_name = ""
-    func_name = sys._getframe().f_back.f_back.f_code.co_name
-    session_id = "-"
-    try:
-        _caller = kwargs.get("caller", None)
-        if _caller:
-            if not hasattr(_caller, "__name__"):
-                _caller = _caller.__class__
-            cls_name = _caller.__name__
-            del kwargs["caller"]
-    except:
-        pass
-    finally:
-        msg_header = "[{session_id}] [{cls_name}.{func_name}] ".format(cls_name=cls_name, func_name=func_name,
-                                                                       session_id=session_id)
-        return msg_header, kwargs
+
+    def __init__(self, handler, q, batch_size):
+        super(_LogWriter, self).__init__(name="LogWriter", daemon=True)
+        self._handler = handler
+        self._queue = q
+        self._batch_size = batch_size
+        self._stopped = False
+        self.written = 0
+
+    def stop(self):
+        """Write all records in queue and stop thread."""
+        if self._stopped:
+            return
+        self._stopped = True
+        self._queue.put(None)
+        self.join()
+        self._handler.close()
+
+    def run(self):
+        while True:
+            records = [self._queue.get()]
+            while len(records) < self._batch_size:
+                try:
+                    records.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = None in records
+            if stop:
+                records = [r for r in records if r is not None]
+            try:
+                self._write(records)
+            except Exception:
+                traceback.print_exc()
+            if stop:
+                break
+
+    def _write(self, records):
+        handler = self._handler
+        lines = []
+        for record in records:
+            if isinstance(handler, BaseRotatingHandler) and handler.shouldRollover(record):
+                self._flush(lines)
+                lines = []
+                handler.doRollover()
+            lines.append(handler.format(record))
+        self._flush(lines)
+        self.written += len(records)
+
+    def _flush(self, lines):
+        if not lines:
+            return
+        handler = self._handler
+        if handler.stream is None:
+            handler.stream = handler._open()
+        handler.stream.write(handler.terminator.join(lines) + handler.terminator)
+        handler.flush()
@@ -0,0 +1,250 @@
+# -*- coding:utf-8 -*-
+
+"""
+Metrics registry.
+
+Counters, gauges and latency histograms kept in process, and exposed in Prometheus text format through a local HTTP
+endpoint and/or dumped to log periodically.
+
+Latency histograms are HDR style: values are recorded in microseconds into log-linear buckets (every power of 2 is
+divided into 16 sub buckets), so that any percentile can be read with a relative error less than about 6%, and
+recording a value is O(1) without any sorting.
+
+Config in `METRICS`:
+    host: HTTP endpoint listen host, default is `127.0.0.1`.
+    port: HTTP endpoint listen port, e.g. `9100`, default is `None` to disable HTTP endpoint.
+    probe_interval: Event loop lag probe interval(second), default is `1`.
+    log_interval: Dump metrics to log interval(second), default is `0` to disable.
+    trace: If stamp published market events for latency tracing, see `aioquant.utils.trace`, default is `false`.
+"""
+
+import math
+import asyncio
+
+from aioquant.utils import logger
+from aioquant.configure import config
+
+__all__ = ("registry", "Counter", "Gauge", "Histogram", "start", )
+
+
+class Counter:
+    """Monotonic counter."""
+
+    TYPE = "counter"
+
+    __slots__ = ("value", )
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, n=1):
+        self.value += n
+
+    def samples(self, name, labels):
+        yield name, labels, self.value
+
+
+class Gauge:
+    """Gauge, a value can go up and down."""
+
+    TYPE = "gauge"
+
+    __slots__ = ("value", )
+
+    def __init__(self):
+        self.value = 0
+
+    def set(self, value):
+        self.value = value
+
+    def inc(self, n=1):
+        self.value += n
+
+    def dec(self, n=1):
+        self.value -= n
+
+    def samples(self, name, labels):
+        yield name, labels, self.value
+
+
+class Histogram:
+    """HDR style latency histogram, values are seconds.
+
+    Attributes:
+        quantiles: Quantiles exposed, default is `(0.5, 0.9, 0.99, 0.999)`.
+    """
+
+    TYPE = "summary"
+
+    SUB_BUCKETS = 16  # Sub buckets per power of 2.
+
+    __slots__ = ("_buckets", "_count", "_sum", "_max", "_quantiles", )
+
+    def __init__(self, quantiles=(0.5, 0.9, 0.99, 0.999)):
+        self._buckets = {}  # Count of every bucket. e.g. `{bucket index: count, ... }`
+        self._count = 0
+        self._sum = 0
+        self._max = 0
+        self._quantiles = quantiles
+
+    @property
+    def count(self):
+        return self._count
+
+    @property
+    def sum(self):
+        return self._sum
+
+    @property
+    def max(self):
+        return self._max
+
+    def observe(self, value):
+        """Record a value, in seconds."""
+        self._count += 1
+        self._sum += value
+        if value > self._max:
+            self._max = value
+        us = int(value * 1000000)
+        if us < self.SUB_BUCKETS:
+            index = us if us > 0 else 0
+        else:
+            m, e = math.frexp(us)
+            index = e * self.SUB_BUCKETS + int((m - 0.5) * 2 * self.SUB_BUCKETS)
+        self._buckets[index] = self._buckets.get(index, 0) + 1
+
+    def percentile(self, q):
+        """Get the value at quantile `q` (0 ~ 1), in seconds, the upper bound of the bucket it falls in."""
+        if not self._count:
+            return 0
+        rank = max(1, math.ceil(q * self._count))
+        n = 0
+        for index in sorted(self._buckets):
+            n += self._buckets[index]
+            if n >= rank:
+                return min(self._bucket_upper(index) / 1000000, self._max)
+        return self._max
+
+    def reset(self):
+        self._buckets = {}
+        self._count = 0
+        self._sum = 0
+        self._max = 0
+
+    def samples(self, name, labels):
+        for q in self._quantiles:
+            yield name, dict(labels, quantile=str(q)), self.percentile(q)
+        yield name + "_sum", labels, self._sum
+        yield name + "_count", labels, self._count
+
+    def _bucket_upper(self, index):
+        if index < self.SUB_BUCKETS:
+            return index + 1
+        e, sub = divmod(index, self.SUB_BUCKETS)
+        return math.ldexp(0.5 + (sub + 1) / (2 * self.SUB_BUCKETS), e)
+
+
+class MetricsRegistry:
+    """Metrics registry, metrics are identified by name and labels.
+    """
+
+    def __init__(self):
+        self._families = {}  # e.g. `{name: {"type": Counter, "help": "...", "metrics": {labels: metric}}, ... }`
+
+    def counter(self, name, help="", **labels) -> Counter:
+        """Get a counter, create a new one if not exists.
+
+        Args:
+            name: Metric name, e.g. `aioquant_tasks_created_total`.
+            help: Metric description.
+            labels: Metric labels, e.g. `symbol="BTCUSDT"`.
+        """
+        return self._get(Counter, name, help, labels)
+
+    def gauge(self, name, help="", **labels) -> Gauge:
+        """Get a gauge, create a new one if not exists."""
+        return self._get(Gauge, name, help, labels)
+
+    def histogram(self, name, help="", **labels) -> Histogram:
+        """Get a latency histogram, create a new one if not exists."""
+        return self._get(Histogram, name, help, labels)
+
+    def _get(self, cls, name, help, labels):
+        family = self._families.get(name)
+        if family is None:
+            family = {"type": cls, "help": help, "metrics": {}}
+            self._families[name] = family
+        elif family["type"] is not cls:
+            raise ValueError("metric {} is registered as {}".format(name, family["type"].TYPE))
+        key = tuple(sorted(labels.items()))
+        metric = family["metrics"].get(key)
+        if metric is None:
+            metric = cls()
+            family["metrics"][key] = metric
+        return metric
+
+    def expose(self):
+        """Get all metrics in Prometheus text format."""
+        lines = []
+        for name, family in sorted(self._families.items()):
+            if family["help"]:
+                lines.append("# HELP {} {}".format(name, family["help"]))
+            lines.append("# TYPE {} {}".format(name, family["type"].TYPE))
+            for key, metric in family["metrics"].items():
+                for sample_name, labels, value in metric.samples(name, dict(key)):
+                    lines.append("{}{} {}".format(sample_name, self._format_labels(labels), value))
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def _format_labels(labels):
+        if not labels:
+            return ""
+        items = ",".join('{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"'))
+                         for k, v in labels.items())
+        return "{" + items + "}"
+
+
+registry = MetricsRegistry()
+
+
+async def _probe_loop_lag(*args, **kwargs):
+    """Measure how long a callback waits in event loop before executed, and how many tasks are pending."""
+    loop = asyncio.get_event_loop()
+    lag = registry.histogram("aioquant_loop_lag_seconds", "Delay of a callback scheduled by call_soon.")
+    start = loop.time()
+    loop.call_soon(lambda: lag.observe(loop.time() - start))
+    registry.gauge("aioquant_loop_tasks", "Tasks not finished in event loop.").set(len(asyncio.all_tasks(loop)))
+
+
+async def _dump_to_log(*args, **kwargs):
+    logger.info("metrics:\n" + registry.expose(), caller=registry)
+
+
+async def _handle_http(request):
+    from aiohttp import web
+    return web.Response(text=registry.expose(), content_type="text/plain", charset="utf-8")
+
+
+async def _start_http(host, port):
+    from aiohttp import web
+    app = web.Application()
+    app.router.add_get("/metrics", _handle_http)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    logger.info("metrics endpoint: http://{}:{}/metrics".format(host, port), caller=registry)
+
+
+def start():
+    """Start loop lag probe, HTTP endpoint and log dump configured by `METRICS` in config file."""
+    from aioquant.utils import trace
+    from aioquant.tasks import LoopRunTask, SingleTask
+    from aioquant.heartbeat import OVERLAP_SKIP
+    settings = config.metrics or {}
+    trace.enabled = bool(settings.get("trace", False))
+    LoopRunTask.register(_probe_loop_lag, settings.get("probe_interval", 1), overlap=OVERLAP_SKIP)
+    if settings.get("log_interval", 0) > 0:
+        LoopRunTask.register(_dump_to_log, settings["log_interval"], overlap=OVERLAP_SKIP)
+    if settings.get("port"):
+        SingleTask.run(_start_http, settings.get("host", "127.0.0.1"), settings["port"])
@@ -0,0 +1,160 @@
+# -*- coding:utf-8 -*-
+
+"""
+Kline ring buffer.
+
+Fixed capacity columnar ring buffer for OHLCV history, backed by NumPy arrays.
+Every value is written twice, at `index` and `index + capacity`, so that the latest `n` values of a column are always
+a contiguous slice, and `window()` returns a view without copying.
+"""
+
+import numpy as np
+
+__all__ = ("KlineRingBuffer", "KlineBufferStore", )
+
+
+class KlineRingBuffer:
+    """Kline ring buffer.
+
+    Attributes:
+        capacity: Max klines saved, the oldest kline will be dropped when buffer is full.
+    """
+
+    COLUMNS = ("start_time", "open", "high", "low", "close", "volume")
+
+    def __init__(self, capacity):
+        """Initialize."""
+        self._capacity = capacity
+        self._data = np.zeros((len(self.COLUMNS), capacity * 2), dtype=np.float64)
+        self._index = -1  # Index of the latest kline, in range [0, capacity).
+        self._size = 0  # How many klines saved.
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def capacity(self):
+        return self._capacity
+
+    @property
+    def full(self):
+        return self._size == self._capacity
+
+    @property
+    def start_time(self):
+        return self.column("start_time")
+
+    @property
+    def open(self):
+        return self.column("open")
+
+    @property
+    def high(self):
+        return self.column("high")
+
+    @property
+    def low(self):
+        return self.column("low")
+
+    @property
+    def close(self):
+        return self.column("close")
+
+    @property
+    def volume(self):
+        return self.column("volume")
+
+    def update(self, kline):
+        """Update buffer by a kline, a new kline will be appended, and an update for the latest kline will replace it.
+
+        Args:
+            kline: Kline object.
+
+        Returns:
+            new_bar: `True` if the kline is appended as a new bar, `False` if the latest bar is replaced.
+        """
+        row = (float(kline.start_time), float(kline.open), float(kline.high), float(kline.low), float(kline.close),
+               float(kline.base_asset_volume))
+        if self._size and self._data[0, self._index] == row[0]:
+            self._write(self._index, row)
+            return False
+        self.append(*row)
+        return True
+
+    def append(self, start_time, open, high, low, close, volume):
+        """Append a new bar, O(1)."""
+        self._index = (self._index + 1) % self._capacity
+        self._write(self._index, (start_time, open, high, low, close, volume))
+        if self._size < self._capacity:
+            self._size += 1
+
+    def replace_last(self, start_time, open, high, low, close, volume):
+        """Replace the latest bar, O(1)."""
+        if not self._size:
+            self.append(start_time, open, high, low, close, volume)
+            return
+        self._write(self._index, (start_time, open, high, low, close, volume))
+
+    def window(self, n=None):
+        """Get the latest n bars.
+
+        Args:
+            n: How many bars, default is all bars saved.
+
+        Returns:
+            window: A 2D array view, shape is `(len(COLUMNS), n)`, oldest bar first.
+        """
+        n = self._size if n is None else min(n, self._size)
+        end = self._index + self._capacity + 1
+        return self._data[:, end - n:end]
+
+    def column(self, name, n=None):
+        """Get the latest n values of a column, a 1D array view, oldest value first.
+
+        Args:
+            name: Column name, see `COLUMNS`.
+            n: How many values, default is all values saved.
+        """
+        return self.window(n)[self.COLUMNS.index(name)]
+
+    def last(self, name, offset=0):
+        """Get a value of a column, `offset=0` for the latest bar, `offset=1` for the previous one ..."""
+        if offset >= self._size:
+            return None
+        return float(self._data[self.COLUMNS.index(name), self._index + self._capacity - offset])
+
+    def _write(self, index, row):
+        self._data[:, index] = row
+        self._data[:, index + self._capacity] = row
+
+
+class KlineBufferStore:
+    """Kline ring buffers keyed by symbol and interval.
+
+    Attributes:
+        capacity: Capacity of every ring buffer.
+    """
+
+    def __init__(self, capacity):
+        """Initialize."""
+        self._capacity = capacity
+        self._buffers = {}  # e.g. `{(symbol, interval): buffer, ... }`
+
+    def get(self, symbol, interval):
+        """Get ring buffer for a symbol and interval, create a new one if not exists."""
+        key = (symbol, interval)
+        buffer = self._buffers.get(key)
+        if buffer is None:
+            buffer = KlineRingBuffer(self._capacity)
+            self._buffers[key] = buffer
+        return buffer
+
+    def update(self, kline):
+        """Update the ring buffer that kline belongs to.
+
+        Returns:
+            buffer: Ring buffer.
+            new_bar: `True` if the kline is appended as a new bar.
+        """
+        buffer = self.get(kline.symbol, kline.interval)
+        return buffer, buffer.update(kline)
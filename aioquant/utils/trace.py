@@ -0,0 +1,112 @@
+# -*- coding:utf-8 -*-
+
+"""
+Market data latency tracing.
+
+If tracing is enabled (`"trace": true` in `METRICS` config), every event published while a Websocket message being
+processed carries trace stamps in AMQP headers, the payload format is unchanged:
+    trace_exchange: Event time given by exchange, e.g. Binance `E`.
+    trace_receive: Time the Websocket message received.
+    trace_publish: Time the event published to RabbitMQ.
+    trace_consume: Time the message consumed from RabbitMQ, added by consumer.
+All stamps are exchange time in microseconds (see `aioquant.utils.clock`, the local wall clock advanced by the
+monotonic clock if not synced), so that latency from exchange is not skewed by local clock offset or NTP slewing.
+When the event is delivered to strategy callback, latency of each stage is recorded into histogram
+`aioquant_trace_latency_seconds`, labeled by stage, exchange and routing key:
+    exchange_to_receive: Exchange and network (including the error of exchange clock estimate).
+    receive_to_publish: Exchange adapter and outbox of publisher.
+    publish_to_consume: RabbitMQ.
+    consume_to_callback: Consumer scheduling, e.g. waiting for a conflated callback.
+    total: Exchange time to callback start.
+A negative latency (clock of exchange or another host is ahead) is recorded as 0.
+
+NOTE:
+    Only events published synchronously in Websocket message callback are stamped, the adapter should call
+    `set_exchange_time` with exchange event time when processing a message.
+"""
+
+from aioquant.utils import clock
+from aioquant.utils.metrics import registry
+
+__all__ = ("enabled", "begin", "end", "set_exchange_time", "current", "stamp", "observe", )
+
+
+enabled = False  # If stamp published events.
+
+_context = None  # Stamps of the Websocket message being processed.
+_histograms = {}  # e.g. `{(stage, exchange, routing_key): histogram, ... }`
+
+_STAGES = (
+    ("exchange_to_receive", "trace_exchange", "trace_receive"),
+    ("receive_to_publish", "trace_receive", "trace_publish"),
+    ("publish_to_consume", "trace_publish", "trace_consume"),
+    ("consume_to_callback", "trace_consume", "trace_callback"),
+    ("total", "trace_exchange", "trace_callback")
+)
+
+
+def now_us():
+    """Current exchange time in microseconds."""
+    return clock.now_exchange_us()
+
+
+def begin():
+    """Start processing a Websocket message, stamp receive time."""
+    global _context
+    if enabled:
+        _context = {"trace_receive": now_us()}
+
+
+def end():
+    """Websocket message processed."""
+    global _context
+    _context = None
+
+
+def set_exchange_time(timestamp):
+    """Stamp exchange event time of the message being processed.
+
+    Args:
+        timestamp: Exchange event time, millisecond.
+    """
+    if _context is not None and timestamp:
+        _context["trace_exchange"] = int(timestamp) * 1000
+
+
+def current():
+    """Get a copy of stamps of the message being processed, or `None` if not tracing."""
+    return dict(_context) if _context is not None else None
+
+
+def stamp(headers, name):
+    """Add a stamp into AMQP headers, if the message is traced.
+
+    Args:
+        headers: AMQP headers.
+        name: Stamp name, e.g. `trace_consume`.
+    """
+    if headers and "trace_receive" in headers:
+        headers[name] = now_us()
+
+
+def observe(headers, exchange, routing_key):
+    """Stamp callback start time, and record latency of every stage.
+
+    Args:
+        headers: AMQP headers.
+        exchange: Exchange name, e.g. `Kline`.
+        routing_key: Routing key, e.g. `binance.BTCUSDT`.
+    """
+    if not headers or "trace_receive" not in headers:
+        return
+    headers["trace_callback"] = now_us()
+    for stage, first, last in _STAGES:
+        if first not in headers or last not in headers:
+            continue
+        key = (stage, exchange, routing_key)
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = registry.histogram("aioquant_trace_latency_seconds", "Market data latency of each stage.",
+                                           stage=stage, exchange=exchange, routing_key=routing_key)
+            _histograms[key] = histogram
+        histogram.observe(max(headers[last] - headers[first], 0) / 1000000)
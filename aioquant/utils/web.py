@@ -9,15 +9,23 @@ Email:  huangtao@ifclover.com
 """
 
 import json
+import asyncio
+import inspect
 
 import aiohttp
 from urllib.parse import urlparse
 
+from aioquant.utils import trace
 from aioquant.utils import logger
 from aioquant.configure import config
+from aioquant.utils.metrics import registry
 from aioquant.tasks import LoopRunTask, SingleTask
-from aioquant.utils.decorator import async_method_locker
 
+try:
+    import orjson
+    json_loads = orjson.loads  # Fast JSON parser, if installed.
+except ImportError:
+    json_loads = json.loads
 
 __all__ = ("Websocket", "AsyncHttpRequests", )
 
@@ -31,21 +39,33 @@ class Websocket:
         process_callback: Asynchronous callback function will be called if any stream data receive from Websocket
             connection, this function only callback `text/json` message. e.g.
                 async def process_callback(json_message): pass
+            A normal function is allowed too, it will be called directly in the receiving loop without creating a
+            new task, e.g.
+                def process_callback(json_message): pass
         process_binary_callback: Asynchronous callback function will be called if any stream data receive from Websocket
             connection, this function only callback `binary` message. e.g.
                 async def process_binary_callback(binary_message): pass
         check_conn_interval: Check Websocket connection interval time(seconds), default is 10s.
+        heartbeat: Send ping frame every `heartbeat` seconds and close the connection if pong not received, default is
+            `None` (only respond to server's ping).
+        disconnected_callback: A normal function will be called directly after the connection closed, e.g.
+                def disconnected_callback(): pass
     """
 
     def __init__(self, url, connected_callback=None, process_callback=None, process_binary_callback=None,
-                 check_conn_interval=10):
+                 check_conn_interval=10, heartbeat=None, disconnected_callback=None):
         """Initialize."""
         self._url = url
         self._connected_callback = connected_callback
         self._process_callback = process_callback
         self._process_binary_callback = process_binary_callback
+        self._process_directly = process_callback and not inspect.iscoroutinefunction(process_callback)
         self._check_conn_interval = check_conn_interval
+        self._heartbeat = heartbeat
+        self._disconnected_callback = disconnected_callback
+        self._session = None  # HTTP client session.
         self._ws = None  # Websocket connection object.
+        self._reconnect_locker = asyncio.Lock()  # Per connection, so that connections re-connect independently.
 
         LoopRunTask.register(self._check_connection, self._check_conn_interval)
         SingleTask.run(self._connect)
@@ -55,7 +75,11 @@ class Websocket:
         return self._ws
 
     async def close(self):
-        await self._ws.close()
+        if self._ws:
+            await self._ws.close()
+        if self._session:
+            await self._session.close()
+            self._session = None
 
     async def ping(self, message: bytes = b"") -> None:
         await self._ws.ping(message)
@@ -66,9 +90,10 @@ class Websocket:
     async def _connect(self) -> None:
         logger.info("url:", self._url, caller=self)
         proxy = config.proxy
-        session = aiohttp.ClientSession()
+        if not self._session:
+            self._session = aiohttp.ClientSession()
         try:
-            self._ws = await session.ws_connect(self._url, proxy=proxy)
+            self._ws = await self._session.ws_connect(self._url, proxy=proxy, heartbeat=self._heartbeat)
         except aiohttp.ClientConnectorError:
             logger.error("connect to Websocket server error! url:", self._url, caller=self)
             return
@@ -76,12 +101,14 @@ class Websocket:
             SingleTask.run(self._connected_callback)
         SingleTask.run(self._receive)
 
-    @async_method_locker("Websocket.reconnect.locker", False)
     async def reconnect(self) -> None:
-        """Re-connect to Websocket server."""
-        logger.warn("reconnecting to Websocket server right now!", caller=self)
-        await self.close()
-        await self._connect()
+        """Re-connect to Websocket server, skipped if this connection is re-connecting already."""
+        if self._reconnect_locker.locked():
+            return
+        async with self._reconnect_locker:
+            logger.warn("reconnecting to Websocket server right now!", caller=self)
+            await self.close()
+            await self._connect()
 
     async def _receive(self):
         """Receive stream message from Websocket connection."""
@@ -89,10 +116,19 @@ class Websocket:
             if msg.type == aiohttp.WSMsgType.TEXT:
                 if self._process_callback:
                     try:
-                        data = json.loads(msg.data)
+                        data = json_loads(msg.data)
                     except:
                         data = msg.data
-                    SingleTask.run(self._process_callback, data)
+                    if self._process_directly:
+                        trace.begin()
+                        try:
+                            self._process_callback(data)
+                        except Exception as e:
+                            logger.exception("process message error:", e, caller=self)
+                        finally:
+                            trace.end()
+                    else:
+                        SingleTask.run(self._process_callback, data)
             elif msg.type == aiohttp.WSMsgType.BINARY:
                 if self._process_binary_callback:
                     SingleTask.run(self._process_binary_callback, msg.data)
@@ -103,6 +139,11 @@ class Websocket:
                 logger.error("receive event ERROR:", msg, caller=self)
             else:
                 logger.warn("unhandled msg:", msg, caller=self)
+        if self._disconnected_callback:
+            try:
+                self._disconnected_callback()
+            except Exception as e:
+                logger.exception("disconnected callback error:", e, caller=self)
 
     async def _check_connection(self, *args, **kwargs) -> None:
         """Check Websocket connection, if connection closed, re-connect immediately."""
@@ -142,6 +183,10 @@ class AsyncHttpRequests(object):
     # Every domain name holds a connection session, for less system resource utilization and faster request speed.
     _SESSIONS = {}  # {"domain-name": session, ... }
 
+    # Keep-alive connection pool of every session.
+    LIMIT_PER_HOST = 32  # Max connections per host.
+    KEEPALIVE_TIMEOUT = 60  # Idle keep-alive connection will be closed after this seconds.
+
     @classmethod
     async def fetch(cls, method, url, params=None, body=None, data=None, headers=None, timeout=30, **kwargs):
         """ Create a HTTP request.
@@ -157,6 +202,7 @@ class AsyncHttpRequests(object):
 
             kwargs:
                 proxy: HTTP proxy.
+                headers_callback: A function will be called with response headers, e.g. to track rate limits.
 
         Return:
             code: HTTP response code.
@@ -168,8 +214,12 @@ class AsyncHttpRequests(object):
             Error information.
         """
         session = cls._get_session(url)
+        headers_callback = kwargs.pop("headers_callback", None)
         if not kwargs.get("proxy"):
             kwargs["proxy"] = config.proxy  # If there is a `HTTP PROXY` Configuration in config file?
+        parsed = urlparse(url)
+        loop = asyncio.get_event_loop()
+        start = loop.time()
         try:
             if method == "GET":
                 response = await session.get(url, params=params, headers=headers, timeout=timeout, **kwargs)
@@ -188,8 +238,16 @@ class AsyncHttpRequests(object):
         except Exception as e:
             logger.error("method:", method, "url:", url, "headers:", headers, "params:", params, "body:", body,
                          "data:", data, "Error:", e, caller=cls)
+            registry.counter("aioquant_http_requests_total", "HTTP requests.", method=method, host=parsed.netloc,
+                             path=parsed.path, code="error").inc()
             return None, None, e
         code = response.status
+        registry.histogram("aioquant_http_request_seconds", "Duration of HTTP requests.", method=method,
+                           host=parsed.netloc, path=parsed.path).observe(loop.time() - start)
+        registry.counter("aioquant_http_requests_total", "HTTP requests.", method=method, host=parsed.netloc,
+                         path=parsed.path, code=str(code)).inc()
+        if headers_callback:
+            headers_callback(response.headers)
         if code not in (200, 201, 202, 203, 204, 205, 206):
             text = await response.text()
             logger.error("method:", method, "url:", url, "headers:", headers, "params:", params, "body:", body,
@@ -246,6 +304,7 @@ class AsyncHttpRequests(object):
         parsed_url = urlparse(url)
         key = parsed_url.netloc or parsed_url.hostname
         if key not in cls._SESSIONS:
-            session = aiohttp.ClientSession()
+            connector = aiohttp.TCPConnector(limit_per_host=cls.LIMIT_PER_HOST, keepalive_timeout=cls.KEEPALIVE_TIMEOUT)
+            session = aiohttp.ClientSession(connector=connector)
             cls._SESSIONS[key] = session
         return cls._SESSIONS[key]
@@ -0,0 +1,110 @@
+# -*- coding:utf-8 -*-
+
+"""
+Benchmark for backtest, replay synthetic 1s klines from a tick store through `PriceWatcher` (unchanged) and a
+simple trading strategy, print throughput in bars per second and the estimated time of one year of 1s klines.
+
+Usage:
+    python benchmarks/backtest_bench.py [bars]
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+
+import numpy as np
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "trade"))
+
+from aioquant import const
+from aioquant.market import Market
+from aioquant.configure import config
+from aioquant.tickstore import TickStore
+from aioquant.tasks import LoopRunTask
+from aioquant.backtest import Backtest, SimBinance
+
+
+START = 1672531200000  # 2023-01-01 00:00:00 UTC
+YEAR_BARS = 365 * 86400
+
+
+def make_store(root, count):
+    rng = np.random.default_rng(0)
+    store = TickStore(root)
+    close = 29000 + np.cumsum(rng.normal(0, 2, count))
+    open_ = np.concatenate([[close[0]], close[:-1]])
+    spread = np.abs(rng.normal(0, 1, count))
+    rows = np.zeros(count, dtype=np.dtype([tuple(c) for c in store_schema()]))
+    rows["start_time"] = START + np.arange(count) * 1000
+    rows["close_time"] = rows["start_time"] + 999
+    rows["open"] = open_
+    rows["close"] = close
+    rows["high"] = np.maximum(open_, close) + spread
+    rows["low"] = np.minimum(open_, close) - spread
+    rows["volume"] = rng.exponential(1, count)
+    rows["trade_num"] = 10
+    store.append("kline_1s", "BTCUSDT", rows)
+    store.seal()
+
+
+def store_schema():
+    from aioquant.tickstore import SCHEMAS
+    return SCHEMAS["kline"]
+
+
+class CrossTrader:
+    """Buy if close price crosses above 60 bars average, sell if crosses below."""
+
+    def __init__(self):
+        from indicator.MA import SMA
+        self.ma = SMA(60)
+        self.above = None
+        self.ticks = 0
+        self.trader = SimBinance(account="bench", strategy="cross", platform="binance", symbol="BTCUSDT")
+        Market(const.MARKET_TYPE_KLINE_1S, "BTCUSDT", self.on_kline)
+        LoopRunTask.register(self.on_tick, 60)
+
+    async def on_kline(self, kline):
+        ma = self.ma.update(kline.close)
+        above = kline.close > ma
+        if self.above is not None and above != self.above:
+            if above and self.trader.assets["USDT"]["free"] > 1000:
+                await self.trader.create_order("BUY", "MARKET", None, 0.01)
+            elif not above and self.trader.assets["BTC"]["free"] >= 0.01:
+                await self.trader.create_order("SELL", "MARKET", None, 0.01)
+        self.above = above
+
+    async def on_tick(self, *args, **kwargs):
+        self.ticks += 1
+
+
+def run(name, source, count, entrance):
+    report = Backtest(source, ["BTCUSDT"], "1s").run(entrance)
+    print("{:<14}{:>10}{:>10.2f}{:>14.0f}{:>14.1f}".format(name, report["bars"], report["elapsed"],
+                                                           report["bars_per_sec"],
+                                                           YEAR_BARS / report["bars_per_sec"] / 60))
+    return report
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    root = tempfile.mkdtemp()
+    try:
+        make_store(root, count)
+        config.symbol = "BTCUSDT"
+        print("{:<14}{:>10}{:>10}{:>14}{:>14}".format("strategy", "bars", "time(s)", "bars/sec", "1 year(min)"))
+        from monitor.pricewatcher import PriceWatcher
+        run("PriceWatcher", root, count, PriceWatcher)
+        traders = []
+        report = run("CrossTrader", root, count, lambda: traders.append(CrossTrader()))
+        print("CrossTrader fills: {}, timer runs: {}, pnl: {:.2f}".format(
+            report["exchanges"][0]["fills"], traders[0].ticks, report["exchanges"][0]["pnl"]))
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == "__main__":
+    main()
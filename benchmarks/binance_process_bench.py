@@ -0,0 +1,106 @@
+# -*- coding:utf-8 -*-
+
+"""
+Benchmark for Binance stream message processing, print messages per second of the legacy path (JSON parsed, dumped
+again for debug log, a task created for every message and serialized by a global locker) and the current path
+(`Binance.process` called directly in the event loop).
+
+Usage:
+    python benchmarks/binance_process_bench.py [count]
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from aioquant import quant
+from aioquant.binance import Binance
+from aioquant.utils.web import json_loads
+from aioquant.utils.decorator import async_method_locker
+
+
+KLINE_MSG = json.dumps({
+    "stream": "btcusdt@kline_1s",
+    "data": {
+        "e": "kline", "E": 1672515782136, "s": "BTCUSDT",
+        "k": {
+            "t": 1672515780000, "T": 1672515780999, "s": "BTCUSDT", "i": "1s", "f": 100, "L": 200,
+            "o": "16569.01000000", "c": "16569.42000000", "h": "16570.00000000", "l": "16568.99000000",
+            "v": "1.02101000", "n": 100, "x": False, "q": "16917.29310210", "V": "0.50000000", "Q": "8284.71000000",
+            "B": "0"
+        }
+    }
+})
+
+
+class NullEventCenter:
+    """Drop every event published, so that only message processing is measured."""
+
+    def publish_nowait(self, event):
+        pass
+
+
+def make_binance():
+    """Create a Binance object without connecting to exchange."""
+    b = Binance.__new__(Binance)
+    b._raw_symbol = "BTCUSDT"
+    b._books = {}
+    b._order_updates = {}
+    b._order_update_callback = None
+    b._handlers = {"executionReport": b.process_order, "kline": b.process_kline, "depthUpdate": b.process_depth}
+    return b
+
+
+class LegacyProcessor:
+    """Message processing path before combined stream: parse, dump for debug log, one task per message and a global
+    locker."""
+
+    def __init__(self, binance):
+        self._binance = binance
+
+    def on_message(self, raw):
+        msg = json.loads(raw)
+        asyncio.get_event_loop().create_task(self.process(msg["data"]))
+
+    @async_method_locker("LegacyProcessor.process.locker")
+    async def process(self, msg):
+        json.dumps(msg)
+        if msg.get("e") == "kline":
+            self._binance.process_kline(msg)
+
+
+async def bench_legacy(binance, count):
+    p = LegacyProcessor(binance)
+    start = time.perf_counter()
+    for _ in range(count):
+        p.on_message(KLINE_MSG)
+    while len(asyncio.all_tasks()) > 1:
+        await asyncio.sleep(0)
+    return count / (time.perf_counter() - start)
+
+
+async def bench_current(binance, count):
+    start = time.perf_counter()
+    for _ in range(count):
+        binance.process(json_loads(KLINE_MSG)["data"])
+    return count / (time.perf_counter() - start)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    quant.event_center = NullEventCenter()
+    binance = make_binance()
+    loop = asyncio.get_event_loop()
+    legacy = loop.run_until_complete(bench_legacy(binance, count))
+    current = loop.run_until_complete(bench_current(binance, count))
+    print("{:<10}{:>14}".format("path", "msgs/sec"))
+    print("{:<10}{:>14.0f}".format("legacy", legacy))
+    print("{:<10}{:>14.0f}".format("current", current))
+
+
+if __name__ == "__main__":
+    main()
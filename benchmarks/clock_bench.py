@@ -0,0 +1,112 @@
+# -*- coding:utf-8 -*-
+
+"""
+Benchmark for exchange clock: print the cost of reading a timestamp (`tools.get_cur_timestamp_ms` vs
+`clock.now_exchange_ms`), then simulate an hour of syncs every minute against an exchange clock with an offset and
+drift, over a network with jittery asymmetric delays and congestion spikes, while the local wall clock is slewed
+and stepped by NTP, and print the error of both timestamps against the true exchange time.
+
+Usage:
+    python benchmarks/clock_bench.py [minutes]
+"""
+
+import os
+import sys
+import time
+import random
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from aioquant.utils import tools
+from aioquant.utils.clock import ExchangeClock, now_exchange_ms
+
+MS = 1000000  # Nanoseconds.
+
+
+def bench_read(count):
+    results = {}
+    for name, func in (("wall", tools.get_cur_timestamp_ms), ("exchange", now_exchange_ms)):
+        start = time.perf_counter()
+        for _ in range(count):
+            func()
+        results[name] = (time.perf_counter() - start) / count * 1000000000
+    return results
+
+
+class Simulation:
+    """Local monotonic clock, exchange clock and local wall clock, in nanoseconds."""
+
+    def __init__(self, seed=0):
+        self.rng = random.Random(seed)
+        self.mono = 10 ** 12
+        self.exchange_offset = 250 * MS  # Exchange is ahead of local wall clock at start.
+        self.exchange_drift = 20e-6  # Exchange clock runs faster than local monotonic clock.
+        self.wall_error = -80 * MS  # Local wall clock error, slewed towards 0 by NTP.
+
+    def exchange(self, mono=None):
+        mono = self.mono if mono is None else mono
+        return int(mono * (1 + self.exchange_drift)) + self.exchange_offset
+
+    def wall(self):
+        return self.exchange(self.mono) - self.exchange_offset + self.wall_error
+
+    def advance(self, ns):
+        self.mono += ns
+        # NTP slews wall clock at 500ppm towards 0 error.
+        slew = int(ns * 500e-6)
+        if self.wall_error > 0:
+            self.wall_error = max(0, self.wall_error - slew)
+        else:
+            self.wall_error = min(0, self.wall_error + slew)
+
+    def sample(self):
+        """A request to server time endpoint: `(t0, server time in ms, t1)`."""
+        rtt = 10 * MS + int(self.rng.expovariate(1 / (3 * MS)))
+        if self.rng.random() < 0.05:
+            rtt += int(self.rng.uniform(50, 300) * MS)  # Congestion.
+        forward = int(rtt * self.rng.uniform(0.3, 0.7))
+        t0 = self.mono
+        server_time = self.exchange(t0 + forward) // MS
+        self.advance(rtt)
+        return t0, server_time, self.mono
+
+
+def simulate(minutes):
+    sim = Simulation()
+    exchange_clock = ExchangeClock(monotonic_ns=lambda: sim.mono)
+    exchange_clock._ref_mono = sim.mono
+    exchange_clock._ref_offset = sim.wall() - sim.mono  # Not synced: local wall clock.
+    errors = {"wall": [], "exchange": []}
+    for second in range(minutes * 60):
+        if second % 60 == 0:
+            samples = [sim.sample() for _ in range(5)]
+            exchange_clock.add_sample(*min(samples, key=lambda s: s[2] - s[0]))
+        if second == minutes * 30:
+            sim.wall_error += 1000 * MS  # NTP steps wall clock.
+        sim.advance(1000 * MS - (sim.mono % (1000 * MS)) + 1)
+        truth = sim.exchange()
+        errors["wall"].append(abs(sim.wall() - truth) / MS)
+        errors["exchange"].append(abs(exchange_clock.now_exchange_ns() - truth) / MS)
+    return errors, exchange_clock
+
+
+def main():
+    minutes = int(sys.argv[1]) if len(sys.argv) > 1 else 60
+    results = bench_read(1000000)
+    print("{:<10}{:>12}".format("read", "ns/call"))
+    for name, ns in results.items():
+        print("{:<10}{:>12.1f}".format(name, ns))
+
+    errors, exchange_clock = simulate(minutes)
+    print("\nerror against exchange time over {} minutes (ms)".format(minutes))
+    print("{:<10}{:>10}{:>10}{:>10}".format("clock", "p50", "p99", "max"))
+    for name, values in errors.items():
+        values = sorted(values)
+        print("{:<10}{:>10.2f}{:>10.2f}{:>10.2f}".format(name, values[len(values) // 2],
+                                                         values[int(len(values) * 0.99)], values[-1]))
+    print("estimated drift: {:.1f}ppm (true 20.0ppm), last rtt: {:.1f}ms".format(exchange_clock.drift_ppm,
+                                                                                 exchange_clock.rtt_ms))
+
+
+if __name__ == "__main__":
+    main()
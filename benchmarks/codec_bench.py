@@ -0,0 +1,56 @@
+# -*- coding:utf-8 -*-
+
+"""
+Benchmark for event wire codecs, print encode / decode cost (ns per message) and message size of every codec.
+
+Usage:
+    python benchmarks/codec_bench.py [count]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from aioquant import codec
+
+
+KLINE = {
+    "t": 1672515780000, "T": 1672515780999, "s": "BTCUSDT", "i": "1s", "f": 100, "L": 200, "o": "16569.01000000",
+    "c": "16569.42000000", "h": "16570.00000000", "l": "16568.99000000", "v": "1.02101000", "n": 100, "x": False,
+    "q": "16917.29310210", "V": "0.50000000", "Q": "8284.71000000"
+}
+TRADE = {"s": "BTCUSDT", "a": "BUY", "P": "16569.01000000", "q": "0.00100000", "t": 1672515780000}
+ORDERBOOK = {
+    "s": "BTCUSDT",
+    "a": [["{:.2f}".format(16570 + i * 0.01), "0.12345000"] for i in range(20)],
+    "b": [["{:.2f}".format(16569 - i * 0.01), "0.54321000"] for i in range(20)],
+    "t": 1672515780000
+}
+
+
+def bench(c, name, data, count):
+    b = c.encode(name, data)
+    start = time.perf_counter_ns()
+    for _ in range(count):
+        c.encode(name, data)
+    encode_ns = (time.perf_counter_ns() - start) / count
+    start = time.perf_counter_ns()
+    for _ in range(count):
+        codec.decode(b)
+    decode_ns = (time.perf_counter_ns() - start) / count
+    return encode_ns, decode_ns, len(b)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    print("{:<18}{:<8}{:>12}{:>12}{:>10}".format("event", "codec", "encode(ns)", "decode(ns)", "bytes"))
+    for name, data in (("EVENT_KLINE", KLINE), ("EVENT_TRADE", TRADE), ("EVENT_ORDERBOOK", ORDERBOOK)):
+        for c in (codec.JsonCodec(), codec.BinaryCodec()):
+            encode_ns, decode_ns, size = bench(c, name, data, count)
+            print("{:<18}{:<8}{:>12.0f}{:>12.0f}{:>10}".format(name, c.name, encode_ns, decode_ns, size))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+# -*- coding:utf-8 -*-
+
+"""
+Benchmark for logger, print cost (ns per call) of disabled and enabled log calls, eager formatting (legacy) vs lazy
+formatting (current).
+
+Usage:
+    python benchmarks/logger_bench.py [count]
+"""
+
+import os
+import sys
+import time
+import logging
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from aioquant.utils import logger
+
+
+MSG = {"e": "kline", "E": 1672515782136, "s": "BTCUSDT", "k": {"t": 1672515780000, "o": "16569.01000000"}}
+
+
+def legacy_debug(*args, **kwargs):
+    """Legacy `logger.debug`, message header and arguments are formatted before checking level."""
+    caller = kwargs.pop("caller", None)
+    func_name = sys._getframe().f_back.f_code.co_name
+    cls_name = caller.__class__.__name__ if caller is not None else ""
+    msg_header = "[{session_id}] [{cls_name}.{func_name}] ".format(cls_name=cls_name, func_name=func_name,
+                                                                   session_id="-")
+    logging.debug(logger._log(msg_header, *args, **kwargs))
+
+
+class Caller:
+
+    def legacy(self, count):
+        for _ in range(count):
+            legacy_debug("msg:", MSG, caller=self)
+
+    def current(self, count):
+        for _ in range(count):
+            logger.debug("msg:", MSG, caller=self)
+
+
+def bench(func, count):
+    start = time.perf_counter_ns()
+    func(count)
+    return (time.perf_counter_ns() - start) / count
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    root = logging.getLogger()
+    root.addHandler(logging.NullHandler())
+    caller = Caller()
+    print("{:<10}{:>14}{:>14}".format("level", "legacy(ns)", "current(ns)"))
+    for level in ("INFO", "DEBUG"):
+        root.setLevel(level)
+        print("{:<10}{:>14.0f}{:>14.0f}".format(level, bench(caller.legacy, count), bench(caller.current, count)))
+
+
+if __name__ == "__main__":
+    main()
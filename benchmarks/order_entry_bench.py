@@ -0,0 +1,155 @@
+# -*- coding:utf-8 -*-
+
+"""
+Benchmark for order entry, against a local HTTP server that verifies signatures and answers after a simulated round
+trip time: print the CPU time of signing an order request (legacy: key a new HMAC and urlencode a dict; template:
+copy a prefix hashed HMAC state and hash the tail), and the time of canceling 100 open orders sequentially (legacy),
+by ids concurrently, and by the cancel all request.
+
+Usage:
+    python benchmarks/order_entry_bench.py [rtt ms] [orders]
+"""
+
+import os
+import sys
+import hmac
+import time
+import asyncio
+import hashlib
+from urllib.parse import urlencode
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from aiohttp import web
+
+from aioquant.binance import Binance
+from aioquant.utils import tools
+from aioquant.utils.web import AsyncHttpRequests
+
+SECRET = "bench-secret-key-0123456789abcdef0123456789abcdef0123456789abcdef"
+
+
+class BenchBinance(Binance):
+    """Binance trade module without user data stream."""
+
+    async def _init_websocket(self):
+        pass
+
+
+def make_server(rtt):
+    state = {"order_id": 0, "bad": 0}
+
+    def verify(request):
+        query = request.query_string
+        body, _, signature = query.rpartition("&signature=")
+        expect = hmac.new(SECRET.encode(), body.encode(), hashlib.sha256).hexdigest()
+        if signature != expect:
+            state["bad"] += 1
+
+    async def create(request):
+        verify(request)
+        await asyncio.sleep(rtt)
+        state["order_id"] += 1
+        return web.json_response({"orderId": state["order_id"], "symbol": "BTCUSDT"})
+
+    async def cancel(request):
+        verify(request)
+        await asyncio.sleep(rtt)
+        return web.json_response({"orderId": int(request.query["orderId"]), "status": "CANCELED"})
+
+    async def cancel_all(request):
+        verify(request)
+        await asyncio.sleep(rtt)
+        return web.json_response([])
+
+    async def server_time(request):
+        return web.json_response({"serverTime": int(time.time() * 1000)})
+
+    app = web.Application()
+    app.router.add_get("/api/v3/time", server_time)
+    app.router.add_post("/api/v3/order", create)
+    app.router.add_delete("/api/v3/order", cancel)
+    app.router.add_delete("/api/v3/openOrders", cancel_all)
+    return app, state
+
+
+def bench_sign(count):
+    params = {"symbol": "BTCUSDT", "side": "BUY", "type": "LIMIT", "timeInForce": "GTC", "quantity": "0.01",
+              "price": "16500.12", "newClientOrderId": "aq0123456789abcdef-1"}
+    start = time.perf_counter()
+    for _ in range(count):
+        query = dict(params)
+        query["timestamp"] = tools.get_cur_timestamp_ms()
+        query = urlencode(query)
+        hmac.new(SECRET.encode(), query.encode(), hashlib.sha256).hexdigest()
+    legacy = time.perf_counter() - start
+
+    signer = hmac.new(SECRET.encode(), digestmod=hashlib.sha256)
+    prefix = signer.copy()
+    prefix.update(b"symbol=BTCUSDT&side=BUY&type=LIMIT&newOrderRespType=ACK&timeInForce=GTC&")
+    start = time.perf_counter()
+    for _ in range(count):
+        tail = "quantity={}&price={}&newClientOrderId={}&timestamp={}".format(
+            "0.01", "16500.12", "aq0123456789abcdef-1", tools.get_cur_timestamp_ms())
+        h = prefix.copy()
+        h.update(tail.encode())
+        h.hexdigest()
+    return legacy, time.perf_counter() - start
+
+
+async def bench_cancel(trader, count):
+    rest = trader.rest_api
+    results = {}
+    order_ids = [trader.create_order("BUY", "LIMIT", 16500, 0.01) for _ in range(count)]
+    order_ids = [order_id for order_id, _ in await asyncio.gather(*order_ids)]
+
+    start = time.perf_counter()
+    for order_id in order_ids:
+        await rest.cancel_order("BTCUSDT", order_id)
+    results["sequential"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    await trader.revoke_order(*order_ids)
+    results["by ids"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    await trader.revoke_order()
+    results["cancel all"] = time.perf_counter() - start
+    return results
+
+
+async def main():
+    rtt = (float(sys.argv[1]) if len(sys.argv) > 1 else 20) / 1000
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+
+    legacy, template = bench_sign(100000)
+    print("{:<12}{:>12}".format("sign", "us/order"))
+    print("{:<12}{:>12.2f}".format("legacy", legacy / 100000 * 1000000))
+    print("{:<12}{:>12.2f}".format("template", template / 100000 * 1000000))
+
+    app, state = make_server(rtt)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    AsyncHttpRequests.LIMIT_PER_HOST = max(AsyncHttpRequests.LIMIT_PER_HOST, count)  # A connection per order.
+    trader = BenchBinance(account="bench", strategy="bench", platform="binance", symbol="BTCUSDT", interval="1m",
+                          host="http://127.0.0.1:{}".format(port), wss="ws://127.0.0.1:1", access_key="bench",
+                          secret_key=SECRET, max_inflight_requests=count)
+    trader.rest_api._weight_limit = trader.rest_api._weight_tokens = 10 ** 9
+    results = await bench_cancel(trader, count)
+    print("\ncancel {} orders, rtt {:.0f}ms, bad signatures: {}".format(count, rtt * 1000, state["bad"]))
+    print("{:<12}{:>12}{:>12}".format("path", "time(ms)", "rtts"))
+    for name, elapsed in results.items():
+        print("{:<12}{:>12.1f}{:>12.1f}".format(name, elapsed * 1000, elapsed / rtt))
+    latency = trader._latencies["create"]
+    print("\ncreate latency p50: {:.1f}ms p99: {:.1f}ms".format(latency.percentile(0.5) * 1000,
+                                                             latency.percentile(0.99) * 1000))
+    for session in AsyncHttpRequests._SESSIONS.values():
+        await session.close()
+    await runner.cleanup()
+
+
+if __name__ == "__main__":
+    asyncio.get_event_loop().run_until_complete(main())
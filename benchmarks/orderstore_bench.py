@@ -0,0 +1,124 @@
+# -*- coding:utf-8 -*-
+
+"""
+Benchmark for order state keeping of a market maker with thousands of live orders, print time per order update and
+per lookup by client order id, of the legacy path (a dict of orders mutated in place, copied for every callback, terminal
+orders dropped, other lookups by scanning) and `OrderStore` (orders updated in place and indexed), without an order
+update callback and with one (a snapshot per update).
+
+Usage:
+    python benchmarks/orderstore_bench.py [live orders] [updates]
+"""
+
+import os
+import sys
+import copy
+import time
+import random
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from aioquant.order import Order, ORDER_STATUS_SUBMITTED, ORDER_STATUS_PARTIAL_FILLED, ORDER_STATUS_FILLED
+from aioquant.orderstore import OrderStore
+
+
+class LegacyOrder:
+    """Order object before `__slots__`, copied by `copy.copy` for every callback."""
+
+    def __init__(self, platform, account, strategy, order_id, client_order_id, symbol, action, price, quantity,
+                 status, ctime, utime):
+        self.platform = platform
+        self.account = account
+        self.strategy = strategy
+        self.order_id = order_id
+        self.client_order_id = client_order_id
+        self.action = action
+        self.order_type = "LIMIT"
+        self.symbol = symbol
+        self.price = price
+        self.quantity = quantity
+        self.remain = quantity
+        self.status = status
+        self.avg_price = 0
+        self.trade_type = "NONE"
+        self.fee = 0
+        self.ctime = ctime
+        self.utime = utime
+
+
+def make_order(i, cls=Order):
+    return cls("binance", "bench", "mm", str(i), "c" + str(i), "BTCUSDT", "BUY", "16500.0", "1.0",
+               status=ORDER_STATUS_SUBMITTED, ctime=1, utime=1)
+
+
+def updates(live, count):
+    """Order updates: partially filled orders, and filled orders replaced by new ones."""
+    rng = random.Random(0)
+    ids = list(range(live))
+    next_id = live
+    for _ in range(count):
+        j = rng.randrange(live)
+        if rng.random() < 0.5:
+            yield ids[j], ORDER_STATUS_PARTIAL_FILLED, None
+        else:
+            yield ids[j], ORDER_STATUS_FILLED, next_id
+            ids[j] = next_id
+            next_id += 1
+
+
+def bench_legacy(live, events, lookups):
+    orders = {str(i): make_order(i, LegacyOrder) for i in range(live)}
+    start = time.perf_counter()
+    for order_id, status, new_id in events:
+        order = orders[str(order_id)]
+        order.remain = 0.5
+        order.status = status
+        order.utime = 2
+        copy.copy(order)  # Handed to callback.
+        if status == ORDER_STATUS_FILLED:
+            orders.pop(order.order_id)
+            orders[str(new_id)] = make_order(new_id, LegacyOrder)
+    update_time = time.perf_counter() - start
+    start = time.perf_counter()
+    for client_order_id in lookups:
+        for order in orders.values():
+            if order.client_order_id == client_order_id:
+                break
+    return update_time, time.perf_counter() - start
+
+
+def bench_store(live, events, lookups, callback=False):
+    store = OrderStore(archive_size=10000)
+    for i in range(live):
+        store.add(make_order(i))
+    start = time.perf_counter()
+    for order_id, status, new_id in events:
+        order = store.get("BTCUSDT", str(order_id))
+        order = store.update(order, remain=0.5, status=status, utime=2)
+        if callback:
+            order.replace()  # Snapshot handed to callback.
+        if status == ORDER_STATUS_FILLED:
+            store.add(make_order(new_id))
+    update_time = time.perf_counter() - start
+    start = time.perf_counter()
+    for client_order_id in lookups:
+        store.get_by_client_order_id(client_order_id)
+    return update_time, time.perf_counter() - start
+
+
+def main():
+    live = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 200000
+    events = list(updates(live, count))
+    rng = random.Random(1)
+    lookups = ["c" + str(rng.randrange(live)) for _ in range(2000)]
+    print("{:<10}{:>16}{:>16}".format("path", "update(us)", "lookup(us)"))
+    for name, bench in (("legacy", bench_legacy), ("store", bench_store),
+                        ("store+cb", lambda *args: bench_store(*args, callback=True))):
+        update_time, lookup_time = bench(live, events, lookups)
+        print("{:<10}{:>16.2f}{:>16.2f}".format(name, update_time / count * 1000000,
+                                                lookup_time / len(lookups) * 1000000))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+# -*- coding:utf-8 -*-
+
+"""
+Benchmark for position keeping, print time per fill and per mark of rebuilding a position from the whole trade
+history (the way a position has to be derived without an engine) and `PnlEngine`, which updates it in O(1).
+
+Usage:
+    python benchmarks/pnl_bench.py [fills]
+"""
+
+import os
+import sys
+import time
+import random
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from aioquant.pnl import PnlEngine
+
+
+def make_fills(count):
+    rng = random.Random(0)
+    price = 16500.0
+    fills = []
+    for i in range(count):
+        price *= 1 + rng.uniform(-0.0005, 0.0005)
+        fills.append(("BTCUSDT", rng.choice(("BUY", "SELL")), round(rng.uniform(0.001, 0.05), 4), price,
+                      price * 0.00001, "USDT", i + 1, i))
+    return fills
+
+
+def rebuild(fills, mark_price):
+    """Net quantity, average price, realized and unrealized PnL from all fills."""
+    net = avg = realized = 0.0
+    for _, action, quantity, price, fee, _, _, _ in fills:
+        realized -= fee
+        delta = quantity if action == "BUY" else -quantity
+        if net == 0 or (net > 0) == (delta > 0):
+            avg = (abs(net) * avg + abs(delta) * price) / (abs(net) + abs(delta))
+        else:
+            realized += min(abs(delta), abs(net)) * (price - avg) * (1 if net > 0 else -1)
+            if (net + delta > 0) != (net > 0):
+                avg = price
+        net += delta
+    return net, avg, realized, net * (mark_price - avg)
+
+
+def bench_rebuild(fills):
+    start = time.perf_counter()
+    for i in range(1, len(fills) + 1):
+        rebuild(fills[:i], fills[i - 1][3])
+    fill_time = time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in range(100):
+        result = rebuild(fills, fills[-1][3])
+    return fill_time, (time.perf_counter() - start) / 100, result
+
+
+def bench_engine(fills):
+    engine = PnlEngine("binance", "bench", "mm")
+    start = time.perf_counter()
+    for fill in fills:
+        engine.on_fill(*fill)
+    fill_time = time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in range(100000):
+        engine.mark("BTCUSDT", fills[-1][3])
+    p = engine.get_position("BTCUSDT")
+    return fill_time, (time.perf_counter() - start) / 100000, (p.quantity, None, p.realized_pnl, p.unrealized_pnl)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 3000
+    fills = make_fills(count)
+    print("{:<10}{:>14}{:>14}{:>16}{:>16}".format("path", "fill(us)", "mark(us)", "realized", "unrealized"))
+    for name, bench in (("rebuild", bench_rebuild), ("engine", bench_engine)):
+        fill_time, mark_time, result = bench(fills)
+        print("{:<10}{:>14.2f}{:>14.2f}{:>16.4f}{:>16.4f}".format(name, fill_time / count * 1000000,
+                                                                 mark_time * 1000000, result[2], result[3]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+# -*- coding:utf-8 -*-
+
+"""
+Benchmark for pre-trade risk gate, print time per check with every limit enabled while thousands of orders are open,
+and per order life cycle (check, order updates, fill and price update), the gate should cost well under 10us.
+
+Usage:
+    python benchmarks/risk_bench.py [orders] [open orders]
+"""
+
+import os
+import sys
+import time
+import random
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from aioquant.risk import RiskGate
+from aioquant.order import Order, ORDER_STATUS_SUBMITTED, ORDER_STATUS_PARTIAL_FILLED, ORDER_STATUS_FILLED
+
+SYMBOLS = ["BTCUSDT", "ETHUSDT", "BNBUSDT", "XRPUSDT"]
+
+
+def make_gate(live):
+    gate = RiskGate(max_orders_per_second=10 ** 9, max_open_orders=live * 2, max_notional=10 ** 12,
+                    max_position=10 ** 9, price_band=0.05)
+    for symbol in SYMBOLS:
+        gate.on_price(symbol, 16500.0)
+        gate.on_position(symbol, 0.5)
+    for i in range(live):
+        gate.check(SYMBOLS[i % 4], "BUY", 16400.0, 0.01, "open" + str(i))
+    return gate
+
+
+def bench_check(gate, count):
+    rng = random.Random(0)
+    orders = [(rng.choice(SYMBOLS), rng.choice(("BUY", "SELL")), 16500.0 * rng.uniform(0.97, 1.03)) for _ in
+              range(count)]
+    check = gate.check
+    start = time.perf_counter()
+    for symbol, action, price in orders:
+        check(symbol, action, price, 0.01)
+    return time.perf_counter() - start
+
+
+def bench_cycle(gate, count):
+    orders = []
+    for i in range(count):
+        symbol = SYMBOLS[i % 4]
+        order = Order("binance", "bench", "mm", str(i), "c" + str(i), symbol, "BUY", "16500.0", "0.01",
+                      status=ORDER_STATUS_SUBMITTED)
+        order.remain = 0.01
+        partial = order.replace(status=ORDER_STATUS_PARTIAL_FILLED, remain=0.005)
+        filled = order.replace(status=ORDER_STATUS_FILLED, remain=0)
+        orders.append((symbol, order, partial, filled))
+    start = time.perf_counter()
+    for symbol, order, partial, filled in orders:
+        gate.check(symbol, "BUY", 16500.0, 0.01, order.client_order_id)
+        gate.on_order(order)
+        gate.on_order(partial)
+        gate.on_price(symbol, 16500.0)
+        gate.on_order(filled)
+        gate.on_position(symbol, 0.51)
+        gate.on_price(symbol, 16500.0)
+    return time.perf_counter() - start
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    live = int(sys.argv[2]) if len(sys.argv) > 2 else 5000
+    gate = make_gate(live)
+    check_time = bench_check(gate, count)
+    cycle_time = bench_cycle(gate, count)
+    print("open orders: {}, rejected: {}".format(gate.open_orders, gate.rejected))
+    print("{:<10}{:>12}".format("path", "us/order"))
+    print("{:<10}{:>12.2f}".format("check", check_time / count * 1000000))
+    print("{:<10}{:>12.2f}".format("cycle", cycle_time / count * 1000000))
+
+
+if __name__ == "__main__":
+    main()
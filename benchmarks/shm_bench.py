@@ -0,0 +1,163 @@
+# -*- coding:utf-8 -*-
+
+"""
+Benchmark for market data fanout to multiple strategy processes on one host, print CPU time per event of every reader
+process, shared memory path vs AMQP path.
+
+Usage:
+    python benchmarks/shm_bench.py [count] [readers] [rabbitmq host]
+
+The AMQP path is only measured if a RabbitMQ host is given, e.g. `python benchmarks/shm_bench.py 100000 4 127.0.0.1`.
+"""
+
+import os
+import sys
+import time
+import asyncio
+import functools
+import multiprocessing
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from aioquant import codec
+from aioquant.market import Kline
+from aioquant.event import EventKline, TopicRouter
+from aioquant.shm import ShmPublisher, ShmReader
+
+
+PREFIX = "aioquant_bench"
+EXCHANGE = "bench.kline"
+KLINE = {
+    "t": 1672515780000, "T": 1672515780999, "s": "BTCUSDT", "i": "1s", "f": 100, "L": 200, "o": "16569.01000000",
+    "c": "16569.42000000", "h": "16570.00000000", "l": "16568.99000000", "v": "1.02101000", "n": 100, "x": False,
+    "q": "16917.29310210", "V": "0.50000000", "Q": "8284.71000000"
+}
+
+
+def make_kline(i):
+    kline = Kline().load_smart(KLINE)
+    kline.start_time += i * 1000
+    return kline
+
+
+def shm_reader(count, ready, result):
+    router = TopicRouter()
+    received = [0]
+
+    def on_event(payload, exchange, routing_key):
+        name, data = codec.decode(payload)
+        Kline().load_smart(data)
+        received[0] += 1
+
+    router.bind("Kline", "#", on_event)
+    reader = ShmReader(router, PREFIX)
+    reader.poll()  # Read catalog, so that ring buffers created later are read from the first event.
+    ready.set()
+    start = time.process_time()
+    deadline = time.time() + 60
+    while received[0] + reader.stats["lost"] < count and time.time() < deadline:
+        if not reader.poll():
+            time.sleep(0.0005)
+    result.put((time.process_time() - start, received[0], reader.stats["lost"]))
+    reader.close()
+
+
+def shm_publisher(count):
+    publisher = ShmPublisher(PREFIX, slots=count, slot_size=256)
+
+    def publish():
+        for i in range(count):
+            publisher.publish(EventKline(make_kline(i)))
+        return publisher
+
+    return publish
+
+
+def amqp_reader(host, count, ready, result):
+    import aioamqp
+
+    async def run():
+        transport, protocol = await aioamqp.connect(host=host)
+        channel = await protocol.channel()
+        await channel.exchange_declare(exchange_name=EXCHANGE, type_name="fanout")
+        queue = (await channel.queue_declare(exclusive=True))["queue"]
+        await channel.queue_bind(queue_name=queue, exchange_name=EXCHANGE, routing_key="")
+        done = asyncio.Event()
+        received = [0]
+
+        async def on_message(channel, body, envelope, properties):
+            name, data = codec.decode(body)
+            Kline().load_smart(data)
+            received[0] += 1
+            if received[0] >= count:
+                done.set()
+
+        await channel.basic_consume(on_message, queue_name=queue, no_ack=True)
+        ready.set()
+        start = time.process_time()
+        try:
+            await asyncio.wait_for(done.wait(), 60)
+        except asyncio.TimeoutError:
+            pass
+        result.put((time.process_time() - start, received[0], count - received[0]))
+        await protocol.close()
+        transport.close()
+
+    asyncio.new_event_loop().run_until_complete(run())
+
+
+def amqp_publisher(host, count):
+    import aioamqp
+
+    async def publish():
+        transport, protocol = await aioamqp.connect(host=host)
+        channel = await protocol.channel()
+        await channel.exchange_declare(exchange_name=EXCHANGE, type_name="fanout")
+        json_codec = codec.JsonCodec()
+        for i in range(count):
+            event = EventKline(make_kline(i))
+            await channel.basic_publish(json_codec.encode(event.name, event.data), EXCHANGE, "")
+        await protocol.close()
+        transport.close()
+
+    return lambda: asyncio.new_event_loop().run_until_complete(publish())
+
+
+def run(name, reader, publish, count, readers):
+    """Start reader processes, publish events after all readers are ready.
+
+    Args:
+        reader: Reader process function, `reader(count, ready, result)`.
+        publish: A function to publish all events, returns an object to be closed or `None`.
+    """
+    ctx = multiprocessing.get_context("spawn")  # Readers don't share resource tracker with publisher.
+    ready = [ctx.Event() for _ in range(readers)]
+    result = ctx.Queue()
+    processes = [ctx.Process(target=reader, args=(count, ready[i], result)) for i in range(readers)]
+    for p in processes:
+        p.start()
+    for e in ready:
+        e.wait()
+    closable = publish()
+    results = [result.get() for _ in range(readers)]
+    for p in processes:
+        p.join()
+    if closable:
+        closable.close()
+    for cpu, received, lost in results:
+        print("{:<8}{:>12.3f}{:>14.2f}{:>12}{:>10}".format(name, cpu, cpu / max(received, 1) * 1000000, received,
+                                                            lost))
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    readers = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    host = sys.argv[3] if len(sys.argv) > 3 else None
+    print("{:<8}{:>12}{:>14}{:>12}{:>10}".format("path", "cpu(s)", "cpu/event(us)", "received", "lost"))
+    run("shm", shm_reader, shm_publisher(count), count, readers)  # Catalog is created before readers started.
+    if host:
+        run("amqp", functools.partial(amqp_reader, host), amqp_publisher(host, count), count, readers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+# -*- coding:utf-8 -*-
+
+"""
+Benchmark for parameter sweep, run a grid of moving average crossing strategies on synthetic 1s klines with 1, 2, 4 ...
+worker processes up to CPU count, print jobs per second and speedup, then run the sweep again with the same state
+file to show it is resumed without running any job.
+
+Usage:
+    python benchmarks/sweep_bench.py [bars] [jobs]
+"""
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from aioquant import const
+from aioquant.market import Market
+from aioquant.backtest import SimBinance
+from aioquant.sweep import Sweep, grid, cpu_count
+
+from backtest_bench import make_store
+
+
+class CrossTrader:
+    """Buy if fast average crosses above slow average, sell if crosses below."""
+
+    def __init__(self, fast, slow):
+        self.fast, self.slow = fast, slow
+        self.closes = []
+        self.above = None
+        self.trader = SimBinance(account="bench", strategy="cross", platform="binance", symbol="BTCUSDT")
+        Market(const.MARKET_TYPE_KLINE_1S, "BTCUSDT", self.on_kline)
+
+    async def on_kline(self, kline):
+        self.closes.append(kline.close)
+        if len(self.closes) < self.slow:
+            return
+        above = sum(self.closes[-self.fast:]) / self.fast > sum(self.closes[-self.slow:]) / self.slow
+        if self.above is not None and above != self.above:
+            if above and self.trader.assets["USDT"]["free"] > 1000:
+                await self.trader.create_order("BUY", "MARKET", None, 0.01)
+            elif not above and self.trader.assets["BTC"]["free"] >= 0.01:
+                await self.trader.create_order("SELL", "MARKET", None, 0.01)
+        self.above = above
+        del self.closes[:-self.slow]
+
+
+def main():
+    bars = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 16
+    fasts = list(range(5, 5 + count // 4 * 5, 5)) or [5]
+    jobs = grid(fast=fasts, slow=[60, 120, 240, 480])[:count]
+    root = tempfile.mkdtemp()
+    try:
+        store = os.path.join(root, "store")
+        make_store(store, bars)
+        cache = os.path.join(root, "cache")
+        print("{:<10}{:>8}{:>10}{:>10}{:>10}".format("workers", "jobs", "time(s)", "jobs/s", "speedup"))
+        base = None
+        workers = 1
+        while True:
+            sweep = Sweep(CrossTrader, jobs, store, ["BTCUSDT"], "1s", workers=workers, cache_dir=cache)
+            begin = time.perf_counter()
+            results = sweep.run()
+            elapsed = time.perf_counter() - begin
+            base = base or elapsed
+            print("{:<10}{:>8}{:>10.2f}{:>10.2f}{:>10.2f}".format(workers, len(results), elapsed, len(results) / elapsed,
+                                                                base / elapsed))
+            if workers >= cpu_count():
+                break
+            workers = min(workers * 2, cpu_count())
+        best = results[0]
+        print("best: fast={} slow={} pnl={:.2f} fills={}".format(best["fast"], best["slow"], best["pnl"], best["fills"]))
+
+        state = os.path.join(root, "state.jsonl")
+        Sweep(CrossTrader, jobs[:count // 2], store, ["BTCUSDT"], "1s", state_file=state, cache_dir=cache).run()
+        begin = time.perf_counter()
+        results = Sweep(CrossTrader, jobs, store, ["BTCUSDT"], "1s", state_file=state, cache_dir=cache).run()
+        print("resumed: {} jobs, {} run again, time(s): {:.2f}".format(len(results), len(jobs) - count // 2,
+                                                                       time.perf_counter() - begin))
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+# -*- coding:utf-8 -*-
+
+"""
+Benchmark for tick store, print append throughput, compression ratio, and range query time of active (memory mapped)
+and sealed (compressed) segments, compared with scanning a JSON lines file.
+
+Usage:
+    python benchmarks/tickstore_bench.py [rows]
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from aioquant.tickstore import TickStore
+
+
+START = 1672531200000  # 2023-01-01 00:00:00 UTC
+BATCH = 1000
+
+
+def make_rows(count):
+    rng = np.random.default_rng(0)
+    prices = 16500 + np.cumsum(rng.normal(0, 0.5, count)).round(2)
+    quantities = rng.exponential(0.05, count).round(5)
+    sides = np.where(rng.random(count) > 0.5, 1, -1)
+    times = START + np.arange(count) * 86400000 // count  # All rows in one day.
+    return [(int(t), float(p), float(q), int(s)) for t, p, q, s in zip(times, prices, quantities, sides)]
+
+
+def dir_size(path):
+    return sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(path) for f in files)
+
+
+def query_time(func, repeat=20):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func()
+    return (time.perf_counter() - start) / repeat * 1000, result
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    rows = make_rows(count)
+    root = tempfile.mkdtemp()
+    try:
+        store = TickStore(os.path.join(root, "store"), segment_rows=count + 1)  # Keep the segment active until sealed.
+        start = time.perf_counter()
+        for i in range(0, count, BATCH):
+            store.append("trade", "BTCUSDT", rows[i:i + BATCH])
+        elapsed = time.perf_counter() - start
+        print("append: {:.0f} rows/s, batch {}".format(count / elapsed, BATCH))
+
+        raw_size = dir_size(os.path.join(root, "store"))
+        begin, end = START + 3600000 * 12, START + 3600000 * 13  # One hour.
+        query = lambda: store.query("trade", "BTCUSDT", begin, end)
+        ms, result = query_time(query)
+        print("query 1 hour, active segment: {:.2f} ms, {} rows".format(ms, len(result["price"])))
+
+        store.seal()
+        sealed_size = dir_size(os.path.join(root, "store"))
+        ms, result = query_time(query, 5)
+        print("query 1 hour, sealed segment: {:.2f} ms, {} rows".format(ms, len(result["price"])))
+        print("size: {:.1f} MB raw, {:.1f} MB sealed, ratio {:.2f}".format(raw_size / 1e6, sealed_size / 1e6,
+                                                                           raw_size / sealed_size))
+
+        path = os.path.join(root, "trades.jsonl")
+        with open(path, "w") as f:
+            for row in rows:
+                f.write(json.dumps(row) + "\n")
+
+        def scan():
+            prices = []
+            with open(path) as f:
+                for line in f:
+                    t, p, q, s = json.loads(line)
+                    if begin <= t < end:
+                        prices.append(p)
+            return np.array(prices)
+
+        ms, result = query_time(scan, 1)
+        print("query 1 hour, JSON lines scan: {:.2f} ms, {} rows".format(ms, len(result)))
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+# -*- coding:utf-8 -*-
+
+"""
+Average true range, Wilder's smoothing, updated incrementally in O(1) per bar.
+"""
+
+
+class ATR:
+    """Average true range.
+
+    Attributes:
+        period: Smoothing period, the first ATR is the simple average of the first `period` true ranges.
+    """
+
+    def __init__(self, period=14):
+        self.period = period
+        self.value = None
+        self._state = (None, None, 0, 0.0)  # (prev close, atr, count, sum of true ranges while seeding)
+        self._prev_state = self._state  # State before the latest bar.
+
+    def update(self, high, low, close, replace=False):
+        if not replace:
+            self._prev_state = self._state
+        prev_close, atr, count, tr_sum = self._prev_state
+        if prev_close is None:
+            tr = high - low
+        else:
+            tr = max(high - low, abs(high - prev_close), abs(low - prev_close))
+        count += 1
+        if count <= self.period:
+            tr_sum += tr
+            atr = tr_sum / count
+        else:
+            atr = (atr * (self.period - 1) + tr) / self.period
+        self._state = (close, atr, count, tr_sum)
+        self.value = atr if count >= self.period else None
+        return self.value
@@ -1,5 +1,128 @@
+# -*- coding:utf-8 -*-
 
+"""
+Moving average indicators, SMA / EMA / WMA.
 
-class MA:
-    def __init__(self) -> None:
-        pass
\ No newline at end of file
+Every indicator is updated incrementally in O(1) per bar, call `update(value)` for a new bar, or
+`update(value, replace=True)` for an update of the latest bar (kline not closed yet). Running sums are recomputed
+from the window every `period` updates (amortized O(1)), so that rounding errors never accumulate.
+"""
+
+import math
+from collections import deque
+
+import numpy as np
+
+
+class SMA:
+    """Simple moving average.
+
+    Attributes:
+        period: Window length.
+    """
+
+    def __init__(self, period):
+        self.period = period
+        self.value = None
+        self._values = deque(maxlen=period)
+        self._sum = 0.0
+        self._updates = 0  # Updates since sum recomputed.
+
+    def update(self, value, replace=False):
+        if replace and self._values:
+            self._sum += value - self._values[-1]
+            self._values[-1] = value
+        else:
+            if len(self._values) == self.period:
+                self._sum -= self._values[0]
+            self._values.append(value)
+            self._sum += value
+        self._updates += 1
+        if self._updates >= self.period:
+            self._updates = 0
+            self._sum = math.fsum(self._values)
+        self.value = self._sum / len(self._values)
+        return self.value
+
+
+class EMA:
+    """Exponential moving average, seeded by the first value.
+
+    Attributes:
+        period: Window length, smoothing factor is `2 / (period + 1)`.
+    """
+
+    def __init__(self, period):
+        self.period = period
+        self.value = None
+        self._alpha = 2.0 / (period + 1)
+        self._prev = None  # EMA value before the latest bar.
+
+    def update(self, value, replace=False):
+        if not replace:
+            self._prev = self.value
+        if self._prev is None:
+            self.value = value
+        else:
+            self.value = self._prev + self._alpha * (value - self._prev)
+        return self.value
+
+
+class WMA:
+    """Linearly weighted moving average, the latest value weights `period`, the oldest weights 1.
+
+    Attributes:
+        period: Window length.
+    """
+
+    def __init__(self, period):
+        self.period = period
+        self.value = None
+        self._values = deque(maxlen=period)
+        self._sum = 0.0  # Sum of values.
+        self._weighted_sum = 0.0  # Sum of weighted values.
+        self._updates = 0  # Updates since sums recomputed.
+
+    def update(self, value, replace=False):
+        n = len(self._values)
+        if replace and n:
+            delta = value - self._values[-1]
+            self._sum += delta
+            self._weighted_sum += n * delta
+            self._values[-1] = value
+        elif n == self.period:
+            self._weighted_sum += n * value - self._sum
+            self._sum += value - self._values[0]
+            self._values.append(value)
+        else:
+            self._weighted_sum += (n + 1) * value
+            self._sum += value
+            self._values.append(value)
+        self._updates += 1
+        if self._updates >= self.period:
+            self._updates = 0
+            self._sum = math.fsum(self._values)
+            self._weighted_sum = math.fsum(i * v for i, v in enumerate(self._values, 1))
+        n = len(self._values)
+        self.value = self._weighted_sum / (n * (n + 1) / 2)
+        return self.value
+
+
+def sma(values, period):
+    """Vectorized simple moving average, the first `period - 1` results are NaN."""
+    values = np.asarray(values, dtype=np.float64)
+    result = np.full(values.shape, np.nan)
+    if len(values) >= period:
+        cumsum = np.cumsum(np.insert(values, 0, 0.0))
+        result[period - 1:] = (cumsum[period:] - cumsum[:-period]) / period
+    return result
+
+
+def wma(values, period):
+    """Vectorized linearly weighted moving average, the first `period - 1` results are NaN."""
+    values = np.asarray(values, dtype=np.float64)
+    result = np.full(values.shape, np.nan)
+    if len(values) >= period:
+        weights = np.arange(period, 0, -1, dtype=np.float64)
+        result[period - 1:] = np.convolve(values, weights, mode="valid") / weights.sum()
+    return result
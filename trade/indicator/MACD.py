@@ -0,0 +1,34 @@
+# -*- coding:utf-8 -*-
+
+"""
+Moving average convergence divergence, updated incrementally in O(1) per bar.
+"""
+
+from indicator.MA import EMA
+
+
+class MACD:
+    """MACD.
+
+    Attributes:
+        fast: Fast EMA period.
+        slow: Slow EMA period.
+        signal: Signal EMA period.
+
+    NOTE:
+        `value` is MACD line, `signal_value` is signal line, `histogram` is MACD line minus signal line.
+    """
+
+    def __init__(self, fast=12, slow=26, signal=9):
+        self.value = None
+        self.signal_value = None
+        self.histogram = None
+        self._fast = EMA(fast)
+        self._slow = EMA(slow)
+        self._signal = EMA(signal)
+
+    def update(self, value, replace=False):
+        self.value = self._fast.update(value, replace) - self._slow.update(value, replace)
+        self.signal_value = self._signal.update(self.value, replace)
+        self.histogram = self.value - self.signal_value
+        return self.value
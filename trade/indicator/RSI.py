@@ -0,0 +1,45 @@
+# -*- coding:utf-8 -*-
+
+"""
+Relative strength index, Wilder's smoothing, updated incrementally in O(1) per bar.
+"""
+
+
+class RSI:
+    """Relative strength index.
+
+    Attributes:
+        period: Smoothing period, the value is `None` until `period` changes received.
+    """
+
+    def __init__(self, period=14):
+        self.period = period
+        self.value = None
+        self._state = (None, 0.0, 0.0, 0)  # (prev value, average gain, average loss, count of changes)
+        self._prev_state = self._state  # State before the latest bar.
+
+    def update(self, value, replace=False):
+        if not replace:
+            self._prev_state = self._state
+        prev_value, avg_gain, avg_loss, count = self._prev_state
+        if prev_value is None:
+            self._state = (value, 0.0, 0.0, 0)
+            self.value = None
+            return self.value
+        change = value - prev_value
+        gain, loss = max(change, 0.0), max(-change, 0.0)
+        count += 1
+        if count <= self.period:
+            avg_gain += (gain - avg_gain) / count
+            avg_loss += (loss - avg_loss) / count
+        else:
+            avg_gain = (avg_gain * (self.period - 1) + gain) / self.period
+            avg_loss = (avg_loss * (self.period - 1) + loss) / self.period
+        self._state = (value, avg_gain, avg_loss, count)
+        if count < self.period:
+            self.value = None
+        elif avg_loss == 0:
+            self.value = 100.0
+        else:
+            self.value = 100.0 - 100.0 / (1.0 + avg_gain / avg_loss)
+        return self.value
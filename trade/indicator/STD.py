@@ -0,0 +1,73 @@
+# -*- coding:utf-8 -*-
+
+"""
+Rolling standard deviation, updated incrementally in O(1) per bar.
+
+Sums are kept of deviations from a shifted reference (a value in the window), so that the variance doesn't cancel
+catastrophically at price level magnitudes, and are recomputed from the window every `period` updates (amortized O(1))
+so that rounding errors never accumulate.
+"""
+
+import math
+from collections import deque
+
+import numpy as np
+
+
+class STD:
+    """Rolling population standard deviation.
+
+    Attributes:
+        period: Window length.
+    """
+
+    def __init__(self, period):
+        self.period = period
+        self.value = None
+        self._values = deque(maxlen=period)
+        self._shift = 0.0  # Reference value, sums are of `value - shift`.
+        self._sum = 0.0
+        self._sum_sq = 0.0
+        self._updates = 0  # Updates since sums recomputed.
+
+    def update(self, value, replace=False):
+        if not self._values:
+            self._shift = value
+        delta = value - self._shift
+        if replace and self._values:
+            last = self._values[-1] - self._shift
+            self._sum += delta - last
+            self._sum_sq += delta * delta - last * last
+            self._values[-1] = value
+        else:
+            if len(self._values) == self.period:
+                oldest = self._values[0] - self._shift
+                self._sum -= oldest
+                self._sum_sq -= oldest * oldest
+            self._values.append(value)
+            self._sum += delta
+            self._sum_sq += delta * delta
+        self._updates += 1
+        if self._updates >= self.period:
+            self._resync()
+        n = len(self._values)
+        mean = self._sum / n
+        self.value = math.sqrt(max(self._sum_sq / n - mean * mean, 0.0))
+        return self.value
+
+    def _resync(self):
+        """Recompute sums from the window, shifted by the oldest value."""
+        self._updates = 0
+        shift = self._shift = self._values[0]
+        self._sum = math.fsum(v - shift for v in self._values)
+        self._sum_sq = math.fsum((v - shift) * (v - shift) for v in self._values)
+
+
+def std(values, period):
+    """Vectorized rolling population standard deviation, the first `period - 1` results are NaN."""
+    values = np.asarray(values, dtype=np.float64)
+    result = np.full(values.shape, np.nan)
+    if len(values) >= period:
+        windows = np.lib.stride_tricks.sliding_window_view(values, period)
+        result[period - 1:] = windows.std(axis=1)
+    return result
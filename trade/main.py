@@ -7,6 +7,7 @@ import argparse
 from aioquant import quant
 from aioquant.utils import logger
 from aioquant.configure import config
+from aioquant.tasks import SingleTask
 from aioquant.binance import Binance
 
 trader = None
@@ -41,7 +42,8 @@ def initialize():
     PriceWatcher()
     
 def close_connection():
-    trader._ws.stop()
+    trader.flush()  # The event loop is stopped right after this, save positions and orders synchronously.
+    SingleTask.run(trader.close)
 
 if __name__ == "__main__":
     args = parse_args()
@@ -10,6 +10,9 @@ from aioquant.const import BINANCE
 from aioquant.market import Kline
 from aioquant.market import Orderbook
 from aioquant.utils import tools
+from aioquant.utils.ringbuffer import KlineRingBuffer
+
+from indicator.MA import SMA
 
 import asyncio
 
@@ -17,19 +20,20 @@ from aioquant.utils.dingtalk import DingTalk
 
 class PriceWatcher:   
 
-    def __init__(self):
-        """ 初始化
+    def __init__(self, klines_len=60, count_down_time=300, watch_list=None):
+        """ 初始化，参数可由参数扫描(aioquant.sweep)传入
         """
         self.symbol = config.symbol
 
-        self.count_down_time = 300
+        self.count_down_time = count_down_time
         # last sent price count down time, only allow resend if not in map
         self.last_send = {}
-        self.klines_len = 60
-        self.klines = []
+        self.klines_len = klines_len
+        self.klines = KlineRingBuffer(self.klines_len)
+        self.ma = SMA(self.klines_len)
 
         # 监控价格列表
-        self.watch_list = [
+        self.watch_list = watch_list or [
             30000.0,
             29400.0,
             29380.0,
@@ -41,7 +45,7 @@ class PriceWatcher:
         ]
         
         # 订阅行情
-        Market(symbol=self.symbol, market_type=const.MARKET_TYPE_KLINE_1S, callback=self.on_kline_update)
+        Market(symbol=self.symbol, market_type=const.MARKET_TYPE_KLINE_1S, callback=self.on_kline_update, conflate=True)
 
     async def on_kline_update(self, kline: Kline):
         """ 订单薄更新
@@ -52,14 +56,10 @@ class PriceWatcher:
         self.update_count_down()
 
         # update kline history
-        if  len(self.klines) == self.klines_len:
-            self.klines.pop(0)
-        self.klines.append(kline)
+        new_bar = self.klines.update(kline)
 
         now_price = float(kline.open)
-        last_avarage_price = 0.0
-        for k in self.klines:
-            last_avarage_price += float(k.open) / len(self.klines)
+        last_avarage_price = self.ma.update(now_price, replace=not new_bar)
 
         break_throught = None
         price = None
@@ -86,9 +86,10 @@ class PriceWatcher:
             # await DingTalk.send_text_msg(message)
 
     def update_count_down(self):
-        for price, time in self.last_send.items():
-            if time == 1:
+        for price, time in list(self.last_send.items()):
+            if time <= 1:
                 self.last_send.pop(price)
-            self.last_send[price] = time - 1
+            else:
+                self.last_send[price] = time - 1
     def add_count_down(self, price):
         self.last_send[price] = self.count_down_time